@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Book, Author
+from .models import Book, Author, Job
 
 # Enregistrer les modèles pour qu'ils apparaissent dans l'interface d'administration
 admin.site.register(Book)
 admin.site.register(Author)
+admin.site.register(Job)
@@ -0,0 +1,304 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from functools import cached_property, lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Codes de langue Gutendex -> noms NLTK (stopwords et Snowball)
+LANGUAGE_NAMES = {
+    'en': 'english', 'fr': 'french', 'es': 'spanish', 'de': 'german',
+    'it': 'italian', 'pt': 'portuguese', 'nl': 'dutch', 'da': 'danish',
+    'fi': 'finnish', 'sv': 'swedish', 'no': 'norwegian', 'hu': 'hungarian',
+    'ru': 'russian', 'ro': 'romanian',
+}
+DEFAULT_LANGUAGE = 'en'
+
+# Taille des mémos (LRU) de chaque analyseur : les mots-clés des requêtes ne forment pas un vocabulaire borné
+ANALYZER_CACHE_SIZE = 200_000
+
+DEFAULTS = {
+    'UNICODE_FORM': 'NFKC',   # Normalisation Unicode appliquée avant la tokenisation (None pour désactiver)
+    'STRIP_ACCENTS': False,   # « élève » -> « eleve »
+    'STOPWORDS': True,
+    'STEMMING': True,
+    'MIN_LENGTH': 2,          # Les tokens plus courts sont ignorés
+}
+
+TOKEN_PATTERN = re.compile(r'\b\w+\b')
+
+# Options d'analyse et langues de l'index publié, écrites par index_books et relues par les requêtes
+INDEX_ANALYSIS_FILE = 'analysis.json'
+RELOAD_CHECK_INTERVAL = 5
+
+
+def canonical_term(term):
+    """
+    Forme canonique d'un terme de l'index (NFKC + casefold). Tous les termes sont stockés sous cette forme,
+    ce qui permet de les chercher par égalité stricte sur l'index unique de InvertedIndex.word.
+    """
+    return unicodedata.normalize('NFKC', term).casefold()
+
+
+# Listes de stopwords compilées une fois depuis NLTK (manage.py build_stopwords) et versionnées :
+# ni téléchargement ni chargement du corpus NLTK au démarrage.
+STOPWORDS_PATH = Path(__file__).resolve().parent / 'data' / 'stopwords.json'
+
+
+@lru_cache(maxsize=1)
+def load_stopwords_artifact():
+    try:
+        with open(STOPWORDS_PATH, encoding='utf-8') as artifact:
+            return {language: frozenset(words) for language, words in json.load(artifact).items()}
+    except FileNotFoundError:
+        return None
+
+
+@lru_cache(maxsize=len(LANGUAGE_NAMES) + 1)
+def load_stopwords(language):
+    """Stopwords d'une langue (ensemble vide si la langue est inconnue ou les listes indisponibles)."""
+    artifact = load_stopwords_artifact()
+    if artifact is not None:
+        return artifact.get(language, frozenset())
+
+    # Repli : corpus NLTK déjà présent sur la machine (jamais téléchargé ici)
+    name = LANGUAGE_NAMES.get(language)
+    if not name:
+        return frozenset()
+    try:
+        from nltk.corpus import stopwords
+        return frozenset(stopwords.words(name))
+    except (LookupError, OSError):
+        logger.warning("Stopwords indisponibles pour '%s' : lancer manage.py build_stopwords", language)
+        return frozenset()
+
+
+def load_stemmer(language):
+    name = LANGUAGE_NAMES.get(language)
+    if not name:
+        return None
+    from nltk.stem.snowball import SnowballStemmer
+    if name not in SnowballStemmer.languages:
+        return None
+    return SnowballStemmer(name)
+
+
+class Analyzer:
+    """
+    Chaîne d'analyse : tokeniseur -> normaliseur -> stopwords -> racinisation.
+    La même chaîne est appliquée aux livres (indexation) et aux mots-clés (recherche).
+    """
+
+    def __init__(self, languages, unicode_form, strip_accents, stopwords, stemming, min_length):
+        self.languages = languages
+        self.unicode_form = unicode_form
+        self.strip_accents = strip_accents
+        self.min_length = min_length
+        self.use_stopwords = stopwords
+        self.use_stemming = stemming
+        # Mémos par analyseur, bornés et sûrs entre threads (indexation parallèle)
+        self.stem = lru_cache(maxsize=ANALYZER_CACHE_SIZE)(self.stem)
+        self.index_terms = lru_cache(maxsize=ANALYZER_CACHE_SIZE)(self.index_terms)
+
+    # Stopwords et stemmer sont chargés au premier token analysé : normaliser un préfixe
+    # (autocomplétion) n'importe pas NLTK.
+    @cached_property
+    def stopwords(self):
+        if not self.use_stopwords:
+            return frozenset()
+        return frozenset().union(*(load_stopwords(language) for language in self.languages))
+
+    @cached_property
+    def stemmer(self):
+        # Racinisation avec la première langue du livre disposant d'un stemmer Snowball
+        if not self.use_stemming:
+            return None
+        return next(filter(None, (load_stemmer(language) for language in self.languages)), None)
+
+    def normalize(self, text):
+        if self.unicode_form:
+            text = unicodedata.normalize(self.unicode_form, text)
+        text = text.casefold()
+        if self.strip_accents:
+            text = ''.join(c for c in unicodedata.normalize('NFD', text) if not unicodedata.combining(c))
+        return text
+
+    def stem(self, token):
+        # Mémorisée (voir __init__) : évite de relancer Snowball sur chaque occurrence d'un token
+        return canonical_term(self.stemmer.stem(token) if self.stemmer else token)
+
+    def analyze_spans(self, text):
+        """
+        Retourne les triplets (terme indexé, forme de surface normalisée, position du caractère dans `text`).
+        Le texte est découpé avant normalisation, pour que les positions renvoient au texte brut (extraits).
+        """
+        if not text:
+            return []
+        spans = []
+        for match in TOKEN_PATTERN.finditer(text):
+            for term, token in self.index_terms(match.group(0)):
+                spans.append((term, token, match.start()))
+        return spans
+
+    def index_terms(self, raw_token):
+        """(terme, forme normalisée) d'un token brut, mémorisés comme les racines ; vide pour un stopword."""
+        # La normalisation (NFKC, casefold) peut découper un token brut en plusieurs
+        return tuple(
+            (self.stem(token), token) for token in TOKEN_PATTERN.findall(self.normalize(raw_token))
+            if len(token) >= self.min_length and token not in self.stopwords
+        )
+
+    def analyze_pairs(self, text):
+        """Retourne les couples (terme indexé, forme de surface normalisée) du texte, dans l'ordre."""
+        return [(term, surface) for term, surface, _ in self.analyze_spans(text)]
+
+    def analyze(self, text):
+        return [term for term, _ in self.analyze_pairs(text)]
+
+    def analyze_term(self, word):
+        """Terme indexé correspondant à un mot-clé (None si c'est un stopword ou un mot trop court)."""
+        terms = self.analyze(word)
+        return terms[0] if terms else None
+
+
+def analyzer_config(**overrides):
+    return {**DEFAULTS, **getattr(settings, 'BOOKS_ANALYZER', {}), **overrides}
+
+
+@lru_cache(maxsize=64)
+def get_analyzer(languages=(DEFAULT_LANGUAGE,), **overrides):
+    """Analyseur compilé une seule fois par combinaison de langues et d'options."""
+    config = analyzer_config(**overrides)
+    return Analyzer(
+        tuple(languages),
+        unicode_form=config['UNICODE_FORM'],
+        strip_accents=config['STRIP_ACCENTS'],
+        stopwords=config['STOPWORDS'],
+        stemming=config['STEMMING'],
+        min_length=config['MIN_LENGTH'],
+    )
+
+
+def book_languages(languages):
+    """Convertit le champ Book.languages ('en,fr') en tuple de codes normalisés."""
+    codes = (language.strip().lower() for language in (languages or '').split(','))
+    return tuple(dict.fromkeys(code for code in codes if code)) or (DEFAULT_LANGUAGE,)
+
+
+def write_index_analysis(overrides, language_counts, base_dir=None):
+    """
+    Enregistre avec l'index les options d'analyse effectives (index_books --no-stemming, BOOKS_ANALYZER)
+    et ses langues, de la plus fréquente à la plus rare : les requêtes sont analysées de la même façon.
+    """
+    path = os.path.join(base_dir or settings.BOOKS_INDEX_DIR, INDEX_ANALYSIS_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    analysis = {
+        'options': analyzer_config(**overrides),
+        'languages': [language for language, _ in language_counts.most_common()],
+    }
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as output:
+        json.dump(analysis, output)
+    os.replace(f'{path}.tmp', path)
+
+
+class IndexAnalysisLoader:
+    """Options d'analyse de l'index publié, rechargées quand index_books en écrit de nouvelles."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.analysis = {}
+        self.mtime = None
+        self.checked_at = None
+
+    def get(self):
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < RELOAD_CHECK_INTERVAL:
+            return self.analysis
+        with self.lock:
+            self.checked_at = now
+            path = os.path.join(settings.BOOKS_INDEX_DIR, INDEX_ANALYSIS_FILE)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                if mtime != self.mtime:
+                    with open(path, encoding='utf-8') as source:
+                        self.analysis = json.load(source)
+                    self.mtime = mtime
+            except FileNotFoundError:
+                # Index construit avant l'enregistrement des options : réglages courants
+                self.analysis, self.mtime = {}, None
+            return self.analysis
+
+    def invalidate(self):
+        """Relire le fichier au prochain accès (options écrites par le processus courant)."""
+        self.checked_at = None
+
+
+index_analysis = IndexAnalysisLoader()
+
+
+def index_options():
+    """Options d'analyse avec lesquelles l'index publié a été construit."""
+    return index_analysis.get().get('options', {})
+
+
+def corpus_languages():
+    """Langues des livres de l'index publié, de la plus fréquente à la moins fréquente."""
+    languages = [language for language in index_analysis.get().get('languages') or () if language in LANGUAGE_NAMES]
+    return languages or [DEFAULT_LANGUAGE]
+
+
+def query_analyzer(language=None):
+    """Analyseur des mots-clés : options de l'index, langue demandée ou, à défaut, langue principale du corpus."""
+    return get_analyzer((language or corpus_languages()[0],), **index_options())
+
+
+def indexed_frequencies(terms):
+    """{terme: nombre de livres} d'après le segment publié, ou les occurrences en base sans segment."""
+    from .segments import segment_loader
+
+    segment = segment_loader.get()
+    if segment is not None:
+        return {term: len(postings) for term in terms if (postings := segment.postings(term)) is not None}
+    from .models import InvertedIndex
+    return dict(InvertedIndex.objects.filter(word__in=terms).values_list('word', 'occurrences'))
+
+
+def analyze_query(word, language=None):
+    """
+    Terme à chercher dans l'index pour un mot-clé saisi par l'utilisateur. Sans langue demandée, chaque livre
+    ayant été racinisé dans sa propre langue, le mot est analysé dans chaque langue du corpus et la racine
+    la plus présente dans l'index est retenue (« maisons » trouve les livres français d'un corpus anglais).
+    Un stopword ou un mot trop court dans la langue principale reste ignoré.
+    """
+    if language is not None:
+        return query_analyzer(language).analyze_term(word)
+    main, *others = corpus_languages()
+    term = query_analyzer(main).analyze_term(word)
+    if term is None or not others:
+        return term
+    candidates = list(dict.fromkeys([term] + [query_analyzer(other).analyze_term(word) for other in others]))
+    candidates = [candidate for candidate in candidates if candidate is not None]
+    if len(candidates) == 1:
+        return term
+    frequencies = indexed_frequencies(candidates)
+    # À égalité (aucun livre), la racine de la langue principale
+    return max(candidates, key=lambda candidate: frequencies.get(candidate, 0))
+
+
+def request_language(params):
+    """
+    Langue des mots-clés (?lang=fr), None pour la langue principale du corpus.
+    Seules les langues connues sont acceptées (400 sinon) : stopwords et analyseurs sont mémorisés par langue.
+    """
+    language = str(params.get('lang') or '').strip().lower() or None
+    if language is not None and language not in LANGUAGE_NAMES:
+        raise ValidationError({'error': f"Langue inconnue : {language} (langues disponibles : {', '.join(LANGUAGE_NAMES)})."})
+    return language
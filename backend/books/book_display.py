@@ -1,4 +1,10 @@
 import re
+import uuid
+import zlib
+from django.db import connections, router
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from django.utils.text import slugify
 from rest_framework import generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -9,6 +15,7 @@ from .models import Book, Author, InvertedIndex
 from .serializers import BookSerializer
 from collections import defaultdict
 from django.core.cache import cache
+from .instrumentation import record_cache
 
 # ✅ Liste des livres
 class BookPagination(PageNumberPagination):
@@ -66,7 +73,8 @@ class BookTextView(APIView):
             # Vérifier si le texte du livre est en cache
             cache_key = f'book_text_{book_id}'
             cached_text = cache.get(cache_key)
-            
+            record_cache('book_text', cached_text is not None)
+
             if cached_text is None:
                 book = Book.objects.get(id=book_id)
                 if not book.text:
@@ -175,4 +183,148 @@ class BookTextHighlightView(APIView):
                 result.append(f"<mark>{word}</mark>")
             else:
                 result.append(word)
-        return ' '.join(result)
\ No newline at end of file
+        return ' '.join(result)
+
+
+# ✅ Téléchargement du texte complet (flux par morceaux, Range, gzip)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # Octets par morceau envoyé
+DOWNLOAD_FETCH_ROWS = 8          # Morceaux lus par aller-retour sur le curseur serveur
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Le texte est converti une seule fois (sous-requête non aplatie grâce à OFFSET 0) puis découpé par
+# generate_series : relire convert_to(text) pour chaque morceau rendait le téléchargement quadratique.
+TEXT_CHUNKS_SQL = """
+    SELECT substring(source.data FROM position + 1 FOR LEAST(%(size)s, %(end)s - position + 1))
+    FROM (SELECT convert_to(text, 'UTF8') AS data FROM books_book WHERE id = %(book)s OFFSET 0) AS source,
+         LATERAL generate_series(%(start)s, LEAST(%(end)s, octet_length(source.data) - 1), %(size)s) AS position
+"""
+
+
+def parse_range(header, length):
+    """
+    (début, fin incluse) d'une plage d'octets unique, None si l'en-tête est absent ou ignoré
+    (plusieurs plages, syntaxe inconnue : le texte entier est envoyé), ou 'unsatisfiable'.
+    """
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # « bytes=-N » : les N derniers octets
+        suffix = int(last)
+        if suffix == 0:
+            return 'unsatisfiable'
+        return max(length - suffix, 0), length - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None  # Plage invalide : ignorée
+    if start >= length:
+        return 'unsatisfiable'
+    return start, min(int(last), length - 1) if last else length - 1
+
+
+def read_text_bytes(book_id, start, end, using):
+    """
+    Octets [start, end] du texte (UTF-8), lus par morceaux sur un curseur serveur : une seule requête,
+    et la mémoire du worker ne dépend pas de la taille du livre.
+    """
+    connection = connections[using]
+    connection.ensure_connection()
+    # WITH HOLD : le curseur survit à la fin de la transaction implicite (autocommit) pendant l'envoi
+    cursor = connection.connection.cursor(name=f'book_text_{uuid.uuid4().hex}', withhold=True)
+    cursor.itersize = DOWNLOAD_FETCH_ROWS
+    try:
+        cursor.execute(TEXT_CHUNKS_SQL, {'book': book_id, 'start': start, 'end': end, 'size': DOWNLOAD_CHUNK_SIZE})
+        for chunk, in cursor:
+            yield bytes(chunk)
+    finally:
+        cursor.close()
+
+
+def accepts_gzip(header):
+    """Vrai si Accept-Encoding autorise gzip (« gzip;q=0 » le refuse, « * » l'accepte par défaut)."""
+    weights = {}
+    for part in (header or '').split(','):
+        coding, _, parameters = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        match = re.search(r'q\s*=\s*([0-9.]+)', parameters)
+        try:
+            weights[coding] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            weights[coding] = 0.0
+    return weights.get('gzip', weights.get('x-gzip', weights.get('*', 0.0))) > 0
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # En-tête et somme de contrôle gzip
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class BookTextDownloadView(APIView):
+    """
+    Texte brut complet d'un livre, envoyé en flux. Accepte une plage d'octets (Range / If-Range) pour
+    reprendre un téléchargement interrompu ; compressé en gzip si le client l'accepte (réponse entière seulement).
+    """
+
+    def get(self, request, book_id):
+        using = router.db_for_read(Book)
+        with connections[using].cursor() as cursor:
+            # md5 (calculé à l'import) sert d'ETag : une reprise (If-Range) sur un texte modifié repart du début
+            cursor.execute(
+                "SELECT title, octet_length(text), COALESCE(text_md5, md5(text)) FROM books_book WHERE id = %s",
+                [book_id],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return Response({'error': 'Livre introuvable.'}, status=status.HTTP_404_NOT_FOUND)
+        title, length, digest = row
+        if not length:
+            return Response({'error': 'Texte non disponible.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        etag = f'"{digest}"'
+        headers = {
+            'Accept-Ranges': 'bytes',
+            'ETag': etag,
+            'Vary': 'Accept-Encoding',
+            'Content-Disposition': content_disposition_header(False, f"{slugify(title) or book_id}.txt"),
+        }
+        content_type = 'text/plain; charset=utf-8'
+
+        if request.headers.get('If-None-Match') == etag:
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        byte_range = None
+        if_range = request.headers.get('If-Range')
+        if if_range is None or if_range == etag:
+            byte_range = parse_range(request.headers.get('Range'), length)
+        if byte_range == 'unsatisfiable':
+            return HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers={
+                **headers, 'Content-Range': f'bytes */{length}',
+            })
+
+        if byte_range is not None:
+            start, end = byte_range
+            headers['Content-Range'] = f'bytes {start}-{end}/{length}'
+            headers['Content-Length'] = str(end - start + 1)
+            response_status = status.HTTP_206_PARTIAL_CONTENT
+            chunks = read_text_bytes(book_id, start, end, using)
+        elif accepts_gzip(request.headers.get('Accept-Encoding')):
+            # Taille compressée inconnue à l'avance : réponse sans Content-Length
+            headers['Content-Encoding'] = 'gzip'
+            response_status = status.HTTP_200_OK
+            chunks = gzip_stream(read_text_bytes(book_id, 0, length - 1, using))
+        else:
+            headers['Content-Length'] = str(length)
+            response_status = status.HTTP_200_OK
+            chunks = read_text_bytes(book_id, 0, length - 1, using)
+
+        if request.method == 'HEAD':
+            chunks.close()
+            return HttpResponse(status=response_status, headers=headers, content_type=content_type)
+        return StreamingHttpResponse(chunks, status=response_status, headers=headers, content_type=content_type)
@@ -1,16 +1,50 @@
+import json
+import logging
 import re
 from rest_framework import generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Q, Count
+from django.db.models import Q, Count, TextField
+from django.db.models.functions import Cast
+from .instrumentation import metrics, timing_span
 from .models import Book, InvertedIndex
+from .query_cache import query_cache, normalize_methods
+from .analysis import TOKEN_PATTERN, analyze_query, query_analyzer, request_language
+from .term_dictionary import term_dictionary
+from .lazy import lazy_import
+from .segments import segment_loader
+from .facets import FACETS, facet_index
+from .shards import ShardUnavailable, shard_coordinator
+from .snippets import best_positions, build_snippets
+from .query_planner import QueryRejected, confirm_in_chunks, plan_regex
+from . import topk
+from .proximity import closeness_score, decode_positions, minimal_window, top_k, window_score
 from .serializers import BookSerializer
-from Levenshtein import distance as levenshtein_distance
 from collections import defaultdict
 from rest_framework.pagination import PageNumberPagination
 from django.core.paginator import Paginator
-from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Importés au premier usage plutôt qu'au démarrage de chaque worker
+Levenshtein = lazy_import('Levenshtein')
+np = lazy_import('numpy')
+
+
+def get_index_entry(term):
+    """Récupère une entrée de l'index inversé en séparant la requête SQL du décodage JSON des positions."""
+    with timing_span('index_lookup'):
+        index_entry = (
+            InvertedIndex.objects.for_term(term)
+            .defer('positions')
+            .annotate(raw_positions=Cast('positions', output_field=TextField()))
+            .first()
+        )
+    if index_entry is not None:
+        with timing_span('positions_decode'):
+            index_entry.positions = json.loads(index_entry.raw_positions)
+    return index_entry
 
 
 # ✅ Recherche avancée avec RegEx (optimisée avec indexation inversée)
@@ -25,64 +59,66 @@ class AdvancedBookSearchView(APIView):
         except re.error:
             return Response({'error': 'Expression régulière invalide.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Extraire les mots de l'expression régulière
-        words = re.findall(r'\w+', regex_pattern)
+        # Coût estimé avant toute exécution : les motifs trop coûteux sont refusés ou dégradés
+        language = request_language(request.GET)
+        try:
+            with timing_span('query_plan'):
+                plan = plan_regex(regex_pattern, language)
+        except QueryRejected as rejection:
+            return Response({'error': str(rejection)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Les résultats partiels (budget de temps épuisé) ne sont pas mis en cache
+        result = query_cache.get_or_compute(
+            'advanced', lambda: self.perform_search(regex_pattern, plan),
+            cache_if=lambda result: not result['partial'], pattern=regex_pattern, language=language,
+        )
+
+        if not result['books'] and not result['partial']:
+            return Response({'message': f'Aucun livre trouvé pour "{regex_pattern}".'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Si un seul mot est recherché, utiliser l'index inversé
-        if len(words) == 1:
-            word = words[0].lower()
-            # Recherche directe dans la colonne 'word' de l'index inversé
-            index_entry = InvertedIndex.objects.filter(word__iexact=word).first()
-
-            if index_entry:
-                books = []
-                # Ajouter les livres associés à ce mot
-                for position in index_entry.positions:
-                    book_id = position.get("book")
-                    if book_id:
-                        book = Book.objects.select_related('author').filter(id=book_id).first()
-                        if book:
-                            # Récupérer les données du livre
-                            book_data = BookSerializer(book).data
-                            # Ajouter le livre à la liste
-                            books.append(book_data)
-
-                if not books:
-                    return Response({'message': f'Aucun livre trouvé pour "{regex_pattern}".'}, status=status.HTTP_404_NOT_FOUND)
-
-                return Response({'books': books}, status=status.HTTP_200_OK)
+        return Response({**result, 'plan': plan.as_dict()}, status=status.HTTP_200_OK)
 
-            else:
-                return Response({'message': f'Aucun livre trouvé pour "{regex_pattern}".'}, status=status.HTTP_404_NOT_FOUND)
-
-        # Si plusieurs mots sont recherchés, utiliser l'index inversé pour pré-filtrer
-        matching_books = set()
-        for word in words:
-            index_entry = InvertedIndex.objects.filter(word__iexact=word).first()
-            if index_entry:
-                for position in index_entry.positions:
-                    book_id = position.get("book")
-                    if book_id:
-                        matching_books.add(book_id)
-
-        if not matching_books:
-            return Response({'message': f'Aucun livre trouvé pour "{regex_pattern}".'}, status=status.HTTP_404_NOT_FOUND)
+    def candidate_books(self, plan):
+        """Ids des livres contenant les mots obligatoires (ET entre clauses, OU dans une clause), sans lire les positions."""
+        relations = InvertedIndex.books.through.objects
+        candidates = None
+        with timing_span('index_lookup'):
+            for clause in plan.terms:
+                books = set(relations.filter(invertedindex__word__in=clause).values_list('book_id', flat=True))
+                candidates = books if candidates is None else candidates & books
+        return candidates
+
+    def perform_search(self, regex_pattern, plan):
+        candidates = self.candidate_books(plan) if plan.terms else None
+
+        # Mot seul : l'index suffit
+        if plan.mode == 'index':
+            with timing_span('book_fetch'):
+                books = Book.objects.select_related('author').filter(id__in=candidates)
+                return {'books': [BookSerializer(book).data for book in books], 'partial': False}
+
+        if candidates is not None and not candidates:
+            return {'books': [], 'partial': False}
+
+        book_ids = Book.objects.all() if candidates is None else Book.objects.filter(id__in=candidates)
+        if plan.mode == 'downgraded':
+            # Seuls les candidats les plus téléchargés sont confirmés dans le budget
+            book_ids = book_ids.order_by('-download_count')[:plan.limit]
+        book_ids = list(book_ids.values_list('id', flat=True))
 
         insensitive_regex = f"(?i){regex_pattern}"
-        books = Book.objects.filter(
-            id__in=matching_books
-        ).filter(
+        queryset = Book.objects.filter(
             Q(text__regex=insensitive_regex) | Q(summary__regex=insensitive_regex)
         ).values('id', 'title', 'languages', 'summary', 'author__name')
 
-        if not books:
-            return Response({'message': f'Aucun livre trouvé pour "{regex_pattern}".'}, status=status.HTTP_404_NOT_FOUND)
-
-        return Response({'books': list(books)}, status=status.HTTP_200_OK)
+        with timing_span('regex_confirm'):
+            books, partial = confirm_in_chunks(queryset, book_ids)
+        return {'books': books, 'partial': partial or plan.mode == 'downgraded'}
 
 class InvertedIndexSearchView(APIView):
     def get(self, request, word, search_method):
         word = word.lower().strip()
+        language = request_language(request.query_params)
         page = int(request.query_params.get('page', 1))
         page_size = int(request.query_params.get('page_size', 10))
 
@@ -90,13 +126,13 @@ class InvertedIndexSearchView(APIView):
             return Response({'error': 'Veuillez fournir un mot-clé.'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            full_results_cache_key = f'search_full_{word}_{search_method}'
-            full_results = cache.get(full_results_cache_key)
-            
-            if full_results is None:
-                full_results = self.perform_search(word, search_method)
-                cache.set(full_results_cache_key, full_results, timeout=1800)
-            
+            # 'title+text' et 'text+title' partagent la même entrée de cache
+            search_method = normalize_methods(search_method)
+            full_results = query_cache.get_or_compute(
+                'search', lambda: self.perform_search(word, search_method, language),
+                word=word, search_method=search_method, language=language,
+            )
+
             paginator = Paginator(full_results['books'], page_size)
             try:
                 paginated_books = paginator.page(page)
@@ -108,17 +144,39 @@ class InvertedIndexSearchView(APIView):
                 'search_methods': full_results['search_methods'],
                 'total_books': len(full_results['books']),
                 'total_occurrences': full_results['total_occurrences'],
-                'books': paginated_books.object_list
+                'books': self.add_snippets(paginated_books.object_list, full_results)
             }
 
             return Response(response_data, status=status.HTTP_200_OK)
 
-        except Exception as e:
-            print(f"❌ Erreur lors de la recherche pour '{word}': {str(e)}")
+        except Exception:
+            logger.exception("Erreur lors de la recherche pour '%s'", word)
             return Response({'error': 'Erreur interne du serveur.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def perform_search(self, word, search_method):
-        index_entry = InvertedIndex.objects.filter(word__iexact=word).first()
+    def add_snippets(self, books_data, full_results):
+        """Extraits KWIC des livres de la page seulement, mis en cache par (livre, terme)."""
+        snippet_positions = full_results.get('snippet_positions', {})
+        book_ids = [book_data['id'] for book_data in books_data if snippet_positions.get(book_data['id'])]
+        books = Book.objects.only('id', 'languages', 'text_offsets').in_bulk(book_ids) if book_ids else {}
+
+        page = []
+        for book_data in books_data:
+            book = books.get(book_data['id'])
+            snippets = []
+            if book is not None:
+                with timing_span('snippets'):
+                    snippets = query_cache.get_or_compute(
+                        'snippets', lambda book=book: build_snippets(book, full_results['term'], snippet_positions[book.id]),
+                        book=book.id, term=full_results['term'],
+                    )
+            # Copie : les résultats mis en cache ne doivent pas être modifiés
+            page.append({**book_data, 'snippets': snippets})
+        return page
+
+    def perform_search(self, word, search_method, language=None):
+        # Le mot-clé passe par la même chaîne d'analyse que les livres indexés
+        term = analyze_query(word, language)
+        index_entry = get_index_entry(term) if term else None
 
         if not index_entry:
             return {
@@ -128,6 +186,7 @@ class InvertedIndexSearchView(APIView):
             }
 
         books = []
+        snippet_positions = {}  # book_id -> positions des occurrences autour desquelles découper les extraits
         occurrences_by_field = {
             'title': 0,
             'author': 0,
@@ -136,8 +195,15 @@ class InvertedIndexSearchView(APIView):
         }
         
         def highlight_text(text, word):
+            # Surligner toutes les variantes du mot (« run », « runs », « running ») ayant la même racine
+            def mark(match):
+                if analyzer.analyze_term(match.group(0)) == term:
+                    return f'<mark>{match.group(0)}</mark>'
+                return match.group(0)
+
             if isinstance(text, str):
-                highlighted_text = re.sub(rf'\b({re.escape(word)})\b', r'<mark>\1</mark>', text, flags=re.IGNORECASE)
+                with timing_span('highlight'):
+                    highlighted_text = TOKEN_PATTERN.sub(mark, text)
                 return highlighted_text
             return text
 
@@ -160,11 +226,14 @@ class InvertedIndexSearchView(APIView):
             book_id = position.get("book")
             
             if book_id:
-                book = Book.objects.select_related('author').filter(id=book_id).first()
+                with timing_span('book_fetch'):
+                    # Le texte n'est plus lu ici : sa présence et les extraits viennent des positions indexées
+                    book = Book.objects.select_related('author').defer('text', 'text_offsets').filter(id=book_id).first()
 
                 if book:
                     found_in_requested_fields = False
-                    book_data = BookSerializer(book).data
+                    with timing_span('serialize'):
+                        book_data = BookSerializer(book).data
                     book_occurrences = 0
 
                     # Calculer les occurrences pour chaque champ demandé
@@ -185,10 +254,12 @@ class InvertedIndexSearchView(APIView):
                                 book_data[field] = highlight_text(book_data[field], word)
 
                     text_exists = False
-                    if 'text' in fields_to_search and hasattr(book, 'text') and isinstance(book.text, str):
-                        if word in book.text.lower():
-                            text_exists = True
+                    if 'text' in fields_to_search:
+                        text_positions = decode_positions(position["positions"].get('text', []))
+                        text_exists = len(text_positions) > 0
+                        if text_exists:
                             found_in_requested_fields = True
+                            snippet_positions[book_id] = best_positions(text_positions)
 
                     book_data['word_found_in_text'] = text_exists
                     book_data['occurrences'] = book_occurrences
@@ -202,7 +273,9 @@ class InvertedIndexSearchView(APIView):
         return {
             'books': books,
             'search_methods': search_methods,
-            'total_occurrences': total_occurrences
+            'total_occurrences': total_occurrences,
+            'term': term,
+            'snippet_positions': snippet_positions,
         }   
     
      
@@ -224,57 +297,73 @@ class InvertedIndexSuggectionsView(APIView):
         similarity_threshold = 0.87  # Modifier cette valeur pour ajuster la similarité acceptée
 
         try:
-            # Étape 1 : Récupérer tous les mots de l'index inversé
-            all_index_words = InvertedIndex.objects.values_list('word', flat=True)
+            suggestions, found = query_cache.get_or_compute(
+                'suggestions', lambda: self.find_suggestions(word, similarity_threshold), word=word,
+            )
 
-            # Étape 2 : Trouver les mots similaires avec Levenshtein
-            similar_words = []
-            for index_word in all_index_words:
-                lev_sim = 1 - (levenshtein_distance(word, index_word) / max(len(word), len(index_word)))
-                if lev_sim >= similarity_threshold:  # Seulement les mots ayant une bonne similarité
-                    similar_words.append((index_word, lev_sim))
+            if not found:
+                return Response({
+                    'message': f'Aucun mot trouvé pour "{word}".',
+                    'suggestions': suggestions  # ✅ Format JSON sans livres
+                }, status=status.HTTP_404_NOT_FOUND)
 
-            # Trier les suggestions par similarité décroissante
-            similar_words = sorted(similar_words, key=lambda x: x[1], reverse=True)
+            return Response({
+                'word': word,
+                'suggestions': suggestions
+            }, status=status.HTTP_200_OK)
 
-            # Limiter le nombre de suggestions à 3
-            similar_words = similar_words[:4]
+        except Exception:
+            logger.exception("Erreur lors de la recherche de suggestions pour '%s'", word)
+            return Response({'error': 'Erreur interne du serveur.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            suggestions = [word for word, _ in similar_words]
+    def find_suggestions(self, word, similarity_threshold):
+        """Retourne les suggestions avec leurs occurrences et indique si elles existent dans l'index."""
+        # Étape 1 : Pré-filtrer les mots de l'index par similarité de trigrammes (index GIN pg_trgm)
+        # plutôt que de parcourir tout le vocabulaire. Avec un seuil Levenshtein de 0.87, les candidats
+        # ont au plus une ou deux modifications et dépassent largement le seuil pg_trgm par défaut (0.3).
+        all_index_words = InvertedIndex.objects.filter(surface__trigram_similar=word).values_list('surface', 'word')
 
-            # Filtrer le mot exact pour éviter de l'afficher dans les suggestions
-            suggestions = [sug for sug in suggestions if sug != word]
+        # Étape 2 : Trouver les mots similaires avec Levenshtein, en comparant les formes de surface
+        similar_words = []
+        terms = {}
+        for surface, term in all_index_words:
+            index_word = surface or term
+            lev_sim = 1 - (Levenshtein.distance(word, index_word) / max(len(word), len(index_word)))
+            if lev_sim >= similarity_threshold:  # Seulement les mots ayant une bonne similarité
+                similar_words.append((index_word, lev_sim))
+                terms[index_word] = term
 
-            # Étape 3 : Filtrer les entrées qui correspondent aux mots similaires
-            index_entries = InvertedIndex.objects.filter(word__in=suggestions)
+        # Trier les suggestions par similarité décroissante
+        similar_words = sorted(similar_words, key=lambda x: x[1], reverse=True)
 
-            if not index_entries.exists():
-                return Response({
-                    'message': f'Aucun mot trouvé pour "{word}".',
-                    'suggestions': [{'word': suggestion, 'occurrences': 0} for suggestion in suggestions]  # ✅ Format JSON sans livres
-                }, status=status.HTTP_404_NOT_FOUND)
+        # Limiter le nombre de suggestions à 3
+        similar_words = similar_words[:4]
 
-            words_occurrences = defaultdict(int)
+        suggestions = [word for word, _ in similar_words]
 
-            for entry in index_entries:
-                for position_entry in entry.positions:
-                    occurrences = position_entry.get("occurrences", 0)
-                    words_occurrences[entry.word] += occurrences
+        # Filtrer le mot exact pour éviter de l'afficher dans les suggestions
+        suggestions = [sug for sug in suggestions if sug != word]
 
-            # Créer la réponse avec les mots et le nombre total d'occurrences
-            suggestions_with_occurrences = [{
-                'word': suggestion,
-                'occurrences': words_occurrences.get(suggestion, 0)
-            } for suggestion in suggestions]
+        # Étape 3 : Filtrer les entrées qui correspondent aux mots similaires
+        index_entries = InvertedIndex.objects.for_terms(terms[suggestion] for suggestion in suggestions)
 
-            return Response({
-                'word': word,
-                'suggestions': suggestions_with_occurrences
-            }, status=status.HTTP_200_OK)
+        if not index_entries.exists():
+            return [{'word': suggestion, 'occurrences': 0} for suggestion in suggestions], False
 
-        except Exception as e:
-            print(f"❌ Erreur lors de la recherche pour '{word}': {str(e)}")
-            return Response({'error': 'Erreur interne du serveur.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        words_occurrences = defaultdict(int)
+
+        for entry in index_entries:
+            for position_entry in entry.positions:
+                occurrences = position_entry.get("occurrences", 0)
+                words_occurrences[entry.surface or entry.word] += occurrences
+
+        # Créer la réponse avec les mots et le nombre total d'occurrences
+        suggestions_with_occurrences = [{
+            'word': suggestion,
+            'occurrences': words_occurrences.get(suggestion, 0)
+        } for suggestion in suggestions]
+
+        return suggestions_with_occurrences, True
 
 class RankedBookSearchView(APIView):
     def get(self, request):
@@ -282,73 +371,483 @@ class RankedBookSearchView(APIView):
         if not word:
             return Response({'error': 'Veuillez fournir un mot-clé.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            index_entry = InvertedIndex.objects.get(word=word)
-            book_ids = [position_entry.get("book") for position_entry in index_entry.positions if position_entry.get("book")]
-            
-            if not book_ids:
-                return Response({'message': f'Aucun livre trouvé pour "{word}".'}, status=status.HTTP_404_NOT_FOUND)
-            
-            # Récupération des livres en une seule requête
-            books = Book.objects.select_related('author').filter(id__in=book_ids)
-            
-            # Création de la liste des livres avec occurrences
-            books_data = []
-            for book in books:
-                occurrences = next((entry.get("occurrences", 0) for entry in index_entry.positions if entry.get("book") == book.id), 0)
-                book_data = BookSerializer(book).data
-                book_data['occurrences'] = occurrences
-                books_data.append(book_data)
+        # Par défaut, les éditions quasi identiques (duplicate_of) sont regroupées sous leur livre canonique
+        collapse = request.GET.get('collapse', '1').lower() not in ('0', 'false', 'no')
 
-            # Tri des livres par nombre d'occurrences
-            books_data = sorted(books_data, key=lambda x: x['occurrences'], reverse=True)
-            
-            return Response({'books': books_data})
+        language = request_language(request.GET)
+        books_data = query_cache.get_or_compute(
+            'ranked', lambda: self.perform_search(word, language), word=word, language=language,
+        )
+        if collapse:
+            books_data = self.collapse_editions(books_data)
 
-        except InvertedIndex.DoesNotExist:
+        if not books_data:
             return Response({'message': f'Aucun livre trouvé pour "{word}".'}, status=status.HTTP_404_NOT_FOUND)
 
+        return Response({'books': books_data})
+
+    def collapse_editions(self, books_data):
+        """Retire les éditions dont le livre canonique est déjà dans les résultats et les liste sous celui-ci."""
+        result_ids = {book_data['id'] for book_data in books_data}
+        editions = defaultdict(list)
+        for book_data in books_data:
+            if book_data.get('duplicate_of') in result_ids:
+                editions[book_data['duplicate_of']].append(book_data['id'])
+        return [
+            {**book_data, 'editions': editions.get(book_data['id'], [])}
+            for book_data in books_data if book_data.get('duplicate_of') not in result_ids
+        ]
+
+    def perform_search(self, word, language=None):
+        term = analyze_query(word, language)
+        if not term:
+            return []
+
+        if shard_coordinator.available():
+            try:
+                with timing_span('shards'):
+                    # Classement par occurrences : les shards ne calculent pas de score tf-idf
+                    occurrences_by_book = shard_coordinator.occurrences(term)
+                return self.serialize_books(occurrences_by_book)
+            except ShardUnavailable:
+                logger.warning("Shards indisponibles, repli sur l'index non partitionné", exc_info=True)
+
+        segment = segment_loader.get()
+        with timing_span('index_lookup'):
+            if segment is not None:
+                # Segment mappé en mémoire : pas de décodage JSON
+                postings = segment.postings(term)
+                if postings is None:
+                    return []
+                occurrences_by_book = dict(zip(postings.book_ids.tolist(), postings.occurrences_per_book().tolist()))
+            else:
+                index_entry = InvertedIndex.objects.for_term(term).first()
+                if index_entry is None:
+                    return []
+                occurrences_by_book = {
+                    entry['book']: entry.get('occurrences', 0) for entry in index_entry.positions if entry.get('book')
+                }
+        return self.serialize_books(occurrences_by_book)
+
+    def serialize_books(self, occurrences_by_book):
+        # Récupération des livres en une seule requête
+        books = Book.objects.select_related('author').filter(id__in=occurrences_by_book)
+
+        # Création de la liste des livres avec occurrences
+        books_data = []
+        for book in books:
+            occurrences = occurrences_by_book[book.id]
+            with timing_span('serialize'):
+                book_data = BookSerializer(book).data
+            book_data['occurrences'] = occurrences
+            book_data['duplicate_of'] = book.duplicate_of_id
+            books_data.append(book_data)
+
+        # Tri des livres par nombre d'occurrences
+        return sorted(books_data, key=lambda x: x['occurrences'], reverse=True)
+
 class ClosenessBookSearchView(APIView):
+    max_page_size = 100
+
     def get(self, request):
-        word = request.GET.get('word', '').lower()
+        # La fenêtre de proximité ne dépend pas de l'ordre des termes
+        query = request.GET.get('word', '').lower()
+        language = request_language(request.GET)
+        words = sorted({term for term in (analyze_query(word, language) for word in query.split()) if term})
 
-        if not word:
+        if not words:
             return Response({'error': 'Veuillez fournir un mot-clé.'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            index_entry = InvertedIndex.objects.get(word=word)
-            books_with_distances = []
-
-            for position_entry in index_entry.positions:
-                book_id = position_entry.get("book")
-                positions = position_entry.get("positions", {}).get("text", [])  # S'assurer que les positions existent dans le bon format
-
-                if book_id and len(positions) > 1:  # Vérifier qu'il y a plus d'une position
-                    book = Book.objects.select_related('author').filter(id=book_id).first()
-                    if book:
-                        avg_distance = self.calculate_avg_distance(positions)
-                        closeness_score = 1 / avg_distance if avg_distance > 0 else 0
-                        books_with_distances.append({
-                            'id': book.id,
-                            'title': book.title,
-                            'languages': book.languages,
-                            'summary': book.summary,
-                            'author': book.author.name,
-                            'closeness_score': closeness_score
-                        })
-
-            books_with_distances.sort(key=lambda x: x['closeness_score'], reverse=True)
-
-            if not books_with_distances:
-                return Response({'message': f'Aucun livre trouvé pour "{word}".'}, status=status.HTTP_404_NOT_FOUND)
-
-            return Response({'books': books_with_distances, 'total_books': len(books_with_distances)})
-
-        except InvertedIndex.DoesNotExist:
-            return Response({'message': f'Aucun livre trouvé pour "{word}".'}, status=status.HTTP_404_NOT_FOUND)
+            page = int(request.GET.get('page', 1))
+            page_size = min(int(request.GET.get('page_size', 10)), self.max_page_size)
+        except ValueError:
+            return Response({'error': 'Paramètres invalides.'}, status=status.HTTP_400_BAD_REQUEST)
+        if page < 1 or page_size < 1:
+            return Response({'error': 'Page invalide.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Les scores de tous les candidats sont mis en cache ; seul le top-k de la page est trié
+        candidates = query_cache.get_or_compute('closeness', lambda: self.score_books(words), words=words)
+
+        if not candidates['book_ids']:
+            return Response({'message': f'Aucun livre trouvé pour "{query}".'}, status=status.HTTP_404_NOT_FOUND)
+
+        with timing_span('top_k'):
+            ranked = top_k(candidates['book_ids'], candidates['scores'], page * page_size)
+        page_items = ranked[(page - 1) * page_size:]
+        if not page_items:
+            return Response({'error': 'Page invalide.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Une seule requête pour les livres de la page
+        with timing_span('book_fetch'):
+            books = Book.objects.select_related('author').in_bulk([book_id for book_id, _ in page_items])
+
+        books_with_distances = [{
+            'id': book.id,
+            'title': book.title,
+            'languages': book.languages,
+            'summary': book.summary,
+            'author': book.author.name if book.author else None,
+            'closeness_score': score
+        } for book, score in ((books.get(book_id), score) for book_id, score in page_items) if book]
+
+        return Response({
+            'books': books_with_distances,
+            'total_books': len(candidates['book_ids']),
+            'page': page,
+        })
+
+    def score_books(self, words):
+        """Calcule le score de proximité de chaque livre candidat (sans requête par livre)."""
+        segment = segment_loader.get()
+        if segment is not None:
+            return self.score_books_from_segment(segment, words)
+
+        with timing_span('index_lookup'):
+            entries = {entry.word: entry for entry in InvertedIndex.objects.for_terms(words)}
+
+        if len(words) == 1:
+            # Un seul terme : score précalculé lors de l'indexation
+            entry = entries.get(words[0])
+            book_ids, scores = [], []
+            for posting in entry.positions if entry else []:
+                score = posting['closeness'] if 'closeness' in posting else closeness_score(posting.get('positions', {}).get('text', []))
+                if posting.get('book') and score > 0:  # Au moins deux occurrences dans le texte
+                    book_ids.append(posting['book'])
+                    scores.append(score)
+            return {'book_ids': book_ids, 'scores': scores}
+
+        # Plusieurs termes : plus petite fenêtre couvrant tous les termes dans le texte
+        if any(word not in entries for word in words):
+            return {'book_ids': [], 'scores': []}
+
+        postings_by_word = [
+            {posting['book']: posting.get('positions', {}).get('text', []) for posting in entries[word].positions}
+            for word in words
+        ]
+        common_books = set.intersection(*(set(postings) for postings in postings_by_word))
+
+        book_ids, scores = [], []
+        with timing_span('proximity'):
+            for book_id in common_books:
+                window = minimal_window([decode_positions(postings[book_id]) for postings in postings_by_word])
+                if window is not None:
+                    book_ids.append(book_id)
+                    scores.append(window_score(window, len(postings_by_word)))
+        return {'book_ids': book_ids, 'scores': scores}
+
+
+    def score_books_from_segment(self, segment, words):
+        """Même calcul directement sur les tableaux du segment mappé (positions lues sans copie)."""
+        with timing_span('index_lookup'):
+            all_postings = [segment.postings(word) for word in words]
+        if any(postings is None for postings in all_postings):
+            return {'book_ids': [], 'scores': []}
+
+        if len(all_postings) == 1:
+            postings = all_postings[0]
+            keep = postings.closeness > 0  # Au moins deux occurrences dans le texte
+            return {'book_ids': postings.book_ids[keep].tolist(), 'scores': postings.closeness[keep].tolist()}
+
+        # Postings triés par id de livre : intersection vectorisée, en gardant l'indice dans chaque liste
+        common = all_postings[0].book_ids
+        for postings in all_postings[1:]:
+            common = np.intersect1d(common, postings.book_ids, assume_unique=True)
+        indices = [np.searchsorted(postings.book_ids, common) for postings in all_postings]
+
+        book_ids, scores = [], []
+        with timing_span('proximity'):
+            for row, book_id in enumerate(common.tolist()):
+                window = minimal_window([postings.text_positions(index[row]) for postings, index in zip(all_postings, indices)])
+                if window is not None:
+                    book_ids.append(book_id)
+                    scores.append(window_score(window, len(all_postings)))
+        return {'book_ids': book_ids, 'scores': scores}
+
+
+# ✅ Autocomplétion par préfixe (dictionnaire trié en mémoire, sans requête SQL)
+class AutocompleteView(APIView):
+    max_limit = 50
+
+    def get(self, request, prefix):
+        prefix = query_analyzer().normalize(prefix.strip())
+        if not prefix:
+            return Response({'error': 'Veuillez fournir un préfixe.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = min(int(request.GET.get('limit', 10)), self.max_limit)
+        except ValueError:
+            return Response({'error': 'Paramètres invalides.'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'Paramètres invalides.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        dictionary = term_dictionary.get()
+        if dictionary is None:
+            return Response({'error': "Dictionnaire d'autocomplétion indisponible, lancer index_books."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        with timing_span('autocomplete'):
+            completions = dictionary.complete(prefix, limit)
+
+        return Response({
+            'prefix': prefix,
+            'completions': [{'word': word, 'documents': documents} for word, documents in completions]
+        }, status=status.HTTP_200_OK)
+
+
+# ✅ Recherche à facettes (sujet, étagère, langue, copyright)
+class FacetedSearchView(APIView):
+    max_page_size = 100
+    max_facet_values = 50
+
+    def get(self, request):
+        query = request.GET.get('q', '').lower()
+        language = request_language(request.GET)
+        words = sorted({term for term in (analyze_query(word, language) for word in query.split()) if term})
+        # Paramètres répétables : ?subject=A&subject=B (OU), facettes différentes combinées en ET
+        filters = {facet: sorted(set(request.GET.getlist(facet))) for facet in FACETS if request.GET.getlist(facet)}
+
+        if not words and not filters:
+            return Response({'error': 'Veuillez fournir un mot-clé ou un filtre.'}, status=status.HTTP_400_BAD_REQUEST)
 
-    def calculate_avg_distance(self, positions):
-        if len(positions) == 1:
-            return 1
-        distances = [positions[i + 1] - positions[i] for i in range(len(positions) - 1)]
-        return sum(distances) / len(distances)
+        try:
+            page = int(request.GET.get('page', 1))
+            page_size = min(int(request.GET.get('page_size', 10)), self.max_page_size)
+            facet_limit = min(int(request.GET.get('facet_limit', 20)), self.max_facet_values)
+        except ValueError:
+            return Response({'error': 'Paramètres invalides.'}, status=status.HTTP_400_BAD_REQUEST)
+        if page < 1 or page_size < 1:
+            return Response({'error': 'Page invalide.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        facets = facet_index.get()
+        if facets is None:
+            return Response({'error': 'Index des facettes indisponible, lancer index_books.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        results = query_cache.get_or_compute(
+            'faceted', lambda: self.filter_books(facets, words, filters, facet_limit),
+            words=words, filters=filters, facet_limit=facet_limit,
+        )
+
+        with timing_span('top_k'):
+            ranked = top_k(results['book_ids'], results['scores'], page * page_size)
+        page_items = ranked[(page - 1) * page_size:]
+
+        with timing_span('book_fetch'):
+            books = Book.objects.select_related('author').in_bulk([book_id for book_id, _ in page_items])
+
+        return Response({
+            'books': [{
+                'id': book.id,
+                'title': book.title,
+                'languages': book.languages,
+                'summary': book.summary,
+                'author': book.author.name if book.author else None,
+                'score': score,
+            } for book, score in ((books.get(book_id), score) for book_id, score in page_items) if book],
+            'total_books': len(results['book_ids']),
+            'facets': results['facets'],
+            'page': page,
+        })
+
+    def term_occurrences(self, words):
+        """{book_id: occurrences cumulées} des livres contenant tous les termes."""
+        segment = segment_loader.get()
+        occurrences_by_word = []
+        with timing_span('index_lookup'):
+            if segment is not None:
+                for word in words:
+                    postings = segment.postings(word)
+                    if postings is None:
+                        return {}
+                    occurrences_by_word.append(dict(zip(postings.book_ids.tolist(), postings.occurrences_per_book().tolist())))
+            else:
+                entries = {entry.word: entry for entry in InvertedIndex.objects.for_terms(words)}
+                if any(word not in entries for word in words):
+                    return {}
+                occurrences_by_word = [
+                    {posting['book']: posting.get('occurrences', 0) for posting in entries[word].positions if posting.get('book')}
+                    for word in words
+                ]
+
+        common = set.intersection(*(set(occurrences) for occurrences in occurrences_by_word))
+        return {book_id: sum(occurrences[book_id] for occurrences in occurrences_by_word) for book_id in common}
+
+    def filter_books(self, facets, words, filters, facet_limit):
+        """Intersection des postings et des masques de facettes, puis comptes par facette sur le résultat."""
+        with timing_span('facets'):
+            mask = facets.filter_mask(filters)
+            scores = np.zeros(len(facets), dtype=np.float64)
+            if words:
+                occurrences = self.term_occurrences(words)
+                rows, found = facets.rows_of(list(occurrences))
+                term_mask = np.zeros(len(facets), dtype=bool)
+                term_mask[rows[found]] = True
+                scores[rows[found]] = np.fromiter(occurrences.values(), dtype=np.float64, count=len(occurrences))[found]
+                mask &= term_mask
+            else:
+                # Sans texte recherché : les livres les plus téléchargés d'abord
+                scores = facets.download_counts.astype(np.float64)
+
+            return {
+                'book_ids': facets.book_ids[mask].tolist(),
+                'scores': scores[mask].tolist(),
+                'facets': facets.counts(mask, facet_limit),
+            }
+
+
+# ✅ Top-k pondéré (tf-idf saturé + popularité) avec terminaison anticipée
+class TopKSearchView(APIView):
+    max_k = 100
+
+    def get(self, request):
+        query = request.GET.get('q', '').lower()
+        language = request_language(request.GET)
+        terms = sorted({term for term in (analyze_query(word, language) for word in query.split()) if term})
+        if not terms:
+            return Response({'error': 'Veuillez fournir un mot-clé.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            k = min(int(request.GET.get('k', 10)), self.max_k)
+        except ValueError:
+            return Response({'error': 'Paramètres invalides.'}, status=status.HTTP_400_BAD_REQUEST)
+        if k < 1:
+            return Response({'error': 'Paramètres invalides.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        segment = segment_loader.get()
+        if segment is None:
+            return Response({'error': "Segment d'index indisponible, lancer index_books."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        result = query_cache.get_or_compute('topk', lambda: self.evaluate(segment, terms, k), terms=terms, k=k)
+
+        with timing_span('book_fetch'):
+            books = Book.objects.select_related('author').in_bulk([book_id for book_id, _ in result['hits']])
+
+        return Response({
+            'books': [{
+                'id': book.id,
+                'title': book.title,
+                'languages': book.languages,
+                'author': book.author.name if book.author else None,
+                'download_count': book.download_count,
+                'score': score,
+            } for book, score in ((books.get(book_id), score) for book_id, score in result['hits']) if book],
+            'postings_touched': result['touched'],
+            'postings_total': result['total'],
+        })
+
+    def evaluate(self, segment, terms, k):
+        with timing_span('top_k'):
+            result = topk.top_k(segment, terms, k)
+        metrics.record_postings('topk', result.touched, result.total)
+        return {'hits': result.hits, 'touched': result.touched, 'total': result.total}
+
+
+# ✅ Statistiques de plusieurs termes en un seul appel (surlignage, panneaux de suggestions)
+class TermStatsView(APIView):
+    max_terms = 50
+    max_books = 20       # Livres dont on calcule pages_with_word (lecture du texte)
+    default_limit = 100  # Livres listés par terme quand aucun livre n'est demandé
+
+    def get(self, request):
+        return self.respond(request.GET.getlist('term'), request.GET.getlist('book'), request.GET)
+
+    def post(self, request):
+        # Corps JSON : {"terms": [...], "books": [...], "page_size": 300, "lang": "en", "limit": 100}
+        data = request.data if isinstance(request.data, dict) else {}
+        return self.respond(data.get('terms') or [], data.get('books') or [], data)
+
+    def respond(self, words, book_ids, options):
+        words = list(dict.fromkeys(str(word).lower().strip() for word in words if str(word).strip()))
+        if not words:
+            return Response({'error': 'Veuillez fournir au moins un terme.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            book_ids = sorted({int(book_id) for book_id in book_ids})
+            page_size = int(options.get('page_size', 300))
+            limit = int(options.get('limit', self.default_limit))
+        except (TypeError, ValueError):
+            return Response({'error': 'Paramètres invalides.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(words) > self.max_terms or len(book_ids) > self.max_books or page_size < 1 or limit < 0:
+            return Response(
+                {'error': f'Au plus {self.max_terms} termes et {self.max_books} livres, page_size >= 1.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        language = request_language(options)
+
+        result = query_cache.get_or_compute(
+            'term_stats', lambda: self.compute(words, book_ids, page_size, limit, language),
+            words=words, books=book_ids, page_size=page_size, limit=limit, language=language,
+        )
+        return Response({'page_size': page_size, 'terms': result})
+
+    def compute(self, words, book_ids, page_size, limit, language):
+        terms = {word: analyze_query(word, language) for word in words}
+        with timing_span('index_lookup'):
+            counts = self.lookup({term for term in terms.values() if term}, book_ids)
+        with timing_span('pages'):
+            pages = self.pages_with_words(words, book_ids, page_size) if book_ids else {}
+
+        stats = {}
+        for word, term in terms.items():
+            document_frequency, total_occurrences, per_book = counts.get(term, (0, 0, {}))
+            if not book_ids:
+                per_book = dict(sorted(per_book.items(), key=lambda item: (-item[1], item[0]))[:limit])
+            books = {book_id: {'occurrences': occurrences} for book_id, occurrences in per_book.items()}
+            for book_id in book_ids:
+                if book_id in pages:
+                    books.setdefault(book_id, {'occurrences': 0})['pages_with_word'] = sorted(pages[book_id].get(word, ()))
+            stats[word] = {
+                'term': term,
+                'document_frequency': document_frequency,
+                'total_occurrences': total_occurrences,
+                'books': books,
+            }
+        return stats
+
+    def lookup(self, terms, book_ids):
+        """{terme: (fréquence documentaire, occurrences totales, {livre: occurrences})} en un seul passage sur l'index."""
+        if not terms:
+            return {}
+        segment = segment_loader.get()
+        counts = {}
+        if segment is not None:
+            wanted = np.asarray(book_ids, dtype=np.int64)
+            for term in terms:
+                postings = segment.postings(term)
+                if postings is None:
+                    continue
+                occurrences = postings.occurrences_per_book()
+                if book_ids:
+                    # Postings triés par livre : seuls les livres demandés sont lus
+                    indexes = np.searchsorted(postings.book_ids, wanted)
+                    indexes = indexes[indexes < len(postings)]
+                    indexes = indexes[np.isin(postings.book_ids[indexes], wanted)]
+                    per_book = dict(zip(postings.book_ids[indexes].tolist(), occurrences[indexes].tolist()))
+                else:
+                    per_book = dict(zip(postings.book_ids.tolist(), occurrences.tolist()))
+                counts[term] = (len(postings), postings.occurrences, per_book)
+            return counts
+
+        # Sans segment : une seule requête pour tous les termes
+        wanted = set(book_ids)
+        for entry in InvertedIndex.objects.for_terms(terms).annotate(raw_positions=Cast('positions', output_field=TextField())).defer('positions'):
+            postings = [posting for posting in json.loads(entry.raw_positions) if posting.get('book')]
+            per_book = {
+                posting['book']: posting.get('occurrences', 0)
+                for posting in postings if not wanted or posting['book'] in wanted
+            }
+            counts[entry.word] = (len(postings), entry.occurrences, per_book)
+        return counts
+
+    def pages_with_words(self, words, book_ids, page_size):
+        """
+        {livre: {mot: pages}} avec le découpage du lecteur (BookTextHighlightView : mots séparés par des
+        espaces, comparés sans ponctuation) : un seul parcours du texte de chaque livre pour tous les mots.
+        """
+        wanted = set(words)
+        pages = {}
+        for book_id, text in Book.objects.filter(id__in=book_ids).values_list('id', 'text').iterator():
+            book_pages = pages[book_id] = defaultdict(set)
+            for index, raw_word in enumerate((text or '').split()):
+                cleaned = ''.join(c for c in raw_word.lower() if c.isalnum())
+                if cleaned in wanted:
+                    book_pages[cleaned].add(index // page_size + 1)
+        return pages
@@ -0,0 +1,113 @@
+from collections import defaultdict
+
+from django.db import connection, transaction
+from psycopg2.extras import execute_values
+
+from .facets import book_facet_values, normalize_value
+from .models import CatalogStatistic, CorpusSnapshot
+
+# Statistiques du corpus matérialisées par index_books, lues en O(1) par les tableaux de bord
+# (/api/stats/...) et par le planificateur de requêtes (fréquences documentaires).
+#
+# Le rafraîchissement est incrémental : les lignes sont fusionnées (INSERT ... ON CONFLICT) et seules
+# celles dont une valeur a changé sont réécrites ; les termes ou valeurs disparus sont supprimés.
+
+CATALOG_DIMENSIONS = ('language', 'author', 'subject', 'bookshelf')
+UPSERT_PAGE_SIZE = 5000
+
+
+def df_distribution(frequencies):
+    """Histogramme des fréquences documentaires par puissance de 2 : [1], [2, 3], [4, 7], ..."""
+    buckets = defaultdict(int)
+    for frequency in frequencies:
+        buckets[frequency.bit_length() - 1] += 1
+    return [{'min': 1 << bucket, 'max': (2 << bucket) - 1, 'terms': buckets[bucket]} for bucket in sorted(buckets)]
+
+
+def upsert(table, key_columns, value_columns, rows):
+    """Fusionne `rows` dans `table` sans réécrire les lignes inchangées ; retourne le nombre de lignes écrites."""
+    columns = key_columns + value_columns
+    changed = ' OR '.join(f'{table}.{column} IS DISTINCT FROM EXCLUDED.{column}' for column in value_columns)
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s "
+        f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET "
+        + ', '.join(f'{column} = EXCLUDED.{column}' for column in value_columns)
+        + f" WHERE {changed}"
+    )
+    written = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_PAGE_SIZE):
+            execute_values(cursor, sql, rows[start:start + UPSERT_PAGE_SIZE], page_size=UPSERT_PAGE_SIZE)
+            written += cursor.rowcount
+    return written
+
+
+def refresh_term_statistics(word_index, surface_of):
+    """
+    Statistiques par terme depuis l'index construit par index_books ({terme: {livre: {champ: positions}}}),
+    dans la transaction qui réécrit books_invertedindex : le planificateur ne voit jamais un nouvel index
+    avec les fréquences de l'ancien. Retourne (lignes écrites, termes supprimés).
+    """
+    rows = [
+        (
+            term,
+            surface_of.get(term, term),
+            len(books),
+            sum(len(positions) for fields in books.values() for positions in fields.values()),
+        )
+        for term, books in word_index.items()
+    ]
+    with transaction.atomic():
+        written = upsert('books_termstatistic', ['term'], ['surface', 'document_frequency', 'occurrences'], rows)
+        # Termes disparus : absents de l'index inversé qui vient d'être réécrit (index unique sur word)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM books_termstatistic AS statistic WHERE NOT EXISTS "
+                "(SELECT 1 FROM books_invertedindex AS entry WHERE entry.word = statistic.term)"
+            )
+            removed = cursor.rowcount
+    return written, removed
+
+
+def refresh_catalog_statistics(books):
+    """
+    Livres et téléchargements par langue, auteur, sujet et étagère
+    (dictionnaires {languages, author__name, subjects, bookshelves, copyright, download_count}).
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for book in books:
+        values = book_facet_values(book)
+        values['author'] = [book['author__name']] if book.get('author__name') else []
+        for dimension in CATALOG_DIMENSIONS:
+            for value in {normalize_value(dimension, value) for value in values[dimension]}:
+                total = totals[(dimension, value)]
+                total[0] += 1
+                total[1] += book['download_count'] or 0
+
+    rows = [(dimension, value, book_count, download_count) for (dimension, value), (book_count, download_count) in totals.items()]
+    with transaction.atomic():
+        written = upsert('books_catalogstatistic', ['dimension', 'value'], ['book_count', 'download_count'], rows)
+        # Valeurs disparues : une requête par dimension
+        removed = 0
+        for dimension in CATALOG_DIMENSIONS:
+            present = [value for (row_dimension, value) in totals if row_dimension == dimension]
+            removed += CatalogStatistic.objects.filter(dimension=dimension).exclude(value__in=present).delete()[0]
+    return written, removed
+
+
+def record_snapshot(word_index, book_count):
+    frequencies = [len(books) for books in word_index.values()]
+    return CorpusSnapshot.objects.create(
+        book_count=book_count,
+        vocabulary_size=len(word_index),
+        posting_count=sum(frequencies),
+        total_occurrences=sum(
+            len(positions) for books in word_index.values() for fields in books.values() for positions in fields.values()
+        ),
+        hapax_count=sum(1 for frequency in frequencies if frequency == 1),
+        df_distribution=df_distribution(frequencies),
+    )
+
+
+def latest_snapshot():
+    return CorpusSnapshot.objects.first()
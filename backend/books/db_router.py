@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Routage des lectures vers un réplica PostgreSQL (streaming replication).
+#
+# Seules les lectures des modèles `books` faites pendant une requête HTTP (recherche, affichage) vont au
+# réplica : les commandes de gestion (import_books, index_books...) et les threads d'arrière-plan restent
+# sur le primaire, qui reçoit toutes les écritures. Une requête qui écrit lit ensuite sur le primaire
+# (lecture de ses propres écritures). Si le réplica est injoignable ou trop en retard, les lectures
+# retombent sur le primaire jusqu'à la vérification suivante.
+
+DEFAULTS = {
+    'ALIAS': 'replica',
+    'MAX_LAG_SECONDS': 10,     # Au-delà, le réplica n'est plus utilisé
+    'CHECK_INTERVAL': 5,       # Secondes entre deux mesures du retard (par processus)
+}
+
+# Retard de rejeu en secondes ; nul si tout le WAL reçu est rejoué (primaire sans écriture récente)
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+_local = threading.local()
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'BOOKS_READ_REPLICA', {})}
+
+
+@contextmanager
+def replica_reads():
+    """Autorise les lectures sur le réplica dans ce bloc (thread courant)."""
+    previous = getattr(_local, 'state', None)
+    _local.state = 'replica'
+    try:
+        yield
+    finally:
+        _local.state = previous
+
+
+def pin_primary():
+    """Les lectures suivantes du bloc replica_reads courant vont au primaire."""
+    if getattr(_local, 'state', None) == 'replica':
+        _local.state = 'primary'
+
+
+class ReplicaHealth:
+    """Retard du réplica, mesuré au plus toutes les CHECK_INTERVAL secondes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.healthy = False
+        self.lag = None
+        self.checked_at = None
+
+    def is_healthy(self, alias):
+        options = config()
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < options['CHECK_INTERVAL']:
+            return self.healthy
+        with self.lock:
+            if self.checked_at is not None and now - self.checked_at < options['CHECK_INTERVAL']:
+                return self.healthy
+            self.checked_at = now
+            try:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute(LAG_QUERY)
+                    self.lag = float(cursor.fetchone()[0])
+                healthy = self.lag <= options['MAX_LAG_SECONDS']
+            except DatabaseError:
+                logger.warning("Réplica %s injoignable : lectures sur le primaire", alias, exc_info=True)
+                self.lag = None
+                healthy = False
+            if healthy != self.healthy and self.lag is not None:
+                logger.warning("Réplica %s %s (retard %.1f s)", alias, 'utilisé' if healthy else 'ignoré', self.lag)
+            self.healthy = healthy
+            return healthy
+
+
+replica_health = ReplicaHealth()
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'books' or getattr(_local, 'state', None) != 'replica':
+            return None
+        alias = config()['ALIAS']
+        if alias not in settings.DATABASES or not replica_health.is_healthy(alias):
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Les écritures du cache partagé (table django_cache) ne changent pas les données lues ensuite
+        if model._meta.app_label == 'books':
+            pin_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Le réplica est une copie physique du primaire : les objets lus sur l'un ou l'autre sont compatibles
+        databases = {DEFAULT_DB_ALIAS, config()['ALIAS']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Le réplica est en lecture seule : le schéma lui arrive par la réplication
+        return db != config()['ALIAS']
+
+
+class ReplicaReadsMiddleware:
+    """Les vues exécutées par cette middleware peuvent lire sur le réplica."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return self.get_response(request)
+        with replica_reads():
+            return self.get_response(request)
@@ -0,0 +1,161 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+
+# Index des facettes : pour chaque valeur (sujet, étagère, langue, copyright), la liste triée des livres
+# qui la portent, exprimés en rangs dans le tableau trié des ids de livres. Au moment de la requête,
+# les filtres deviennent des masques booléens NumPy (un bit par livre) intersectés avec les postings
+# des termes, et les comptes par valeur sont calculés d'un seul np.bincount sur le résultat.
+
+FILE_NAME = 'facets.npz'
+FACETS = ('subject', 'bookshelf', 'language', 'copyright')
+RELOAD_CHECK_INTERVAL = 5
+
+
+def facets_path():
+    return os.path.join(settings.BOOKS_INDEX_DIR, FILE_NAME)
+
+
+def normalize_value(facet, value):
+    value = str(value).strip()
+    if facet == 'copyright':
+        return 'true' if value.lower() in ('true', '1', 'yes') else 'false'
+    if facet == 'language':
+        return value.lower()
+    return value
+
+
+def book_facet_values(book):
+    """Valeurs de facettes d'un livre (dictionnaire issu de Book.objects.values())."""
+    return {
+        'subject': book['subjects'] or [],
+        'bookshelf': book['bookshelves'] or [],
+        'language': [language for language in (book['languages'] or '').split(',') if language.strip()],
+        'copyright': [book['copyright']],
+    }
+
+
+def write_facets(books, path=None):
+    """
+    Construit l'index des facettes à partir de dictionnaires
+    {id, subjects, bookshelves, languages, copyright, download_count} et l'écrit atomiquement.
+    Retourne le nombre de valeurs distinctes.
+    """
+    path = path or facets_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    books = sorted(books, key=lambda book: book['id'])
+
+    rows_by_value = {}
+    for row, book in enumerate(books):
+        for facet, values in book_facet_values(book).items():
+            for value in {normalize_value(facet, value) for value in values}:
+                rows_by_value.setdefault((facet, value), []).append(row)
+
+    keys = sorted(rows_by_value)
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(rows_by_value[key]) for key in keys])
+    rows = np.fromiter((row for key in keys for row in rows_by_value[key]), dtype=np.int32, count=int(offsets[-1]))
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as output:
+        np.savez(
+            output,
+            book_ids=np.array([book['id'] for book in books], dtype=np.int64),
+            download_counts=np.array([book['download_count'] or 0 for book in books], dtype=np.int64),
+            value_facets=np.array([FACETS.index(facet) for facet, _ in keys], dtype=np.int8),
+            values=np.array([value for _, value in keys], dtype=str),
+            offsets=offsets,
+            rows=rows,
+        )
+    os.replace(tmp_path, path)
+    return len(keys)
+
+
+class FacetIndex:
+    def __init__(self, book_ids, download_counts, value_facets, values, offsets, rows):
+        self.book_ids = book_ids
+        self.download_counts = download_counts
+        self.value_facets = value_facets
+        self.values = values.tolist()
+        self.offsets = offsets
+        self.rows = rows
+        # Valeur de chaque entrée de `rows` : permet de compter toutes les valeurs d'un coup
+        self.row_values = np.repeat(np.arange(len(self.values)), np.diff(offsets))
+        self.lookup = {(FACETS[facet], value): i for i, (facet, value) in enumerate(zip(value_facets.tolist(), self.values))}
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+    def __len__(self):
+        return len(self.book_ids)
+
+    def value_mask(self, facet, value):
+        mask = np.zeros(len(self), dtype=bool)
+        index = self.lookup.get((facet, normalize_value(facet, value)))
+        if index is not None:
+            mask[self.rows[self.offsets[index]:self.offsets[index + 1]]] = True
+        return mask
+
+    def filter_mask(self, filters):
+        """Masque des livres retenus : OU entre les valeurs d'une facette, ET entre facettes."""
+        mask = np.ones(len(self), dtype=bool)
+        for facet, values in filters.items():
+            facet_mask = np.zeros(len(self), dtype=bool)
+            for value in values:
+                facet_mask |= self.value_mask(facet, value)
+            mask &= facet_mask
+        return mask
+
+    def rows_of(self, book_ids):
+        """Rangs des livres donnés (les livres absents de l'index des facettes sont ignorés)."""
+        book_ids = np.asarray(book_ids, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.book_ids, book_ids), max(len(self) - 1, 0))
+        found = self.book_ids[rows] == book_ids if len(self) else np.zeros(len(book_ids), dtype=bool)
+        return rows, found
+
+    def counts(self, mask, limit=20):
+        """Comptes par valeur de facette pour les livres du masque, les plus fréquentes d'abord."""
+        value_counts = np.bincount(self.row_values[mask[self.rows]], minlength=len(self.values))
+        facets = {}
+        for facet_index, facet in enumerate(FACETS):
+            candidates = np.flatnonzero((self.value_facets == facet_index) & (value_counts > 0))
+            ordered = candidates[np.argsort(-value_counts[candidates], kind='stable')][:limit]
+            facets[facet] = [{'value': self.values[i], 'count': int(value_counts[i])} for i in ordered]
+        return facets
+
+
+class FacetIndexLoader:
+    """Charge l'index des facettes à la demande et le recharge quand index_books en écrit un nouveau."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.mtime = None
+        self.checked_at = 0
+
+    def get(self):
+        now = time.monotonic()
+        if self.index is not None and now - self.checked_at < RELOAD_CHECK_INTERVAL:
+            return self.index
+        with self.lock:
+            self.checked_at = now
+            path = facets_path()
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                return self.index
+            if mtime != self.mtime:
+                self.index = FacetIndex.load(path)
+                self.mtime = mtime
+            return self.index
+
+
+facet_index = FacetIndexLoader()
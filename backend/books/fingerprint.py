@@ -0,0 +1,92 @@
+import hashlib
+import re
+from collections import defaultdict
+
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+
+# Empreinte SimHash (64 bits) d'un texte, calculée sur ses 3-grammes de mots : deux éditions
+# quasi identiques ont des empreintes à faible distance de Hamming.
+#
+# Table à bandes : l'empreinte est découpée en BANDS bandes de 16 bits. Deux empreintes à distance
+# <= HAMMING_THRESHOLD (< BANDS) ont forcément au moins une bande identique (principe des tiroirs),
+# donc seuls les livres partageant une bande sont comparés, au lieu de tout le catalogue.
+
+BITS = 64
+BANDS = 4
+BAND_BITS = BITS // BANDS
+HAMMING_THRESHOLD = 3
+SHINGLE_SIZE = 3
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def simhash(text):
+    """Empreinte SimHash non signée du texte (0 pour un texte vide)."""
+    words = WORD_PATTERN.findall(text.casefold())
+    shingles = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+    shingles.discard('')
+    if not shingles:
+        return 0
+
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little') for shingle in shingles),
+        dtype='<u8', count=len(shingles),
+    )
+    # Pour chaque bit : +1 si le bit est à 1 dans le hash d'un shingle, -1 sinon ; on garde le signe.
+    # Matrice shingles x 64 bits en uint8 (bit i de l'entier = colonne i en ordre little-endian)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+    majority = bits.sum(axis=0) * 2 > len(shingles)
+    return int(sum(1 << bit for bit in np.flatnonzero(majority).tolist()))
+
+
+def to_signed(fingerprint):
+    """Les empreintes sont stockées dans un BigIntegerField (signé)."""
+    return fingerprint - (1 << BITS) if fingerprint >= 1 << (BITS - 1) else fingerprint
+
+
+def to_unsigned(fingerprint):
+    return fingerprint + (1 << BITS) if fingerprint < 0 else fingerprint
+
+
+def bands(fingerprint):
+    """[(numéro de bande, valeur 16 bits)] d'une empreinte non signée."""
+    mask = (1 << BAND_BITS) - 1
+    return [(band, (fingerprint >> (band * BAND_BITS)) & mask) for band in range(BANDS)]
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class DuplicateDetector:
+    """Table à bandes en mémoire : retrouve l'édition déjà connue la plus proche d'une empreinte."""
+
+    def __init__(self, threshold=HAMMING_THRESHOLD):
+        self.threshold = threshold
+        self.buckets = defaultdict(list)  # (bande, valeur) -> [(clé, empreinte)]
+
+    @classmethod
+    def from_database(cls, **kwargs):
+        """Charge les empreintes des livres canoniques déjà importés (clé = id du livre)."""
+        from .models import Book
+
+        detector = cls(**kwargs)
+        books = Book.objects.filter(simhash__isnull=False, duplicate_of__isnull=True).values_list('id', 'simhash')
+        for book_id, fingerprint in books.iterator():
+            detector.add(book_id, to_unsigned(fingerprint))
+        return detector
+
+    def add(self, key, fingerprint):
+        for band in bands(fingerprint):
+            self.buckets[band].append((key, fingerprint))
+
+    def find(self, fingerprint):
+        """Clé de l'édition la plus proche sous le seuil, ou None."""
+        best_key, best_distance = None, self.threshold + 1
+        for band in bands(fingerprint):
+            for key, candidate in self.buckets.get(band, ()):
+                distance = hamming(fingerprint, candidate)
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+        return best_key
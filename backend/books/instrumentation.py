@@ -0,0 +1,222 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.urls import resolve, Resolver404
+
+from .query_log import config as query_log_config, normalized_params, query_log, result_count
+
+# Bornes (en secondes) des histogrammes de latence par endpoint
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+
+
+# ✅ Spans de timing (exposés dans l'en-tête Server-Timing)
+@contextmanager
+def timing_span(name):
+    """Mesure la durée d'une étape de la requête courante (cumulée si l'étape se répète)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans = getattr(_local, 'spans', None)
+        if spans is not None:
+            spans[name] += (time.perf_counter() - start) * 1000
+
+
+def current_spans():
+    """Retourne les spans de la requête courante (vide hors requête)."""
+    return dict(getattr(_local, 'spans', None) or {})
+
+
+# ✅ Registre de métriques au format Prometheus (par processus)
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(Histogram)
+        self.queries = defaultdict(int)
+        self.responses = defaultdict(int)
+        self.cache_hits = defaultdict(int)
+        self.cache_misses = defaultdict(int)
+        self.postings_touched = defaultdict(int)
+        self.postings_total = defaultdict(int)
+
+    def observe_request(self, endpoint, status_code, duration, query_count):
+        with self.lock:
+            self.latency[endpoint].observe(duration)
+            self.queries[endpoint] += query_count
+            self.responses[(endpoint, status_code)] += 1
+
+    def record_cache(self, cache_name, hit):
+        with self.lock:
+            if hit:
+                self.cache_hits[cache_name] += 1
+            else:
+                self.cache_misses[cache_name] += 1
+
+    def record_postings(self, endpoint, touched, total):
+        with self.lock:
+            self.postings_touched[endpoint] += touched
+            self.postings_total[endpoint] += total
+
+    def render(self):
+        """Sérialise les métriques au format texte Prometheus."""
+        lines = []
+        with self.lock:
+            lines.append('# TYPE books_request_duration_seconds histogram')
+            for endpoint, histogram in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'books_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'books_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {histogram.count}')
+                lines.append(f'books_request_duration_seconds_sum{{endpoint="{endpoint}"}} {histogram.total:.6f}')
+                lines.append(f'books_request_duration_seconds_count{{endpoint="{endpoint}"}} {histogram.count}')
+
+            lines.append('# TYPE books_db_queries_total counter')
+            for endpoint, count in sorted(self.queries.items()):
+                lines.append(f'books_db_queries_total{{endpoint="{endpoint}"}} {count}')
+
+            lines.append('# TYPE books_responses_total counter')
+            for (endpoint, status_code), count in sorted(self.responses.items()):
+                lines.append(f'books_responses_total{{endpoint="{endpoint}",status="{status_code}"}} {count}')
+
+            lines.append('# TYPE books_cache_requests_total counter')
+            lines.append('# TYPE books_cache_hit_ratio gauge')
+            for cache_name in sorted(set(self.cache_hits) | set(self.cache_misses)):
+                hits, misses = self.cache_hits[cache_name], self.cache_misses[cache_name]
+                lines.append(f'books_cache_requests_total{{cache="{cache_name}",result="hit"}} {hits}')
+                lines.append(f'books_cache_requests_total{{cache="{cache_name}",result="miss"}} {misses}')
+                lines.append(f'books_cache_hit_ratio{{cache="{cache_name}"}} {hits / (hits + misses):.4f}')
+
+            # Postings lus par rapport aux postings des termes demandés (efficacité de la terminaison anticipée)
+            lines.append('# TYPE books_postings_touched_total counter')
+            lines.append('# TYPE books_postings_candidates_total counter')
+            for endpoint in sorted(self.postings_total):
+                lines.append(f'books_postings_touched_total{{endpoint="{endpoint}"}} {self.postings_touched[endpoint]}')
+                lines.append(f'books_postings_candidates_total{{endpoint="{endpoint}"}} {self.postings_total[endpoint]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def record_cache(cache_name, hit):
+    metrics.record_cache(cache_name, hit)
+    # Premier accès au cache de la requête courante : c'est lui qui décide si le résultat est recalculé
+    if getattr(_local, 'cache_hit', False) is None:
+        _local.cache_hit = hit
+
+
+# ✅ Middleware : Server-Timing, nombre de requêtes SQL, histogrammes, profilage opt-in
+class PerformanceMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.spans = defaultdict(float)
+        _local.query_count = 0
+        _local.cache_hit = None
+        start = time.perf_counter()
+        try:
+            with ExitStack() as wrappers:
+                # Toutes les bases (primaire et réplica éventuel) sont comptées
+                for connection in connections.all():
+                    wrappers.enter_context(connection.execute_wrapper(self.count_queries))
+                if self.profiling_requested(request):
+                    response = self.profile(request)
+                else:
+                    response = self.get_response(request)
+            duration = time.perf_counter() - start
+
+            spans = _local.spans
+            query_count = _local.query_count
+            server_timing = [f'{name};dur={value:.2f}' for name, value in spans.items()]
+            server_timing.append(f'queries;desc="{query_count} SQL"')
+            server_timing.append(f'total;dur={duration * 1000:.2f}')
+            response['Server-Timing'] = ', '.join(server_timing)
+            response['X-Query-Count'] = str(query_count)
+
+            endpoint = self.endpoint_name(request)
+            metrics.observe_request(endpoint, response.status_code, duration, query_count)
+            if query_log.enabled() and self.is_logged(request, endpoint):
+                query_log.record(
+                    endpoint, request.path, normalized_params(request), response.status_code,
+                    duration * 1000, result_count(response), _local.cache_hit,
+                )
+            return response
+        finally:
+            _local.spans = None
+            _local.cache_hit = False
+
+    def count_queries(self, execute, sql, params, many, context):
+        _local.query_count += 1
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            _local.spans['db'] += (time.perf_counter() - start) * 1000
+
+    def endpoint_name(self, request):
+        try:
+            return resolve(request.path_info).url_name or 'unnamed'
+        except Resolver404:
+            return 'not_found'
+
+    def is_logged(self, request, endpoint):
+        """Journal des requêtes : seulement les vues de l'application books (hors EXCLUDE et préchauffage)."""
+        if 'HTTP_X_BOOKS_WARMUP' in request.META:
+            return False
+        match = getattr(request, 'resolver_match', None)
+        module = getattr(match.func, '__module__', '') if match else ''
+        return module.startswith('books.') and endpoint not in query_log_config()['EXCLUDE']
+
+    def profiling_requested(self, request):
+        enabled = settings.DEBUG or getattr(settings, 'BOOKS_PROFILING_ENABLED', False)
+        return enabled and request.GET.get('profile') == '1'
+
+    def profile(self, request):
+        """Exécute la requête sous profileur et retourne le rapport à la place de la réponse."""
+        if request.GET.get('profiler') == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                return HttpResponse("pyinstrument n'est pas installé.", status=400, content_type='text/plain')
+            profiler = Profiler()
+            profiler.start()
+            self.get_response(request)
+            profiler.stop()
+            return HttpResponse(profiler.output_text(unicode=True), content_type='text/plain; charset=utf-8')
+
+        profiler = cProfile.Profile()
+        profiler.runcall(self.get_response, request)
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(50)
+        return HttpResponse(report.getvalue(), content_type='text/plain; charset=utf-8')
+
+
+# ✅ Endpoint des métriques Prometheus
+def metrics_view(request):
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,63 @@
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .jobs import validate_options
+from .models import Job
+from .serializers import JobDetailSerializer, JobSerializer
+
+
+class ReadOnlyOrStaff(BasePermission):
+    """Avancement consultable par tous ; création et annulation réservées au personnel."""
+
+    def has_permission(self, request, view):
+        return request.method in SAFE_METHODS or bool(request.user and request.user.is_staff)
+
+
+def serializer_for(request):
+    return JobDetailSerializer if request.user and request.user.is_staff else JobSerializer
+
+
+# ✅ File des tâches de fond (exécutées par `manage.py run_jobs`)
+class JobListView(APIView):
+    permission_classes = [ReadOnlyOrStaff]
+    max_jobs = 50
+
+    def get(self, request):
+        jobs = Job.objects.all()
+        if request.GET.get('status'):
+            jobs = jobs.filter(status=request.GET['status'])
+        if request.GET.get('kind'):
+            jobs = jobs.filter(kind=request.GET['kind'])
+        return Response({'jobs': serializer_for(request)(jobs[:self.max_jobs], many=True).data})
+
+    def post(self, request):
+        kind = request.data.get('kind')
+        options = request.data.get('options') or {}
+        error = validate_options(kind, options)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+        job = Job.objects.create(kind=kind, options=options)
+        return Response(JobDetailSerializer(job).data, status=status.HTTP_201_CREATED)
+
+
+class JobDetailView(APIView):
+    permission_classes = [ReadOnlyOrStaff]
+
+    def get(self, request, job_id):
+        try:
+            job = Job.objects.get(id=job_id)
+        except Job.DoesNotExist:
+            return Response({'error': 'Tâche introuvable.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(serializer_for(request)(job).data)
+
+    def delete(self, request, job_id):
+        """Annule une tâche : immédiatement si elle attend, à son prochain lot si elle tourne."""
+        if Job.objects.filter(id=job_id, status=Job.QUEUED).update(status=Job.CANCELLED):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if Job.objects.filter(id=job_id, status=Job.RUNNING).update(cancel_requested=True):
+            return Response({'message': "Annulation demandée."}, status=status.HTTP_202_ACCEPTED)
+        if Job.objects.filter(id=job_id).exists():
+            return Response({'error': 'Tâche déjà terminée.'}, status=status.HTTP_409_CONFLICT)
+        return Response({'error': 'Tâche introuvable.'}, status=status.HTTP_404_NOT_FOUND)
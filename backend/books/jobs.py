@@ -0,0 +1,268 @@
+import io
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Exécution des tâches de fond (file d'attente en base, processus `manage.py run_jobs`).
+#
+# Les commandes de gestion appellent checkpoint() à chaque lot : hors tâche, l'appel ne coûte rien ;
+# pendant une tâche, il publie l'avancement, vérifie une demande d'annulation et ralentit la commande
+# (rapport cyclique : pause proportionnelle au temps de travail) pour laisser la base aux recherches.
+# Dans une section uninterruptible() (ex. index vidé puis réécrit), seul l'avancement est publié.
+
+DEFAULTS = {
+    'WORKERS': 1,
+    'POLL_SECONDS': 2,
+    'NICE': 10,                  # Priorité CPU des processus de travail
+    'IO_IDLE': True,             # ionice classe « idle » (Linux) : les lectures des recherches passent d'abord
+    'VACUUM_COST_DELAY_MS': 10,  # VACUUM des commandes ralenti par PostgreSQL (vacuum_cost_delay)
+    'PEAK_HOURS': (8, 23),       # Heures locales [début, fin) d'affluence
+    'PEAK_DUTY_CYCLE': 0.5,      # Fraction du temps passée à travailler pendant l'affluence
+    'OFF_PEAK_DUTY_CYCLE': 1.0,  # 1 : aucune pause
+    'MAX_THREADS': 4,            # Threads d'analyse d'index_books pendant une tâche
+    'PROGRESS_INTERVAL': 1.0,    # Secondes minimum entre deux écritures de l'avancement
+    'HEARTBEAT_SECONDS': 30,     # Signal de vie d'une tâche en cours, même pendant une longue étape
+    'STALE_AFTER': 300,          # Tâche en cours sans signal de vie depuis ce délai : processus perdu
+    'OUTPUT_CHARS': 20000,       # Fin de la sortie conservée dans Job.output
+}
+
+# Type de tâche -> (commande de gestion, options acceptées)
+COMMANDS = {
+    'import': ('import_books', {'catalog', 'max_books', 'min_words', 'max_words', 'duplicates'}),
+    'index': ('index_books', {'shards', 'no_stemming', 'no_warm'}),
+    'warm': ('warm_caches', {'queries', 'books', 'concurrency', 'log'}),
+    'similarity': ('detect_duplicates', {'threshold', 'relink'}),
+}
+
+_local = threading.local()
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'BOOKS_JOBS', {})}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def validate_options(kind, options):
+    """Retourne un message d'erreur, ou None si la tâche peut être mise en file."""
+    if kind not in COMMANDS:
+        return f"Type de tâche inconnu : {kind}."
+    if not isinstance(options, dict):
+        return "Les options doivent être un objet JSON."
+    unknown = set(options) - COMMANDS[kind][1]
+    if unknown:
+        return f"Options non acceptées pour {kind} : {', '.join(sorted(unknown))}."
+    return None
+
+
+# --- Côté commandes ---
+
+class JobContext:
+    def __init__(self, job):
+        self.job_id = job.pk
+        self.config = config()
+        self.last_write = 0.0
+        self.resumed_at = time.monotonic()  # Début de la période de travail en cours
+        self.uninterruptible = 0  # Profondeur des sections ni annulables ni ralenties
+
+    def duty_cycle(self):
+        start, end = self.config['PEAK_HOURS']
+        hour = timezone.localtime().hour
+        peak = start <= hour < end if start <= end else (hour >= start or hour < end)
+        return self.config['PEAK_DUTY_CYCLE'] if peak else self.config['OFF_PEAK_DUTY_CYCLE']
+
+    def throttle(self):
+        duty_cycle = self.duty_cycle()
+        if 0 < duty_cycle < 1:
+            worked = time.monotonic() - self.resumed_at
+            time.sleep(min(worked * (1 / duty_cycle - 1), 30))
+        self.resumed_at = time.monotonic()
+
+    def report(self, done, total, stage):
+        now = time.monotonic()
+        if now - self.last_write < self.config['PROGRESS_INTERVAL'] and done < total:
+            return
+        if connection.in_atomic_block:
+            return  # Invisible avant la fin de la transaction de la commande : on attend le lot suivant
+        self.last_write = now
+        fields = {'progress': min(done / total, 1.0) if total else 0.0}
+        if stage is not None:
+            fields['stage'] = stage[:255]
+        Job.objects.filter(pk=self.job_id).update(**fields)
+        if not self.uninterruptible and Job.objects.filter(pk=self.job_id, cancel_requested=True).exists():
+            raise JobCancelled()
+
+
+def current_job():
+    return getattr(_local, 'context', None)
+
+
+def checkpoint(done=0, total=0, stage=None):
+    """Fin d'un lot de travail d'une commande : avancement, annulation, ralentissement (sans effet hors tâche)."""
+    context = current_job()
+    if context is None:
+        return
+    context.report(done, total, stage)
+    if not context.uninterruptible:
+        context.throttle()
+
+
+@contextmanager
+def uninterruptible():
+    """
+    Étape à terminer au plus vite une fois commencée (données publiées incomplètes entre-temps) :
+    ni annulation ni pause ; une annulation demandée prend effet au premier checkpoint() qui suit.
+    """
+    context = current_job()
+    if context is None:
+        yield
+        return
+    context.uninterruptible += 1
+    try:
+        yield
+    finally:
+        context.uninterruptible -= 1
+
+
+def worker_threads(default):
+    """Nombre de threads d'une commande, limité pendant une tâche de fond."""
+    return min(default, config()['MAX_THREADS']) if current_job() is not None else default
+
+
+# --- Côté processus de travail ---
+
+class TailBuffer(io.StringIO):
+    """Sortie de la commande, dont seule la fin est conservée."""
+
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+
+    def tail(self):
+        return self.getvalue()[-self.limit:]
+
+
+def lower_priority():
+    """CPU (nice) et disque (ionice idle) du processus de travail, avant toute tâche."""
+    options = config()
+    if options['NICE']:
+        try:
+            os.nice(options['NICE'])
+        except OSError:
+            logger.warning("Priorité CPU inchangée", exc_info=True)
+    if options['IO_IDLE']:
+        try:
+            subprocess.run(['ionice', '-c', '3', '-p', str(os.getpid())], check=True, capture_output=True)
+        except (OSError, subprocess.CalledProcessError):
+            logger.warning("ionice indisponible : priorité disque inchangée")
+
+
+def fail_stale_jobs():
+    """Tâches en cours dont le processus ne donne plus de nouvelles (arrêté, tué)."""
+    deadline = timezone.now() - timedelta(seconds=config()['STALE_AFTER'])
+    return Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=deadline).update(
+        status=Job.FAILED, error="Processus de travail perdu.", finished_at=timezone.now(),
+    )
+
+
+def claim_next(worker):
+    """Prend la plus ancienne tâche en attente ; plusieurs processus peuvent se partager la file."""
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.QUEUED).order_by('created_at', 'id').first()
+        )
+        if job is None:
+            return None
+        now = timezone.now()
+        job.status, job.worker, job.started_at, job.heartbeat_at = Job.RUNNING, worker, now, now
+        job.save(update_fields=['status', 'worker', 'started_at', 'heartbeat_at'])
+        return job
+
+
+class Heartbeat(threading.Thread):
+    """Met à jour heartbeat_at tant que la tâche tourne (sa propre connexion à la base)."""
+
+    def __init__(self, job_id):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(config()['HEARTBEAT_SECONDS']):
+                try:
+                    Job.objects.filter(pk=self.job_id).update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    logger.warning("Signal de vie de la tâche %s non enregistré", self.job_id, exc_info=True)
+                    connection.close()
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job):
+    command, _ = COMMANDS[job.kind]
+    output = TailBuffer(config()['OUTPUT_CHARS'])
+    delay = config()['VACUUM_COST_DELAY_MS']
+    if delay and connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SET vacuum_cost_delay = %s", [delay])
+
+    _local.context = JobContext(job)
+    heartbeat = Heartbeat(job.pk)
+    heartbeat.start()
+    try:
+        call_command(command, stdout=output, stderr=output, **job.options)
+        job.status, job.progress = Job.SUCCEEDED, 1.0
+    except JobCancelled:
+        job.status = Job.CANCELLED
+    except Exception:
+        logger.exception("Échec de la tâche %s", job)
+        job.status, job.error = Job.FAILED, traceback.format_exc()
+    finally:
+        _local.context = None
+        heartbeat.stop()
+
+    job.output = output.tail()
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'progress', 'error', 'output', 'finished_at'])
+    return job
+
+
+def work(poll_seconds=None, once=False):
+    """Boucle d'un processus de travail."""
+    poll_seconds = poll_seconds or config()['POLL_SECONDS']
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    lower_priority()
+    while True:
+        fail_stale_jobs()
+        job = claim_next(worker)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_seconds)
+            continue
+        logger.info("Tâche %s prise par %s", job, worker)
+        run_job(job)
+        logger.info("Tâche %s terminée : %s", job, job.status)
@@ -0,0 +1,33 @@
+import importlib
+import threading
+
+
+class LazyModule:
+    """
+    Module importé seulement au premier accès à l'un de ses attributs.
+    Évite de payer l'import des dépendances lourdes (NumPy, Levenshtein, ...) au démarrage
+    de chaque worker ou commande qui n'en a pas besoin.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        state = 'chargé' if self._module is not None else 'non chargé'
+        return f'<LazyModule {self._name} ({state})>'
+
+
+def lazy_import(name):
+    return LazyModule(name)
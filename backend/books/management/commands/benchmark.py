@@ -0,0 +1,233 @@
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from books.models import Book, InvertedIndex
+from books.query_cache import query_cache
+from books.synthetic_corpus import FUNCTION_WORDS, build_vocabulary, generate_corpus, write_catalog
+
+# Répartition fixe des requêtes selon la fréquence des termes (tête / milieu / queue de la loi de Zipf)
+QUERY_MIX = {'head': 0.2, 'torso': 0.5, 'tail': 0.3}
+
+# Endpoints mesurés : nom -> fonction construisant l'URL à partir de deux termes
+SEARCH_ENDPOINTS = {
+    'exact': lambda term, other: f'/api/search/{term}/all/',
+    'ranked': lambda term, other: f'/api/ranked_book_search/?word={term}',
+    'closeness': lambda term, other: f'/api/search/closeness/?word={term}',
+    'regex': lambda term, other: f'/api/search/advanced/?pattern={term}|{other}',
+    'suggestions': lambda term, other: f'/api/search/suggestions/{term[:-1]}e/',
+}
+
+
+def percentile(sorted_values, p):
+    """Percentile par rang le plus proche sur une liste déjà triée."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'mean_ms': sum(values) / len(values) if values else None,
+        'p50_ms': percentile(values, 50),
+        'p95_ms': percentile(values, 95),
+        'p99_ms': percentile(values, 99),
+        'max_ms': values[-1] if values else None,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the indexing and search benchmark suite on a synthetic corpus, in a throwaway test database, "
+        "and write the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000], help="Tailles de corpus (nombre de livres), ex: 1000 10000 100000.")
+        parser.add_argument('--min-words', type=int, default=10000, help="Nombre minimum de mots par livre.")
+        parser.add_argument('--max-words', type=int, default=30000, help="Nombre maximum de mots par livre.")
+        parser.add_argument('--vocabulary', type=int, default=50000, help="Taille du vocabulaire synthétique.")
+        parser.add_argument('--seed', type=int, default=0, help="Graine aléatoire (corpus et requêtes reproductibles).")
+        parser.add_argument('--queries', type=int, default=20, help="Nombre de requêtes par endpoint.")
+        parser.add_argument('--repeat', type=int, default=3, help="Répétitions à chaud de chaque requête (après l'appel à froid).")
+        parser.add_argument('--trace-memory', action='store_true', help="Mesurer le pic d'allocation Python avec tracemalloc (ralentit les mesures).")
+        parser.add_argument('--keepdb', action='store_true', help="Conserver la base de test entre deux exécutions.")
+        parser.add_argument('--output', default='benchmark_results.json', help="Fichier JSON de résultats.")
+
+    def handle(self, *args, **options):
+        if len(options['sizes']) > 1:
+            # ru_maxrss est le pic du processus entier : chaque taille est mesurée dans son propre processus,
+            # sinon les pics mémoire des tailles successives seraient cumulés.
+            runs = [self.run_in_subprocess(size, options) for size in options['sizes']]
+        else:
+            setup_test_environment()
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+            try:
+                runs = [self.run_size(size, options) for size in options['sizes']]
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+                teardown_test_environment()
+
+        report = {
+            'meta': self.metadata(options),
+            'runs': runs,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['output']}."))
+
+    def run_in_subprocess(self, size, options):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, 'run.json')
+            arguments = [
+                sys.executable, '-m', 'django', 'benchmark', '--sizes', str(size), '--output', output,
+                '--min-words', str(options['min_words']), '--max-words', str(options['max_words']),
+                '--vocabulary', str(options['vocabulary']), '--seed', str(options['seed']),
+                '--queries', str(options['queries']), '--repeat', str(options['repeat']),
+            ]
+            arguments += ['--trace-memory'] * options['trace_memory'] + ['--keepdb'] * options['keepdb']
+            subprocess.run(arguments, cwd=settings.BASE_DIR, check=True)  # DJANGO_SETTINGS_MODULE hérité
+            with open(output, encoding='utf-8') as result:
+                return json.load(result)['runs'][0]
+
+    def metadata(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'parameters': {key: options[key] for key in ('sizes', 'min_words', 'max_words', 'vocabulary', 'seed', 'queries', 'repeat')},
+        }
+
+    def measure(self, function, trace_memory):
+        """
+        Exécute une étape et retourne sa durée, le pic RSS du processus (une taille de corpus par processus :
+        le pic d'une étape inclut celui des étapes précédentes de la même taille) et, en option, le pic tracemalloc.
+        """
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        function()
+        duration = time.perf_counter() - start
+        result = {
+            'seconds': duration,
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+        if trace_memory:
+            result['python_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return result
+
+    def run_size(self, size, options):
+        self.stdout.write(f"Benchmark sur {size} livres...")
+        with connection.cursor() as cursor:
+            cursor.execute("TRUNCATE TABLE books_book, books_author, books_invertedindex RESTART IDENTITY CASCADE")
+        cache.clear()
+        query_cache.clear_local()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            catalog_path = os.path.join(tmpdir, 'catalog.jsonl')
+            books = generate_corpus(
+                size,
+                vocabulary_size=options['vocabulary'],
+                words_per_book=(options['min_words'], options['max_words']),
+                seed=options['seed'],
+            )
+            generation = self.measure(lambda: write_catalog(catalog_path, books), False)
+
+            importing = self.measure(lambda: call_command(
+                'import_books', catalog=catalog_path, max_books=size, min_words=0, max_words=10 ** 9, stdout=io.StringIO(),
+            ), options['trace_memory'])
+
+        total_words = sum(len(text.split()) for text in Book.objects.values_list('text', flat=True).iterator())
+        book_count = Book.objects.count()
+        importing['books_per_second'] = book_count / importing['seconds']
+        importing['words_per_second'] = total_words / importing['seconds']
+
+        indexing = self.measure(lambda: call_command('index_books', stdout=io.StringIO()), options['trace_memory'])
+        indexing['books_per_second'] = book_count / indexing['seconds']
+        indexing['words_per_second'] = total_words / indexing['seconds']
+        indexing['terms'] = InvertedIndex.objects.count()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_total_relation_size('books_invertedindex')")
+            indexing['index_table_bytes'] = cursor.fetchone()[0]
+
+        return {
+            'books': book_count,
+            'words': total_words,
+            'generate': generation,
+            'import': importing,
+            'index': indexing,
+            'search': self.run_queries(options),
+        }
+
+    def query_terms(self, options):
+        """Tire un jeu de termes fixe (reproductible) selon QUERY_MIX."""
+        vocabulary = build_vocabulary(options['vocabulary'])[len(FUNCTION_WORDS):]
+        bands = {
+            'head': vocabulary[:100],
+            'torso': vocabulary[100:len(vocabulary) // 10],
+            'tail': vocabulary[len(vocabulary) // 2:],
+        }
+        rng = random.Random(options['seed'])
+        terms = []
+        for band, share in QUERY_MIX.items():
+            count = max(1, round(options['queries'] * share))
+            terms.extend((band, rng.choice(bands[band]), rng.choice(bands[band])) for _ in range(count))
+        return terms
+
+    def run_queries(self, options):
+        client = Client()
+        terms = self.query_terms(options)
+        results = {}
+        for endpoint, build_url in SEARCH_ENDPOINTS.items():
+            cold, warm, errors, by_band = [], [], 0, {band: [] for band in QUERY_MIX}
+            for band, term, other in terms:
+                url = build_url(term, other)
+                # Appel à froid : ni le cache partagé ni le LRU du processus ne doivent répondre
+                cache.clear()
+                query_cache.clear_local()
+                for attempt in range(options['repeat'] + 1):
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    elapsed = (time.perf_counter() - start) * 1000
+                    if response.status_code >= 500:
+                        errors += 1
+                    if attempt == 0:
+                        cold.append(elapsed)
+                        by_band[band].append(elapsed)
+                    else:
+                        warm.append(elapsed)
+            results[endpoint] = {
+                'cold': summarize(cold),
+                'warm': summarize(warm),
+                'cold_by_band': {band: summarize(values) for band, values in by_band.items() if values},
+                'server_errors': errors,
+            }
+            self.stdout.write(f"  {endpoint}: p50 à froid {results[endpoint]['cold']['p50_ms']:.1f} ms")
+        return results
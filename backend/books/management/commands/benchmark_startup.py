@@ -0,0 +1,89 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Commandes dont on mesure le temps de démarrage (--help charge le module sans rien exécuter)
+COMMANDS = ['index_books', 'import_books', 'benchmark', 'check']
+
+# Démarrage d'un worker : import de l'application WSGI puis première réponse (sans base de données)
+WORKER_BOOT = """
+import os, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mygutenberg.settings')
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+loaded = time.perf_counter()
+from django.test import Client
+from django.test.utils import setup_test_environment
+setup_test_environment()
+response = Client().get({url!r})
+print(loaded - start, time.perf_counter() - start, response.status_code)
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure manage.py command startup time and worker boot time (time to first response)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help="Nombre de mesures par cas (la médiane est retenue).")
+        parser.add_argument('--url', default='/api/search/autocomplete/a/', help="URL de la première requête du worker.")
+        parser.add_argument('--importtime', action='store_true', help="Ajouter les imports les plus coûteux du worker (python -X importtime).")
+        parser.add_argument('--output', default='benchmark_startup.json', help="Fichier JSON de résultats.")
+
+    def run(self, args, **kwargs):
+        start = time.perf_counter()
+        completed = subprocess.run(args, cwd=settings.BASE_DIR, capture_output=True, text=True, check=True, **kwargs)
+        return time.perf_counter() - start, completed
+
+    def handle(self, *args, **options):
+        manage = os.path.join(settings.BASE_DIR, 'manage.py')
+        results = {'commands': {}, 'worker': {}}
+
+        for command in COMMANDS:
+            timings = [self.run([sys.executable, manage, command, '--help'])[0] for _ in range(options['repeat'])]
+            results['commands'][command] = {'median_s': statistics.median(timings), 'min_s': min(timings)}
+            self.stdout.write(f"{command} --help : {results['commands'][command]['median_s'] * 1000:.0f} ms")
+
+        boot = WORKER_BOOT.format(url=options['url'])
+        loads, firsts, totals = [], [], []
+        for _ in range(options['repeat']):
+            total, completed = self.run([sys.executable, '-c', boot])
+            load, first, status_code = completed.stdout.split()[-3:]
+            loads.append(float(load))
+            firsts.append(float(first))
+            totals.append(total)
+        results['worker'] = {
+            'url': options['url'],
+            'status': int(status_code),
+            'wsgi_load_median_s': statistics.median(loads),
+            'first_response_median_s': statistics.median(firsts),
+            'process_total_median_s': statistics.median(totals),
+        }
+        self.stdout.write(
+            f"Worker : application chargée en {results['worker']['wsgi_load_median_s'] * 1000:.0f} ms, "
+            f"première réponse à {results['worker']['first_response_median_s'] * 1000:.0f} ms"
+        )
+
+        if options['importtime']:
+            _, completed = self.run([sys.executable, '-X', 'importtime', '-c', boot])
+            results['worker']['slowest_imports'] = self.slowest_imports(completed.stderr)
+
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(results, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['output']}."))
+
+    def slowest_imports(self, importtime_output, limit=15):
+        """Extrait les modules au temps d'import cumulé le plus élevé de la sortie de -X importtime."""
+        imports = []
+        for line in importtime_output.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, module = (part.strip() for part in line[len('import time:'):].split('|'))
+            imports.append({'module': module.strip(), 'cumulative_us': int(cumulative)})
+        return sorted(imports, key=lambda entry: entry['cumulative_us'], reverse=True)[:limit]
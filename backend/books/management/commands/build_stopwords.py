@@ -0,0 +1,31 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from books.analysis import LANGUAGE_NAMES, STOPWORDS_PATH
+
+
+class Command(BaseCommand):
+    help = "Compile NLTK stopword lists into books/data/stopwords.json (run once, then commit the file)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--download', action='store_true', help="Télécharger le corpus NLTK s'il est absent.")
+
+    def handle(self, *args, **options):
+        import nltk
+        from nltk.corpus import stopwords
+
+        if options['download']:
+            nltk.download('stopwords', quiet=True)
+
+        lists = {}
+        for language, nltk_name in LANGUAGE_NAMES.items():
+            try:
+                lists[language] = sorted(set(stopwords.words(nltk_name)))
+            except (LookupError, OSError) as e:
+                raise CommandError(f"Corpus NLTK indisponible ({e}). Relancer avec --download.")
+
+        STOPWORDS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(STOPWORDS_PATH, 'w', encoding='utf-8') as artifact:
+            json.dump(lists, artifact, ensure_ascii=False, indent=0, sort_keys=True)
+
+        total = sum(len(words) for words in lists.values())
+        self.stdout.write(self.style.SUCCESS(f"{total} stopwords ({len(lists)} langues) écrits dans {STOPWORDS_PATH}."))
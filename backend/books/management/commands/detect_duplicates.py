@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+
+from books.fingerprint import HAMMING_THRESHOLD, DuplicateDetector, simhash, to_signed, to_unsigned
+from books.jobs import checkpoint
+from books.models import Book
+
+BATCH_SIZE = 200
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute missing SimHash fingerprints and link near-duplicate editions (duplicate_of) across the whole "
+        "catalogue, the oldest book of each group being the canonical one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=int, default=HAMMING_THRESHOLD, help="Distance de Hamming maximale entre deux éditions.")
+        parser.add_argument('--relink', action='store_true', help="Recalculer tous les liens (sinon seuls les livres non liés sont examinés).")
+
+    def handle(self, *args, **options):
+        fingerprinted = self.fingerprint_missing()
+
+        # Parcours par id croissant : chaque livre est comparé aux livres canoniques plus anciens
+        detector = DuplicateDetector(threshold=options['threshold'])
+        rows = list(Book.objects.filter(simhash__isnull=False).order_by('id').values_list('id', 'simhash', 'duplicate_of'))
+
+        # Sans --relink, les liens existants sont conservés et un livre qui a déjà des éditions reste canonique
+        keep = set() if options['relink'] else set(
+            Book.objects.filter(duplicate_of__isnull=False).values_list('duplicate_of', flat=True).distinct()
+        )
+
+        changed = []
+        for done, (book_id, fingerprint, duplicate_of) in enumerate(rows, 1):
+            if done % BATCH_SIZE == 0:
+                checkpoint(done, len(rows), "Liens entre éditions")
+            if duplicate_of is not None and not options['relink']:
+                continue
+            fingerprint = to_unsigned(fingerprint)
+            canonical = None if book_id in keep else detector.find(fingerprint)
+            if canonical is None:
+                detector.add(book_id, fingerprint)
+            if canonical != duplicate_of:
+                changed.append(Book(id=book_id, duplicate_of_id=canonical))
+            if len(changed) >= BATCH_SIZE:
+                Book.objects.bulk_update(changed, ['duplicate_of'])
+                changed = []
+        Book.objects.bulk_update(changed, ['duplicate_of'])
+
+        linked = Book.objects.filter(duplicate_of__isnull=False).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Empreintes calculées : {fingerprinted} | éditions liées à un livre canonique : {linked}."
+        ))
+
+    def fingerprint_missing(self):
+        """SimHash des livres importés avant son introduction (texte lu par lots)."""
+        ids = list(Book.objects.filter(simhash__isnull=True, text__isnull=False).values_list('id', flat=True))
+        for start in range(0, len(ids), BATCH_SIZE):
+            batch = Book.objects.filter(id__in=ids[start:start + BATCH_SIZE]).only('id', 'text')
+            updated = [Book(id=book.id, simhash=to_signed(simhash(book.text))) for book in batch if book.text]
+            Book.objects.bulk_update(updated, ['simhash'])
+            checkpoint(start + BATCH_SIZE, len(ids), "Empreintes SimHash")
+        return len(ids)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from books.synthetic_corpus import generate_corpus, write_catalog
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic Gutenberg-like catalog (JSON Lines) usable with import_books --catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Chemin du catalogue JSON Lines à écrire.")
+        parser.add_argument('--books', type=int, default=1000, help="Nombre de livres à générer.")
+        parser.add_argument('--vocabulary', type=int, default=50000, help="Taille du vocabulaire.")
+        parser.add_argument('--min-words', type=int, default=10000, help="Nombre minimum de mots par livre.")
+        parser.add_argument('--max-words', type=int, default=30000, help="Nombre maximum de mots par livre.")
+        parser.add_argument('--zipf', type=float, default=1.07, help="Exposant de la loi de Zipf.")
+        parser.add_argument('--seed', type=int, default=0, help="Graine aléatoire (corpus reproductible).")
+
+    def handle(self, *args, **options):
+        books = generate_corpus(
+            options['books'],
+            vocabulary_size=options['vocabulary'],
+            words_per_book=(options['min_words'], options['max_words']),
+            exponent=options['zipf'],
+            seed=options['seed'],
+        )
+        count = write_catalog(options['output'], books)
+        self.stdout.write(self.style.SUCCESS(f"{count} livres synthétiques écrits dans {options['output']}."))
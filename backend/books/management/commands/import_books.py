@@ -1,3 +1,4 @@
+import hashlib
 import requests
 import concurrent.futures
 import re
@@ -5,128 +6,250 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from books.models import Book, Author
 from tqdm import tqdm
+from books.synthetic_corpus import read_catalog
+from books.fingerprint import DuplicateDetector, simhash, to_signed
+from books.jobs import checkpoint
 
 GUTENDEX_API = "https://gutendex.com/books/"
 MAX_BOOKS = 1664
 MAX_WORKERS = 200  # Ajuste en fonction de la capacité de ton système
 MIN_WORDS = 10000  # Seuil minimum de mots
 MAX_WORDS = 30000  # Seuil maximum de mots
+CHUNK_SIZE = 64 * 1024  # Taille des blocs lus sur le flux HTTP
+
+# Marqueurs Project Gutenberg (le titre entre les astérisques peut être coupé sur plusieurs lignes)
+START_MARKER = re.compile(r"\*\*\*\s*START OF (THE|THIS) PROJECT GUTENBERG")
+END_MARKER = re.compile(r"\*\*\*\s*END OF (THE|THIS) PROJECT GUTENBERG")
+
+
+class TextTooLong(Exception):
+    """Le texte dépasse le nombre maximum de mots : la lecture du flux est interrompue."""
+
 
 class Command(BaseCommand):
     help = "Import books from Gutendex API and store them in the database."
 
     def fetch_book_text(self, book):
+        """Télécharge le texte en flux : retourne (texte nettoyé, nombre de mots) ou None."""
         text_url = book['formats'].get("text/plain; charset=us-ascii") or book['formats'].get("text/plain")
         if not text_url:
             return None
 
         try:
-            text_response = requests.get(text_url, timeout=3)
-            text_response.raise_for_status()
-            text = text_response.text
-            
-            # Nettoyage du texte
-            text = text.replace("\ufeff", "")
-            text = re.sub(r"\*\*\* START OF (THE|THIS) PROJECT GUTENBERG.*?\*\*\*", "", text, flags=re.S)
-            text = re.sub(r"\*\*\* END OF (THE|THIS) PROJECT GUTENBERG.*?\*\*\*", "", text, flags=re.S)
-            
-            return text.strip()
-        except requests.exceptions.RequestException:
+            with requests.get(text_url, timeout=3, stream=True) as text_response:
+                text_response.raise_for_status()
+                if text_response.encoding is None:
+                    text_response.encoding = 'utf-8'
+                # Fermer la réponse avant la fin abandonne le reste du téléchargement
+                return self.clean_lines(text_response.iter_lines(chunk_size=CHUNK_SIZE, decode_unicode=True))
+        except (requests.exceptions.RequestException, TextTooLong):
             return None
 
-    def handle(self, *args, **kwargs):
-        books_imported = 0
+    def clean_lines(self, lines):
+        """
+        Retire le BOM et l'en-tête / le pied de page Project Gutenberg en un seul passage sur les lignes,
+        en comptant les mots au fil de l'eau. Lève TextTooLong dès que self.max_words est dépassé ;
+        la lecture s'arrête au marqueur de fin (la licence qui suit n'est pas téléchargée).
+        """
+        header, body = [], []
+        header_words = body_words = 0
+        started = in_start_marker = False
+
+        for line in lines:
+            if not started:
+                if START_MARKER.search(line):
+                    started = True
+                    in_start_marker = line.count('***') < 2
+                    continue
+                line = line.replace("\ufeff", "")
+                header.append(line)
+                header_words += len(line.split())
+                # Aucun en-tête réel n'est aussi long : sans marqueur, tout le fichier compte
+                if header_words > self.max_words:
+                    raise TextTooLong()
+                continue
+
+            if in_start_marker:
+                # Suite du titre du marqueur de début, jusqu'aux astérisques de fermeture
+                in_start_marker = '***' not in line
+                continue
+            if END_MARKER.search(line):
+                break
+            body.append(line)
+            body_words += len(line.split())
+            if body_words > self.max_words:
+                raise TextTooLong()
+
+        if not started:
+            body, body_words = header, header_words
+        return "\n".join(body).strip(), body_words
+
+    def fetch_pages(self):
+        """Parcourt le catalogue Gutendex page par page et télécharge les textes en parallèle."""
         page = 1
+        while True:
+            try:
+                response = requests.get(GUTENDEX_API, params={"languages": "en", "page": page}, timeout=10)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                self.stdout.write(self.style.ERROR(f"API Error: {e}"))
+                return
+
+            data = response.json()
+            books = data.get("results", [])
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                # Préparer les textes des livres de manière concurrente
+                book_texts = list(executor.map(self.fetch_book_text, books))
+
+            yield books, book_texts
+
+            if not data.get("next"):
+                return
+            page += 1
+
+    def read_catalog_pages(self, path):
+        """Lit un catalogue local (JSON Lines, textes inclus) : import hors-ligne, utilisé par les benchmarks."""
+        for books in read_catalog(path):
+            book_texts = [self.clean_catalog_text(book.pop('text', None)) for book in books]
+            yield books, book_texts
+
+    def clean_catalog_text(self, text):
+        if not text:
+            return None
+        try:
+            return self.clean_lines(text.splitlines())
+        except TextTooLong:
+            return None
+
+    def add_arguments(self, parser):
+        parser.add_argument('--catalog', help="Catalogue local JSON Lines (format Gutendex avec le champ 'text') à importer au lieu de l'API.")
+        parser.add_argument('--max-books', type=int, default=MAX_BOOKS, help="Nombre maximum de livres à importer.")
+        parser.add_argument('--min-words', type=int, default=MIN_WORDS, help="Nombre minimum de mots par livre.")
+        parser.add_argument('--max-words', type=int, default=MAX_WORDS, help="Nombre maximum de mots par livre.")
+        parser.add_argument(
+            '--duplicates', choices=['skip', 'link', 'keep'], default='link',
+            help="Éditions quasi identiques (SimHash) : ne pas les importer, les lier au livre canonique (duplicate_of), ou les garder telles quelles.",
+        )
+
+    def handle(self, *args, **options):
+        max_books = options['max_books']
+        self.max_words = options['max_words']
+        books_imported = 0
         authors_to_create = []
         books_to_create = []
-
-        with tqdm(total=MAX_BOOKS, desc="Importing books", ncols=100) as pbar:
-            while books_imported < MAX_BOOKS:
-                try:
-                    response = requests.get(GUTENDEX_API, params={"languages": "en", "page": page}, timeout=10)
-                    response.raise_for_status()
-                except requests.exceptions.RequestException as e:
-                    self.stdout.write(self.style.ERROR(f"API Error: {e}"))
+        book_author_names = []
+        duplicate_links = []  # (édition, livre canonique : id en base ou Book en attente de création)
+        duplicates_skipped = 0
+        detector = DuplicateDetector.from_database()
+
+        if options['catalog']:
+            pages = self.read_catalog_pages(options['catalog'])
+        else:
+            pages = self.fetch_pages()
+
+        with tqdm(total=max_books, desc="Importing books", ncols=100) as pbar:
+            for books, book_texts in pages:
+                if books_imported >= max_books:
                     break
 
-                data = response.json()
-                books = data.get("results", [])
-
-                with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-                    # Préparer les textes des livres de manière concurrente
-                    book_texts = list(executor.map(self.fetch_book_text, books))
-
-                    # Traiter les livres et auteurs
-                    with transaction.atomic():
-                        for book, text in zip(books, book_texts):
-                            if books_imported >= MAX_BOOKS:
-                                break
-
-                            # Vérifier si le livre a plus de MIN_WORDS mots
-                            if text is None:
-                                continue  # Ignorer ce livre si le texte est indisponible
-
-                            word_count = len(text.split())
-
-                            if word_count < MIN_WORDS or word_count > MAX_WORDS:
+                # Traiter les livres et auteurs
+                with transaction.atomic():
+                    for book, fetched in zip(books, book_texts):
+                        if books_imported >= max_books:
+                            break
+
+                        # Texte indisponible ou trop long (téléchargement interrompu)
+                        if fetched is None:
+                            continue
+
+                        # Vérifier si le livre a plus de MIN_WORDS mots (compté pendant la lecture)
+                        text, word_count = fetched
+                        if word_count < options['min_words']:
+                            continue
+
+                        # Vérifier si le livre existe déjà dans la base de données
+                        is_new = text and not Book.objects.filter(gutenberg_id=book['id']).exists()
+                        if is_new:
+                            fingerprint = simhash(text)
+                            canonical = detector.find(fingerprint) if options['duplicates'] != 'keep' else None
+                            # Quasi-doublon ignoré : ni le livre ni son auteur ne sont importés
+                            if canonical is not None and options['duplicates'] == 'skip':
+                                duplicates_skipped += 1
                                 continue
 
-                            # Traiter l'auteur
-                            authors = book.get('authors', [])
-                            author_data = authors[0] if authors else {'name': 'Unknown'}
-
-                            # Ajouter l'auteur à la liste (pas encore en base de données)
-                            authors_to_create.append({
-                                'name': author_data.get('name', 'Unknown'),
-                                'birth_year': author_data.get('birth_year'),
-                                'death_year': author_data.get('death_year')
-                            })
-
-                            # Vérifier si le livre existe déjà dans la base de données
-                            if not Book.objects.filter(gutenberg_id=book['id']).exists():
-                                if text:
-                                    summary = book.get('summaries', [None])[0] if book.get('summaries') else None
-                                    
-                                    books_to_create.append(Book(
-                                        gutenberg_id=book['id'],
-                                        title=book['title'],
-                                        author=None,  # Le lien avec l'auteur sera mis à jour plus tard
-                                        subjects=book.get('subjects', []),
-                                        bookshelves=book.get('bookshelves', []),
-                                        formats=book.get('formats', {}),
-                                        media_type=book.get('media_type'),
-                                        copyright=book.get('copyright', False),
-                                        download_count=book.get('download_count', 0),
-                                        languages=','.join(book.get('languages', [])),
-                                        translators=book.get('translators', []),
-                                        text=text,
-                                        summary=summary
-                                    ))
-
-                                    books_imported += 1
-                                    pbar.update(1)
-
-                page += 1
+                        # Traiter l'auteur
+                        authors = book.get('authors', [])
+                        author_data = authors[0] if authors else {'name': 'Unknown'}
+
+                        # Ajouter l'auteur à la liste (pas encore en base de données)
+                        authors_to_create.append({
+                            'name': author_data.get('name', 'Unknown'),
+                            'birth_year': author_data.get('birth_year'),
+                            'death_year': author_data.get('death_year')
+                        })
+
+                        if is_new:
+                            summary = book.get('summaries', [None])[0] if book.get('summaries') else None
+
+                            new_book = Book(
+                                gutenberg_id=book['id'],
+                                title=book['title'],
+                                author=None,  # Le lien avec l'auteur sera mis à jour plus tard
+                                subjects=book.get('subjects', []),
+                                bookshelves=book.get('bookshelves', []),
+                                formats=book.get('formats', {}),
+                                media_type=book.get('media_type'),
+                                copyright=book.get('copyright', False),
+                                download_count=book.get('download_count', 0),
+                                languages=','.join(book.get('languages', [])),
+                                translators=book.get('translators', []),
+                                text=text,
+                                text_md5=hashlib.md5(text.encode('utf-8')).hexdigest(),
+                                summary=summary,
+                                simhash=to_signed(fingerprint),
+                            )
+                            books_to_create.append(new_book)
+                            if canonical is None:
+                                detector.add(new_book, fingerprint)
+                            else:
+                                duplicate_links.append((new_book, canonical))
+
+                            book_author_names.append(author_data.get('name', 'Unknown'))
+
+                            books_imported += 1
+                            pbar.update(1)
+
+                # Hors de la transaction du lot : avancement visible, pause éventuelle (tâche de fond)
+                checkpoint(books_imported, max_books, "Import des livres")
 
         # Après avoir créé les auteurs et livres, faire un bulk_create
         with transaction.atomic():
             # Créer les auteurs en masse
-            authors = []
+            authors = {}
             for author_data in authors_to_create:
                 author, created = Author.objects.update_or_create(
                     name=author_data['name'],
                     defaults=author_data
                 )
-                authors.append(author)  # Stocker les auteurs pour les lier aux livres
+                authors[author.name] = author  # Stocker les auteurs pour les lier aux livres
 
             # Mettre à jour les auteurs des livres
-            for book in books_to_create:
-                # Associer l'auteur correct à chaque livre
-                author = next((a for a in authors if a.name == book.title), None)
+            for book, author_name in zip(books_to_create, book_author_names):
+                # Associer l'auteur correct à chaque livre (recherche en O(1) par nom)
+                author = authors.get(author_name)
                 if author:
                     book.author = author
 
             # Créer les livres en masse
             Book.objects.bulk_create(books_to_create)
 
+            # Les ids des livres canoniques créés dans ce même import ne sont connus qu'après bulk_create
+            for edition, canonical in duplicate_links:
+                edition.duplicate_of_id = canonical if isinstance(canonical, int) else canonical.id
+            Book.objects.bulk_update([edition for edition, _ in duplicate_links], ['duplicate_of'], batch_size=500)
+
         self.stdout.write(self.style.SUCCESS(f"Import completed: {books_imported} books imported."))
+        self.stdout.write(
+            f"Quasi-doublons : {len(duplicate_links)} liés, {duplicates_skipped} ignorés (--duplicates {options['duplicates']})."
+        )
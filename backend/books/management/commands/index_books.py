@@ -1,104 +1,134 @@
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from books.models import Book, InvertedIndex
-import re
+import time
 from tqdm import tqdm
-import nltk
-from nltk.corpus import stopwords
 from django.db import transaction, connection
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 import json
 from psycopg2.extras import execute_values
+from books.proximity import encode_positions, closeness_score
+from books.analysis import DEFAULT_LANGUAGE, book_languages, get_analyzer, load_stopwords, write_index_analysis
+from books.term_dictionary import write_term_dictionary
+from books.segments import write_segment
+from books.shards import build_shards, remove_manifest
+from django.conf import settings
+from books.facets import write_facets
+from books.snippets import encode_offsets
+from books.topk import static_quality
+from books.jobs import checkpoint, uninterruptible, worker_threads
+from books.corpus_stats import record_snapshot, refresh_catalog_statistics, refresh_term_statistics
 
 
 class Command(BaseCommand):
     help = "Index existing books in the database."
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.stopwords_cache = {}
-        try:
-            nltk.download('stopwords', quiet=True)
-            self.initialize_stopwords()
-        except Exception as e:
-            self.stdout.write(self.style.WARNING(f"Attention: Impossible de charger les stopwords NLTK: {str(e)}"))
-            self.stopwords_cache = defaultdict(set)
-
-    def initialize_stopwords(self):
-        lang_map = {
-            'en': 'english', 'fr': 'french', 'es': 'spanish', 'de': 'german',
-            'it': 'italian', 'pt': 'portuguese', 'nl': 'dutch'
-        }
-        for lang_code, nltk_name in lang_map.items():
-            try:
-                self.stopwords_cache[lang_code] = set(stopwords.words(nltk_name))
-            except Exception:
-                self.stopwords_cache[lang_code] = set()
-
-    def handle(self, *args, **kwargs):
-        # Réinitialisation complète des tables
-        with connection.cursor() as cursor:
-            cursor.execute("TRUNCATE TABLE books_invertedindex_books, books_invertedindex RESTART IDENTITY CASCADE")
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, default=settings.BOOKS_SHARDS['COUNT'], help="Nombre de shards (plages d'ids de livres) construits en parallèle.")
+        parser.add_argument('--no-warm', action='store_true', help="Ne pas préchauffer les caches après l'indexation.")
+        parser.add_argument('--no-stemming', action='store_true', help="Désactiver la racinisation (comparaison de taille / durée d'indexation).")
+
+    def handle(self, *args, **options):
+        started_at = time.perf_counter()
+        self.analyzer_overrides = {'STEMMING': False} if options['no_stemming'] else {}
+        if not load_stopwords(DEFAULT_LANGUAGE):
+            self.stdout.write(self.style.WARNING("Aucun stopword disponible : lancer `manage.py build_stopwords --download` une fois."))
 
         books = Book.objects.all()
-        num_workers = 50  # Ajuster selon la config PostgreSQL
+        num_workers = worker_threads(50)  # Ajuster selon la config PostgreSQL (limité en tâche de fond)
         global_word_index = defaultdict(lambda: defaultdict(list))
-
-        # Étape 1 : Analyser les livres et construire l'index global
+        global_surfaces = Counter()
+        surface_document_frequency = Counter()  # Nombre de livres contenant chaque forme de surface
+
+        def collect(done):
+            for future in done:
+                book = futures[future]
+                try:
+                    word_positions, surfaces = future.result()
+                    for word, positions in word_positions.items():
+                        global_word_index[word][book.id] = positions
+                    global_surfaces.update(surfaces)
+                    surface_document_frequency.update({surface for _, surface in surfaces})
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"Erreur livre {book.id}: {str(e)}"))
+                pbar.update(1)
+
+        # Étape 1 : Analyser les livres et construire l'index global (l'index en base reste servi pendant ce temps)
+        futures = {}
         with tqdm(total=books.count(), desc="Analyzing books", ncols=100) as pbar:
             with ThreadPoolExecutor(max_workers=num_workers) as executor:
-                futures = {executor.submit(self.analyze_book, book): book for book in books if book.text and book.languages}
-                for future in as_completed(futures):
-                    book = futures[future]
-                    try:
-                        word_positions, new_positions = future.result()
-                        for word, positions in word_positions.items():
-                            global_word_index[word][book.id] = positions
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f"Erreur livre {book.id}: {str(e)}"))
-                    pbar.update(1)
+                in_flight = set()
+                for book in books:
+                    if not (book.text and book.languages):
+                        continue
+                    # Soumission au rythme des threads : la pause d'une tâche de fond ralentit réellement l'analyse
+                    if len(in_flight) >= 2 * num_workers:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    checkpoint(pbar.n, pbar.total, "Analyse des livres")
+                    future = executor.submit(self.analyze_book, book)
+                    futures[future] = book
+                    in_flight.add(future)
+                collect(as_completed(in_flight))
 
         total_words = len(global_word_index)
         if total_words == 0:
-            self.stdout.write(self.style.WARNING("Aucun mot à indexer."))
+            # Index publié (base, segment, dictionnaire, statistiques) laissé tel quel : aucun artefact divergent
+            self.stdout.write(self.style.WARNING("Aucun mot à indexer : index existant inchangé."))
             return
 
-        # Étape 2 : Insérer les mots dans la table books_invertedindex
-        word_to_id = {}
-        with tqdm(total=total_words, desc="Updating database", ncols=100) as pbar:
-            batch_size = 10000
-            current_batch = []
-
-            for word, book_positions in global_word_index.items():
-                positions_list = [
-                    {'book': book_id, 'positions': positions, 'occurrences': len(positions)}
-                    for book_id, positions in book_positions.items()
-                ]
-                total_occurrences = sum(len(positions) for positions in book_positions.values())
-                current_batch.append((word, json.dumps(positions_list), total_occurrences))
-
-                if len(current_batch) >= batch_size:
+        # Points de repère des extraits (positions en caractères des termes du texte)
+        Book.objects.bulk_update([book for book in futures.values() if book.text_offsets], ['text_offsets'], batch_size=200)
+
+        # Forme de surface la plus fréquente de chaque terme (affichée à la place de la racine)
+        surface_of = {}
+        for (word, surface), count in global_surfaces.most_common():
+            surface_of.setdefault(word, surface)
+
+        # Étapes 2 et 3 : l'index en base est vidé puis réécrit, avec les statistiques par terme du
+        # planificateur, dans une seule transaction ; les recherches lisent l'ancien index (et ses fréquences)
+        # jusqu'au COMMIT. Une fois commencées, elles ne sont ni annulées ni ralenties (tâche de fond) : la
+        # transaction reste courte.
+        with uninterruptible(), transaction.atomic():
+            self.clear_index()
+
+            # Étape 2 : Insérer les mots dans la table books_invertedindex
+            word_to_id = {}
+            with tqdm(total=total_words, desc="Updating database", ncols=100) as pbar:
+                batch_size = 10000
+                current_batch = []
+
+                for word, book_positions in global_word_index.items():
+                    positions_list = [
+                        self.build_posting(book_id, positions)
+                        for book_id, positions in book_positions.items()
+                    ]
+                    total_occurrences = sum(entry['occurrences'] for entry in positions_list)
+                    current_batch.append((word, surface_of.get(word, word), json.dumps(positions_list), total_occurrences))
+
+                    if len(current_batch) >= batch_size:
+                        self.insert_batch(current_batch, word_to_id)
+                        pbar.update(len(current_batch))
+                        current_batch = []
+                        checkpoint(pbar.n, total_words, "Écriture de l'index")
+
+                # Insérer le dernier batch s'il reste des éléments
+                if current_batch:
                     self.insert_batch(current_batch, word_to_id)
                     pbar.update(len(current_batch))
-                    current_batch = []
-
-            # Insérer le dernier batch s'il reste des éléments
-            if current_batch:
-                self.insert_batch(current_batch, word_to_id)
-                pbar.update(len(current_batch))
-
-        # Étape 3 : Insérer les relations dans books_invertedindex_books
-        book_relations = []
-        for word, book_positions in global_word_index.items():
-            if word in word_to_id:
-                index_id = word_to_id[word]
-                book_ids = list(book_positions.keys())
-                book_relations.extend((index_id, book_id) for book_id in book_ids)
-
-        if not book_relations:
-            self.stdout.write(self.style.WARNING("Aucune relation à insérer dans books_invertedindex_books."))
-        else:
-            with transaction.atomic():
+
+            # Étape 3 : Insérer les relations dans books_invertedindex_books
+            book_relations = []
+            for word, book_positions in global_word_index.items():
+                if word in word_to_id:
+                    index_id = word_to_id[word]
+                    book_ids = list(book_positions.keys())
+                    book_relations.extend((index_id, book_id) for book_id in book_ids)
+
+            if not book_relations:
+                self.stdout.write(self.style.WARNING("Aucune relation à insérer dans books_invertedindex_books."))
+            else:
                 with connection.cursor() as cursor:
                     execute_values(
                         cursor,
@@ -107,35 +137,96 @@ class Command(BaseCommand):
                         template="(%s, %s)",
                         page_size=1000
                     )
-            self.stdout.write(self.style.SUCCESS(f"{len(book_relations)} relations insérées dans books_invertedindex_books."))
+                self.stdout.write(self.style.SUCCESS(f"{len(book_relations)} relations insérées dans books_invertedindex_books."))
+
+            # Statistiques par terme (fréquences documentaires du planificateur) publiées avec l'index
+            terms_written, terms_removed = refresh_term_statistics(global_word_index, surface_of)
 
         # Étape 4 : Nettoyer et optimiser la base de données
         with connection.cursor() as cursor:
             cursor.execute("VACUUM ANALYZE books_invertedindex")
             cursor.execute("VACUUM ANALYZE books_invertedindex_books")
 
+        # Étape 5 : Segment binaire immuable (mmap partagé par les workers, publié sans redémarrage)
+        # Options d'analyse (racinisation...) et langues du corpus, relues par les requêtes
+        write_index_analysis(self.analyzer_overrides, Counter(book_languages(book.languages)[0] for book in futures.values()))
+        quality = static_quality(dict(Book.objects.values_list('id', 'download_count')))
+        segment_path = write_segment(global_word_index, quality=quality)
+        self.stdout.write(self.style.SUCCESS(f"Segment d'index publié : {segment_path}"))
+        if options['shards'] > 1:
+            shard_paths = build_shards(global_word_index, options['shards'], quality=quality)
+            self.stdout.write(self.style.SUCCESS(f"{len(shard_paths)} shards publiés (servis par `manage.py serve_shards`)."))
+        else:
+            remove_manifest()
+
+        # Étape 6 : Index des facettes (sujets, étagères, langues, copyright) de tous les livres
+        facet_values = write_facets(Book.objects.values('id', 'subjects', 'bookshelves', 'languages', 'copyright', 'download_count').iterator())
+        self.stdout.write(self.style.SUCCESS(f"Index des facettes : {facet_values} valeurs."))
+
+        # Étape 7 : Dictionnaire des termes pour l'autocomplétion (servi sans PostgreSQL)
+        term_count = write_term_dictionary(surface_document_frequency)
+        self.stdout.write(self.style.SUCCESS(f"Dictionnaire d'autocomplétion : {term_count} mots."))
+
+        # Étape 8 : Statistiques du catalogue et instantané du corpus (seules les lignes modifiées sont réécrites)
+        catalog_written, catalog_removed = refresh_catalog_statistics(
+            Book.objects.values('languages', 'author__name', 'subjects', 'bookshelves', 'copyright', 'download_count').iterator()
+        )
+        record_snapshot(global_word_index, len(futures))
+        self.stdout.write(self.style.SUCCESS(
+            f"Statistiques du corpus : {terms_written} termes et {catalog_written} valeurs du catalogue mis à jour, "
+            f"{terms_removed + catalog_removed} supprimés."
+        ))
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_total_relation_size('books_invertedindex'), pg_total_relation_size('books_invertedindex_books')")
+            index_bytes, relations_bytes = cursor.fetchone()
+
         self.stdout.write(self.style.SUCCESS(f"Indexation terminée : {total_words} mots indexés."))
+        self.stdout.write(
+            f"Racinisation : {'non' if options['no_stemming'] else 'oui'} | "
+            f"durée : {time.perf_counter() - started_at:.1f} s | "
+            f"taille de l'index : {(index_bytes + relations_bytes) / 1024 / 1024:.1f} Mo"
+        )
+
+        # Étape 9 : Préchauffage des caches (les résultats calculés sur l'ancien index sont remplacés)
+        if not options['no_warm'] and settings.BOOKS_CACHE_WARMING['AFTER_INDEXING']:
+            call_command('warm_caches', stdout=self.stdout)
+
+    def clear_index(self):
+        """
+        Vide les tables de l'index dans la transaction courante. DELETE plutôt que TRUNCATE : le verrou
+        ACCESS EXCLUSIVE de TRUNCATE bloquerait toutes les recherches jusqu'au COMMIT ; les lignes mortes
+        sont récupérées par le VACUUM de l'étape 4.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM books_invertedindex_books")
+            cursor.execute("DELETE FROM books_invertedindex")
+
+    def build_posting(self, book_id, field_positions):
+        """Entrée d'un livre pour un mot : positions par champ encodées en écarts et score de proximité précalculé."""
+        encoded = {field: encode_positions(positions) for field, positions in field_positions.items()}
+        return {
+            'book': book_id,
+            'positions': encoded,
+            'occurrences': sum(len(positions) for positions in field_positions.values()),
+            'closeness': closeness_score(encoded.get('text', [])),
+        }
 
     def insert_batch(self, batch, word_to_id):
         """Insère un batch de mots dans la table books_invertedindex."""
         with transaction.atomic():
             with connection.cursor() as cursor:
                 sql = """
-                    INSERT INTO books_invertedindex (word, positions, occurrences)
+                    INSERT INTO books_invertedindex (word, surface, positions, occurrences)
                     VALUES %s RETURNING id, word
                 """
-                execute_values(cursor, sql, batch, template="(%s, %s, %s)", page_size=1000)
+                execute_values(cursor, sql, batch, template="(%s, %s, %s, %s)", page_size=1000)
                 results = cursor.fetchall()
                 word_to_id.update({word: index_id for index_id, word in results})
 
     def analyze_book(self, book):
-        """Analyse un livre et retourne un dictionnaire de mots avec leurs positions et leurs sections."""
-        languages = [lang.strip().lower() for lang in book.languages.split(',')]
-        all_stopwords = set()
-        for lang_code in languages:
-            all_stopwords.update(self.stopwords_cache.get(lang_code, set()))
-
-        word_pattern = re.compile(r'\b\w+\b')
+        """Analyse un livre et retourne les positions de chaque terme par champ, ainsi que les formes de surface rencontrées."""
+        analyzer = get_analyzer(book_languages(book.languages), **self.analyzer_overrides)
 
         # Champs à analyser (title, summary, authors, text)
         fields = {
@@ -146,20 +237,19 @@ class Command(BaseCommand):
         }
 
         word_positions = defaultdict(lambda: defaultdict(list))  # Dictionnaire de positions par champ
-        new_positions = []  # Liste des mots restants après suppression des stopwords
+        surfaces = Counter()  # (terme, forme de surface) -> nombre d'occurrences
 
         adjusted_position = 0  # Position ajustée dans le texte filtré (sans stopwords)
 
         # Analyser chaque champ indépendamment pour garder les positions correctes
         for field, content in fields.items():
-            if content:
-                words = word_pattern.findall(content.lower())
-                field_positions = []
-                for word in words:
-                    if word and word not in all_stopwords and len(word) > 1:
-                        word_positions[word][field].append(adjusted_position)
-                        field_positions.append(word)  # Liste des mots restants dans ce champ
-                        adjusted_position += 1  # Ajuster la position pour le texte filtré
-                new_positions.extend(field_positions)
-
-        return dict(word_positions), new_positions
+            spans = analyzer.analyze_spans(content)
+            if field == 'text':
+                # Position (en caractères) des termes du texte : points de repère des extraits
+                book.text_offsets = encode_offsets(adjusted_position, [offset for _, _, offset in spans], len(content))
+            for word, surface, _ in spans:
+                word_positions[word][field].append(adjusted_position)
+                surfaces[(word, surface)] += 1
+                adjusted_position += 1  # Ajuster la position pour le texte filtré
+
+        return dict(word_positions), surfaces
@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from books.management.commands.benchmark import summarize
+from books.query_log import config as query_log_config
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a captured query log (BOOKS_QUERY_LOG) against a running server at a fixed rate, "
+        "and report latency percentiles and error rates per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', help="Journal JSON lines à rejouer (par défaut BOOKS_QUERY_LOG['PATH']).")
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000', help="Serveur visé.")
+        parser.add_argument('--rate', type=float, default=10.0, help="Requêtes lancées par seconde (0 : sans limite).")
+        parser.add_argument('--concurrency', type=int, default=8, help="Requêtes simultanées au maximum.")
+        parser.add_argument('--endpoint', action='append', help="Rejouer seulement ces endpoints (répétable).")
+        parser.add_argument('--limit', type=int, help="Nombre maximal de requêtes rejouées.")
+        parser.add_argument('--timeout', type=float, default=30.0, help="Délai maximal d'une requête (secondes).")
+        parser.add_argument('--output', help="Fichier JSON de résultats (optionnel).")
+
+    def handle(self, *args, **options):
+        entries = self.read_log(options['log'] or query_log_config()['PATH'], options['endpoint'], options['limit'])
+        if not entries:
+            raise CommandError("Aucune requête à rejouer.")
+        self.stdout.write(f"Rejeu de {len(entries)} requêtes sur {options['base_url']} ({options['rate'] or 'max'} req/s)...")
+
+        results = []
+        results_lock = threading.Lock()
+        session = requests.Session()
+        session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=options['concurrency']))
+        session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=options['concurrency']))
+        base_url = options['base_url'].rstrip('/')
+
+        def fire(entry):
+            start = time.perf_counter()
+            try:
+                response = session.get(base_url + entry['path'], params=entry.get('params') or {}, timeout=options['timeout'])
+                status, error = response.status_code, None
+            except requests.RequestException as exc:
+                status, error = None, type(exc).__name__
+            with results_lock:
+                results.append((entry.get('endpoint', 'unknown'), status, error, (time.perf_counter() - start) * 1000))
+
+        # Ordonnancement en boucle ouverte : chaque requête part à son heure, même si les précédentes traînent
+        interval = 1 / options['rate'] if options['rate'] > 0 else 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for index, entry in enumerate(entries):
+                delay = started + index * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(fire, entry)
+        elapsed = time.perf_counter() - started
+
+        report = {
+            'base_url': options['base_url'],
+            'target_rate': options['rate'],
+            'achieved_rate': len(results) / elapsed if elapsed else None,
+            'overall': self.summarize_results(results),
+            'endpoints': {
+                endpoint: self.summarize_results(endpoint_results)
+                for endpoint, endpoint_results in sorted(self.group_by_endpoint(results).items())
+            },
+        }
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['output']}."))
+
+    def read_log(self, path, endpoints, limit):
+        entries = []
+        try:
+            with open(path, encoding='utf-8') as log:
+                for line in log:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Ligne tronquée (journal en cours d'écriture)
+                    if 'path' not in entry or (endpoints and entry.get('endpoint') not in endpoints):
+                        continue
+                    entries.append(entry)
+                    if limit and len(entries) >= limit:
+                        break
+        except OSError as exc:
+            raise CommandError(f"Impossible de lire le journal {path} : {exc}")
+        return entries
+
+    def group_by_endpoint(self, results):
+        groups = defaultdict(list)
+        for result in results:
+            groups[result[0]].append(result)
+        return groups
+
+    def summarize_results(self, results):
+        """Percentiles de latence ; erreurs = réponses 5xx et échecs réseau, les 4xx sont comptées à part."""
+        count = len(results)
+        server_errors = sum(1 for _, status, _, _ in results if status is not None and status >= 500)
+        failures = sum(1 for _, status, _, _ in results if status is None)
+        client_errors = sum(1 for _, status, _, _ in results if status is not None and 400 <= status < 500)
+        return {
+            **summarize([latency for _, status, _, latency in results if status is not None]),
+            'requests': count,
+            'server_errors': server_errors,
+            'failures': failures,
+            'client_errors': client_errors,
+            'error_rate': (server_errors + failures) / count if count else None,
+            'client_error_rate': client_errors / count if count else None,
+        }
+
+    def print_report(self, report):
+        def row(name, stats):
+            p50, p95, p99 = (stats[key] if stats[key] is not None else float('nan') for key in ('p50_ms', 'p95_ms', 'p99_ms'))
+            return (
+                f"{name:<28} {stats['requests']:>7} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} "
+                f"{stats['error_rate'] * 100:>7.2f}% {stats['client_error_rate'] * 100:>7.2f}%"
+            )
+
+        self.stdout.write(f"{'endpoint':<28} {'requêtes':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'erreurs':>8} {'4xx':>8}")
+        for endpoint, stats in report['endpoints'].items():
+            self.stdout.write(row(endpoint, stats))
+        self.stdout.write(row('total', report['overall']))
+        self.stdout.write(f"Débit atteint : {report['achieved_rate']:.1f} req/s")
@@ -0,0 +1,52 @@
+import signal
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from books.jobs import config, work
+
+
+def run_worker(poll_seconds, once):
+    work(poll_seconds, once)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (import, index, warm-up, similarity) in worker processes, "
+        "at lowered CPU/IO priority and throttled during peak hours (BOOKS_JOBS)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=config()['WORKERS'], help="Nombre de processus de travail.")
+        parser.add_argument('--poll', type=float, default=config()['POLL_SECONDS'], help="Secondes entre deux lectures de la file vide.")
+        parser.add_argument('--once', action='store_true', help="S'arrêter quand la file est vide.")
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 1:
+            self.stdout.write("Processus de travail démarré.")
+            work(options['poll'], options['once'])
+            return
+
+        # Pas de connexion partagée entre processus ; processus non démons : les commandes créent leurs propres pools
+        connections.close_all()
+        context = get_context('fork')
+        processes = [
+            context.Process(target=run_worker, args=(options['poll'], options['once']))
+            for _ in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(self.style.SUCCESS(f"{len(processes)} processus de travail démarrés."))
+
+        signal.signal(signal.SIGTERM, lambda *_: self.stop(processes))
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            self.stop(processes)
+
+    def stop(self, processes):
+        for process in processes:
+            process.terminate()
+        raise SystemExit(0)
@@ -0,0 +1,48 @@
+import signal
+import sys
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books.shards import ShardServer, read_manifest, remove_socket, socket_path
+
+
+def run_shard(shard):
+    # terminate() envoie SIGTERM : sortie normale pour que le shard supprime sa socket
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    ShardServer(shard).serve_forever()
+
+
+class Command(BaseCommand):
+    help = "Serve each index shard built by `index_books --shards N` from its own process (local Unix sockets)."
+
+    def handle(self, *args, **options):
+        manifest = read_manifest()
+        if not manifest:
+            raise CommandError("Aucun index partitionné : lancer `manage.py index_books --shards N`.")
+
+        # Les shards rechargent leur segment à chaque réindexation ; relancer si le nombre de shards change
+        context = get_context('fork')
+        processes = [context.Process(target=run_shard, args=(shard,), daemon=True) for shard in range(manifest['count'])]
+        for process in processes:
+            process.start()
+        for shard, (low, high) in enumerate(manifest['ranges']):
+            self.stdout.write(f"Shard {shard} (livres {low} à {high}) : {socket_path(shard)}")
+        self.stdout.write(self.style.SUCCESS(f"{len(processes)} shards démarrés."))
+
+        signal.signal(signal.SIGTERM, lambda *_: self.stop(processes))
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            self.stop(processes)
+        for shard in range(len(processes)):
+            remove_socket(shard)
+
+    def stop(self, processes):
+        for process in processes:
+            process.terminate()
+        for shard, process in enumerate(processes):
+            process.join()
+            remove_socket(shard)  # Shard tué avant d'avoir pu supprimer sa socket
+        raise SystemExit(0)
@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+
+from books.jobs import checkpoint
+from books.models import Book
+from books.query_cache import query_cache
+from books.query_log import config as query_log_config
+from books.term_dictionary import term_dictionary
+
+DEFAULTS = {
+    'AFTER_INDEXING': True,
+    'QUERIES': 100,
+    'BOOKS': 50,
+    'CONCURRENCY': 4,
+}
+
+# Endpoints dont les résultats sont mis en cache : seuls ceux-là sont rejoués depuis le journal
+WARMED_ENDPOINTS = {
+    'inverted_index_search', 'inverted-search', 'ranked_book_search', 'closeness-search',
+    'advanced-search', 'faceted-search', 'topk-search',
+}
+
+# Requêtes de l'interface pour un mot (voir frontend/services/bookService.js)
+WORD_QUERIES = (
+    lambda word: (f'/api/search/{quote(word)}/author+title+text/', {'page': '1', 'page_size': '5'}),
+    lambda word: (f'/api/search/suggestions/{quote(word)}/', {}),
+    lambda word: ('/api/ranked_book_search/', {'word': word}),
+)
+BOOK_PAGE_SIZE = '300'  # Taille de page du lecteur
+
+# Caches propres au processus : les entrées préchauffées ne seraient jamais lues par les workers
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def warming_config():
+    return {**DEFAULTS, **getattr(settings, 'BOOKS_CACHE_WARMING', {})}
+
+
+def warming_host():
+    """Nom d'hôte accepté par ALLOWED_HOSTS pour les requêtes internes."""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-warm the search result caches and the text pages of the most downloaded books, from the query log "
+        "(or the most frequent words) — run automatically at the end of index_books."
+    )
+
+    def add_arguments(self, parser):
+        config = warming_config()
+        parser.add_argument('--queries', type=int, default=config['QUERIES'], help="Nombre de requêtes préchauffées.")
+        parser.add_argument('--books', type=int, default=config['BOOKS'], help="Nombre de livres (les plus téléchargés) dont la première page est préchauffée.")
+        parser.add_argument('--concurrency', type=int, default=config['CONCURRENCY'], help="Requêtes exécutées en parallèle.")
+        parser.add_argument('--log', help="Journal des requêtes (par défaut BOOKS_QUERY_LOG['PATH']).")
+
+    def handle(self, *args, **options):
+        if settings.CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHES:
+            self.stdout.write(self.style.WARNING("Cache propre au processus (CACHES) : préchauffage ignoré."))
+            return
+        started = time.perf_counter()
+        # Index publié par ce processus (index_books) : nouvelle génération, donc nouvelles clés de cache
+        query_cache.clear_local()
+        requests = self.top_queries(options['log'] or query_log_config()['PATH'], options['queries'])
+        book_ids = list(Book.objects.order_by('-download_count', 'id').values_list('id', flat=True)[:options['books']])
+        # Le texte mis en page n'est pas versionné : l'ancienne version est supprimée avant d'être recalculée
+        cache.delete_many([f'book_text_{book_id}' for book_id in book_ids])
+        requests += [(f'/api/book/{book_id}/text/', {'page': '1', 'page_size': BOOK_PAGE_SIZE}) for book_id in book_ids]
+
+        local = threading.local()
+
+        def warm(request):
+            path, params = request
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client(SERVER_NAME=warming_host())
+            try:
+                with query_cache.refreshing():
+                    return client.get(path, params, HTTP_X_BOOKS_WARMUP='1').status_code == 200
+            finally:
+                connections.close_all()
+
+        warmed = 0
+        with ThreadPoolExecutor(max_workers=max(options['concurrency'], 1)) as executor:
+            for done, ok in enumerate(executor.map(warm, requests), 1):
+                warmed += ok
+                checkpoint(done, len(requests), "Préchauffage des caches")
+
+        failed = len(requests) - warmed
+        self.stdout.write(self.style.SUCCESS(
+            f"Caches préchauffés : {warmed} entrées en {time.perf_counter() - started:.1f} s"
+            + (f" ({failed} requêtes en échec)." if failed else ".")
+        ))
+
+    def top_queries(self, log_path, limit):
+        """Requêtes les plus fréquentes du journal, complétées par les mots les plus fréquents du corpus."""
+        counts = Counter()
+        try:
+            with open(log_path, encoding='utf-8') as log:
+                for line in log:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if entry.get('endpoint') in WARMED_ENDPOINTS and entry.get('status') == 200:
+                        counts[(entry['path'], json.dumps(entry.get('params') or {}, sort_keys=True))] += 1
+        except OSError:
+            pass
+        requests = [(path, json.loads(params)) for (path, params), _ in counts.most_common(limit)]
+
+        dictionary = term_dictionary.get()
+        if len(requests) < limit and dictionary is not None:
+            words = [word for word, _ in dictionary.top_in_range('', limit - len(requests))]
+            for word in words:
+                for query in WORD_QUERIES:
+                    requests.append(query(word))
+        return requests
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-19 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invertedindex',
+            name='surface',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
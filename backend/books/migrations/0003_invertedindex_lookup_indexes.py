@@ -0,0 +1,25 @@
+# Generated by Django 5.1.5 on 2026-10-19 14:31
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_invertedindex_surface'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='invertedindex',
+            index=models.Index(django.db.models.functions.text.Upper('word'), name='invertedindex_word_upper'),
+        ),
+        migrations.AddIndex(
+            model_name='invertedindex',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass('surface', name='gin_trgm_ops'), name='invertedindex_surface_trgm'),
+        ),
+    ]
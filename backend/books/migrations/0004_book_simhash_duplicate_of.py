@@ -0,0 +1,24 @@
+# Generated by Django 5.1.5 on 2026-10-19 14:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_invertedindex_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='editions', to='books.book'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='simhash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
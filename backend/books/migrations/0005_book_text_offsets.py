@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-19 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0004_book_simhash_duplicate_of'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='text_offsets',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.5 on 2026-10-19 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_book_text_offsets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('import', 'Import des livres'), ('index', 'Indexation'), ('warm', 'Préchauffage des caches'), ('similarity', 'Détection des quasi-doublons')], max_length=32)),
+                ('options', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('queued', 'En attente'), ('running', 'En cours'), ('succeeded', 'Terminée'), ('failed', 'Échec'), ('cancelled', 'Annulée')], default='queued', max_length=16)),
+                ('progress', models.FloatField(default=0)),
+                ('stage', models.CharField(blank=True, default='', max_length=255)),
+                ('output', models.TextField(blank=True, default='')),
+                ('error', models.TextField(blank=True, default='')),
+                ('cancel_requested', models.BooleanField(default=False)),
+                ('worker', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='job_status_created')],
+            },
+        ),
+    ]
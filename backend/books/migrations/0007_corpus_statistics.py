@@ -0,0 +1,56 @@
+# Generated by Django 5.1.5 on 2026-10-19 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorpusSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('book_count', models.IntegerField()),
+                ('vocabulary_size', models.IntegerField()),
+                ('posting_count', models.BigIntegerField()),
+                ('total_occurrences', models.BigIntegerField()),
+                ('hapax_count', models.IntegerField()),
+                ('df_distribution', models.JSONField(default=list)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CatalogStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('language', 'Langue'), ('author', 'Auteur'), ('subject', 'Sujet'), ('bookshelf', 'Étagère')], max_length=16)),
+                ('value', models.TextField()),
+                ('book_count', models.IntegerField()),
+                ('download_count', models.BigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dimension', '-book_count'], name='catalogstat_dimension_books')],
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'value'), name='catalogstat_dimension_value')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TermStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=255, unique=True)),
+                ('surface', models.CharField(blank=True, default='', max_length=255)),
+                ('document_frequency', models.IntegerField()),
+                ('occurrences', models.IntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-document_frequency'], name='termstat_df_desc'), models.Index(fields=['-occurrences'], name='termstat_occurrences_desc')],
+            },
+        ),
+    ]
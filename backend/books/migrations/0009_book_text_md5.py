@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-19 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='text_md5',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        # Livres déjà importés (md5 de PostgreSQL : octets UTF-8 du texte, comme hashlib à l'import)
+        migrations.RunSQL(
+            "UPDATE books_book SET text_md5 = md5(text) WHERE text IS NOT NULL",
+            migrations.RunSQL.noop,
+        ),
+    ]
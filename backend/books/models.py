@@ -1,5 +1,11 @@
 # models.py
+import hashlib
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
+from .analysis import canonical_term
+from .proximity import closeness_score, decode_positions, encode_positions
 
 class Author(models.Model):
     name = models.CharField(max_length=255, unique=True)
@@ -23,38 +29,173 @@ class Book(models.Model):
     copyright = models.BooleanField(default=False)
     download_count = models.IntegerField(default=0)
     translators = models.JSONField(default=list, blank=True)
+    simhash = models.BigIntegerField(null=True, blank=True)  # Empreinte SimHash du texte (voir fingerprint.py)
+    text_offsets = models.BinaryField(null=True, blank=True, editable=False)  # Points de repère des extraits (voir snippets.py)
+    text_md5 = models.CharField(max_length=32, null=True, blank=True, editable=False)  # Empreinte md5 du texte UTF-8 (ETag du téléchargement)
+    duplicate_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='editions')
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        book = super().from_db(db, field_names, values)
+        book._loaded_text = book.__dict__.get('text')  # Texte lu en base : save() ne le rehache que s'il a été remplacé
+        return book
+
+    def save(self, *args, **kwargs):
+        # L'empreinte suit le texte, y compris modifié dans l'admin (bulk_create la calcule à part, voir import_books).
+        # Elle n'est recalculée que si le texte est écrit par cette sauvegarde et a changé depuis sa lecture.
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            writes_text = 'text' not in self.get_deferred_fields()
+        else:
+            writes_text = 'text' in update_fields
+        if writes_text and (self.text is not getattr(self, '_loaded_text', None) or (self.text and not self.text_md5)):
+            self.text_md5 = hashlib.md5(self.text.encode('utf-8')).hexdigest() if self.text else None
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'text_md5'}
+        super().save(*args, **kwargs)
+        self._loaded_text = self.__dict__.get('text')
+
+class InvertedIndexQuerySet(models.QuerySet):
+    def for_term(self, term):
+        """Entrée d'un terme : égalité stricte sur la forme canonique, servie par l'index unique de `word`."""
+        return self.filter(word=canonical_term(term))
+
+    def for_terms(self, terms):
+        return self.filter(word__in={canonical_term(term) for term in terms})
+
+
 class InvertedIndex(models.Model):
     word = models.CharField(max_length=255, unique=True)
+    surface = models.CharField(max_length=255, blank=True, default='')  # Forme la plus fréquente du terme (racinisé)
     books = models.ManyToManyField(Book, related_name="indexed_words")
     occurrences = models.IntegerField(default=0)
     positions = models.JSONField(default=list, blank=True)
 
+    objects = InvertedIndexQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Anciennes recherches word__iexact : UPPER(word) = UPPER(%s).
+            # Les recherches par préfixe (LIKE 'abc%') utilisent l'index varchar_pattern_ops que Django
+            # crée automatiquement pour la contrainte unique de `word` (books_invertedindex_word_..._like).
+            models.Index(Upper('word'), name='invertedindex_word_upper'),
+            # Recherche floue des suggestions (pg_trgm)
+            GinIndex(OpClass('surface', name='gin_trgm_ops'), name='invertedindex_surface_trgm'),
+        ]
+
     def __str__(self):
         return self.word
 
-    def update_positions(self, book, positions):
-        """Mettre à jour les positions d'un mot dans un livre."""
-        # Convertir positions en liste si ce n'est pas déjà le cas
-        positions = list(positions)
+    def update_positions(self, book, field_positions):
+        """
+        Ajoute des positions d'un mot dans un livre ({champ: positions absolues}) à l'entrée du livre,
+        au format d'index_books : positions par champ encodées en écarts, occurrences et score de proximité.
+        """
+        entry = next((entry for entry in self.positions if entry['book'] == book.id), None)
+        if entry is None:
+            entry = {'book': book.id, 'positions': {}}
+            self.positions.append(entry)
 
-        # Trouver l'entrée existante pour ce livre
-        existing_entry = next((entry for entry in self.positions if entry['book'] == book.id), None)
-
-        if existing_entry:
-            # Fusionner les positions sans doublons
-            existing_entry['positions'] = list(set(existing_entry['positions'] + positions))
-            existing_entry['occurrences'] = len(existing_entry['positions'])
-        else:
-            # Ajouter une nouvelle entrée
-            self.positions.append({
-                'book': book.id, 
-                'positions': positions, 
-                'occurrences': len(positions)
-            })
+        # Fusion sans doublons sur les positions absolues, puis réencodage en écarts
+        for field, positions in field_positions.items():
+            merged = set(decode_positions(entry['positions'].get(field, [])).tolist()) | set(positions)
+            entry['positions'][field] = encode_positions(merged)
+        entry['occurrences'] = sum(len(deltas) for deltas in entry['positions'].values())
+        entry['closeness'] = closeness_score(entry['positions'].get('text', []))
 
         # Mettre à jour le total des occurrences
-        self.occurrences = sum(entry['occurrences'] for entry in self.positions)
\ No newline at end of file
+        self.occurrences = sum(entry['occurrences'] for entry in self.positions)
+
+class Job(models.Model):
+    """Tâche de fond (import, indexation, préchauffage, similarité) exécutée par `manage.py run_jobs`."""
+
+    KINDS = [
+        ('import', 'Import des livres'),
+        ('index', 'Indexation'),
+        ('warm', 'Préchauffage des caches'),
+        ('similarity', 'Détection des quasi-doublons'),
+    ]
+    QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+    STATUSES = [(QUEUED, 'En attente'), (RUNNING, 'En cours'), (SUCCEEDED, 'Terminée'), (FAILED, 'Échec'), (CANCELLED, 'Annulée')]
+
+    kind = models.CharField(max_length=32, choices=KINDS)
+    options = models.JSONField(default=dict, blank=True)  # Options de la commande de gestion
+    status = models.CharField(max_length=16, choices=STATUSES, default=QUEUED)
+    progress = models.FloatField(default=0)  # Avancement de l'étape en cours, entre 0 et 1
+    stage = models.CharField(max_length=255, blank=True, default='')
+    output = models.TextField(blank=True, default='')  # Fin de la sortie de la commande
+    error = models.TextField(blank=True, default='')
+    cancel_requested = models.BooleanField(default=False)
+    worker = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # File d'attente : plus ancienne tâche en attente
+            models.Index(fields=['status', 'created_at'], name='job_status_created'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
+
+
+# Statistiques du corpus matérialisées par index_books (voir corpus_stats.py)
+class TermStatistic(models.Model):
+    term = models.CharField(max_length=255, unique=True)
+    surface = models.CharField(max_length=255, blank=True, default='')
+    document_frequency = models.IntegerField()
+    occurrences = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-document_frequency'], name='termstat_df_desc'),
+            models.Index(fields=['-occurrences'], name='termstat_occurrences_desc'),
+        ]
+
+    def __str__(self):
+        return self.term
+
+
+class CatalogStatistic(models.Model):
+    DIMENSIONS = [('language', 'Langue'), ('author', 'Auteur'), ('subject', 'Sujet'), ('bookshelf', 'Étagère')]
+
+    dimension = models.CharField(max_length=16, choices=DIMENSIONS)
+    value = models.TextField()
+    book_count = models.IntegerField()
+    download_count = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'value'], name='catalogstat_dimension_value'),
+        ]
+        indexes = [
+            models.Index(fields=['dimension', '-book_count'], name='catalogstat_dimension_books'),
+        ]
+
+    def __str__(self):
+        return f'{self.dimension}={self.value}'
+
+
+class CorpusSnapshot(models.Model):
+    """Chiffres globaux d'une indexation ; l'historique donne l'évolution du vocabulaire."""
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    book_count = models.IntegerField()
+    vocabulary_size = models.IntegerField()
+    posting_count = models.BigIntegerField()
+    total_occurrences = models.BigIntegerField()
+    hapax_count = models.IntegerField()  # Termes présents dans un seul livre
+    df_distribution = models.JSONField(default=list)  # [{'min', 'max', 'terms'}] par puissance de 2
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.created_at:%Y-%m-%d %H:%M} ({self.vocabulary_size} termes)'
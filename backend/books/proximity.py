@@ -0,0 +1,74 @@
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+
+# Les positions d'un mot dans un champ sont stockées en écarts (delta-encoding) :
+# [12, 40, 41] devient [12, 28, 1]. Les écarts sont petits, donc le JSON de l'index est plus compact,
+# et la plupart des scores de proximité se calculent directement à partir des écarts.
+
+
+def encode_positions(positions):
+    """Encode une liste de positions en écarts (la première valeur reste absolue)."""
+    if not positions:
+        return []
+    return np.diff(np.asarray(sorted(positions), dtype=np.int64), prepend=0).tolist()
+
+
+def decode_positions(deltas):
+    """Retrouve les positions absolues (triées) à partir des écarts."""
+    return np.cumsum(np.asarray(deltas, dtype=np.int64))
+
+
+def closeness_score(deltas):
+    """Score de proximité d'un terme : inverse de l'écart moyen entre occurrences consécutives."""
+    if len(deltas) < 2:
+        return 0.0
+    mean_gap = np.asarray(deltas[1:], dtype=np.float64).mean()
+    return float(1 / mean_gap) if mean_gap > 0 else 0.0
+
+
+def minimal_window(term_positions):
+    """
+    Taille de la plus petite fenêtre contenant au moins une occurrence de chaque terme.
+
+    Pour chaque occurrence p (tous termes confondus), on cherche par recherche dichotomique la prochaine
+    occurrence >= p de chaque terme : la fenêtre qui commence en p se termine au maximum de ces positions.
+    La fenêtre minimale commence forcément sur une occurrence, d'où le minimum sur tous les p.
+    """
+    arrays = [np.asarray(positions, dtype=np.int64) for positions in term_positions]
+    if any(len(positions) == 0 for positions in arrays):
+        return None
+
+    starts = np.concatenate(arrays)
+    ends = np.zeros_like(starts)
+    unreachable = np.iinfo(np.int64).max
+    for positions in arrays:
+        indices = np.searchsorted(positions, starts, side='left')
+        next_positions = np.where(
+            indices < len(positions), positions[np.minimum(indices, len(positions) - 1)], unreachable
+        )
+        ends = np.maximum(ends, next_positions)
+
+    reachable = ends != unreachable
+    return int((ends[reachable] - starts[reachable]).min())
+
+
+def window_score(window, term_count):
+    """1 quand les termes sont adjacents, décroît avec la taille de la fenêtre."""
+    if window is None:
+        return 0.0
+    return term_count / (window + 1)
+
+
+def top_k(book_ids, scores, k):
+    """Sélectionne les k meilleurs (id, score) sans trier l'ensemble des candidats."""
+    scores = np.asarray(scores, dtype=np.float64)
+    book_ids = np.asarray(book_ids, dtype=np.int64)
+    if k <= 0 or len(scores) == 0:
+        return []
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    ordered = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return list(zip(book_ids[ordered].tolist(), scores[ordered].tolist()))
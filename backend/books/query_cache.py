@@ -0,0 +1,269 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import BaseDatabaseCache
+from django.db import connections
+
+from .analysis import index_analysis
+from .instrumentation import record_cache, timing_span
+from .segments import segment_loader
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'TIMEOUT': 1800,        # Durée de fraîcheur d'un résultat (secondes)
+    'STALE_TIMEOUT': 300,   # Fenêtre pendant laquelle un résultat périmé peut encore être servi
+    'MAX_ENTRIES': 1024,    # Taille maximale du cache LRU local (par processus)
+    'HOT_HITS': 5,          # Nombre d'accès à partir duquel une clé est considérée « chaude »
+    'LOCK_TIMEOUT': 30,     # Durée de vie du verrou single-flight (dans le cache partagé)
+    'LOCK_POLL': 0.05,      # Intervalle d'attente quand un autre worker calcule la même clé
+    'SHARED_LOCK': None,    # Verrou single-flight entre workers ; None : activé sauf avec DatabaseCache
+}
+
+
+def normalize_methods(search_method):
+    """'title+text' et 'text+title' désignent la même requête."""
+    return '+'.join(sorted(set(method.strip().lower() for method in search_method.split('+') if method.strip())))
+
+
+class CacheEntry:
+    __slots__ = ('value', 'fresh_until', 'stale_until', 'hits')
+
+    def __init__(self, value, fresh_until, stale_until):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+        self.hits = 0
+
+
+class QueryCache:
+    """
+    Cache des résultats de recherche à deux niveaux :
+    - un LRU borné en mémoire (par processus) avec TTL ;
+    - le cache Django (CACHES, partagé entre workers : table PostgreSQL ou Redis, voir settings).
+    Un seul worker calcule une clé manquante (single-flight), les autres attendent son résultat. Avec
+    DatabaseCache, chaque prise de verrou et chaque attente coûtent des requêtes SQL : seuls les threads d'un
+    même processus sont alors regroupés (SHARED_LOCK pour forcer l'un ou l'autre comportement).
+    Les clés chaudes périmées sont servies immédiatement puis recalculées en arrière-plan
+    (stale-while-revalidate).
+    Les clés contiennent la génération du segment d'index publié : après index_books, les résultats
+    calculés sur l'ancien index ne sont plus lus et le LRU local est vidé.
+    """
+
+    def __init__(self, **options):
+        config = {**DEFAULTS, **getattr(settings, 'BOOKS_QUERY_CACHE', {}), **options}
+        self.timeout = config['TIMEOUT']
+        self.stale_timeout = config['STALE_TIMEOUT']
+        self.max_entries = config['MAX_ENTRIES']
+        self.hot_hits = config['HOT_HITS']
+        self.lock_timeout = config['LOCK_TIMEOUT']
+        self.lock_poll = config['LOCK_POLL']
+        self.shared_lock = config['SHARED_LOCK']
+        self.entries = OrderedDict()
+        self.generation = None
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.local = threading.local()
+
+    def make_key(self, endpoint, generation, **params):
+        """Clé normalisée : paramètres triés, hachés pour rester compatibles avec tous les backends."""
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+        return f'query:{generation}:{endpoint}:{digest}'
+
+    def index_generation(self):
+        """Génération du segment publié par index_books ; le LRU local est vidé quand elle change."""
+        segment_loader.get()
+        generation = segment_loader.generation
+        if generation != self.generation:
+            with self.lock:
+                self.entries.clear()
+                self.generation = generation
+        return generation
+
+    def get_or_compute(self, endpoint, compute, cache_if=None, **params):
+        """`cache_if(valeur)` peut refuser la mise en cache d'un résultat (résultats partiels, par exemple)."""
+        key = self.make_key(endpoint, self.index_generation(), **params)
+        now = time.time()
+
+        if getattr(self.local, 'refreshing', False):
+            # Préchauffage : l'entrée existante (calculée sur l'ancien index) est remplacée
+            record_cache(endpoint, False)
+            value = compute()
+            if cache_if is None or cache_if(value):
+                self.store(key, value)
+            return value
+
+        entry = self.get_local(key)
+        if entry is None:
+            entry = self.get_shared(key)
+            if entry is not None:
+                self.set_local(key, entry)
+
+        if entry is not None:
+            entry.hits += 1
+            if now < entry.fresh_until:
+                record_cache(endpoint, True)
+                return entry.value
+            if now < entry.stale_until and entry.hits >= self.hot_hits:
+                # Clé chaude périmée : servir l'ancienne valeur et rafraîchir en arrière-plan
+                record_cache(endpoint, True)
+                self.refresh_in_background(key, compute, cache_if)
+                return entry.value
+
+        record_cache(endpoint, False)
+        return self.compute_single_flight(key, compute, cache_if)
+
+    # --- Niveau local (LRU + TTL) ---
+
+    def get_local(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() >= entry.stale_until:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set_local(self, key, entry):
+        with self.lock:
+            previous = self.entries.get(key)
+            if previous is not None:
+                entry.hits = max(entry.hits, previous.hits)
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    # --- Niveau partagé (cache Django) ---
+
+    def get_shared(self, key):
+        envelope = cache.get(key)
+        if envelope is None:
+            return None
+        return CacheEntry(envelope['value'], envelope['fresh_until'], envelope['fresh_until'] + self.stale_timeout)
+
+    def store(self, key, value):
+        fresh_until = time.time() + self.timeout
+        cache.set(key, {'value': value, 'fresh_until': fresh_until}, timeout=self.timeout + self.stale_timeout)
+        self.set_local(key, CacheEntry(value, fresh_until, fresh_until + self.stale_timeout))
+
+    # --- Single-flight ---
+
+    @contextmanager
+    def key_lock(self, key):
+        """Verrou d'une clé pour les threads du processus, supprimé quand plus aucun thread ne l'attend."""
+        with self.lock:
+            holder = self.key_locks.setdefault(key, [threading.Lock(), 0])
+            holder[1] += 1
+        try:
+            with holder[0]:
+                yield
+        finally:
+            with self.lock:
+                holder[1] -= 1
+                if not holder[1]:
+                    del self.key_locks[key]
+
+    def uses_shared_lock(self):
+        if self.shared_lock is not None:
+            return self.shared_lock
+        return not isinstance(caches['default'], BaseDatabaseCache)
+
+    def acquire_shared_lock(self, lock_key):
+        """Verrou entre workers dans le cache partagé ; retourne le jeton du détenteur, ou None."""
+        token = uuid.uuid4().hex
+        return token if cache.add(lock_key, token, timeout=self.lock_timeout) else None
+
+    def release_shared_lock(self, lock_key, token):
+        # Verrou expiré puis repris par un autre worker : c'est à lui de le libérer
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+    def compute_single_flight(self, key, compute, cache_if=None):
+        # Un seul thread par processus calcule la clé...
+        with self.key_lock(key):
+            entry = self.get_local(key)
+            if entry is not None and time.time() < entry.fresh_until:
+                return entry.value
+
+            # ... et un seul processus parmi les workers (verrou dans le cache partagé)
+            lock_key = f'{key}:lock'
+            token = None
+            if self.uses_shared_lock():
+                deadline = time.time() + self.lock_timeout
+                token = self.acquire_shared_lock(lock_key)
+                while token is None:
+                    with timing_span('cache_wait'):
+                        time.sleep(self.lock_poll)
+                    entry = self.get_shared(key)
+                    if entry is not None and time.time() < entry.fresh_until:
+                        self.set_local(key, entry)
+                        return entry.value
+                    if time.time() >= deadline:
+                        # Le worker détenteur du verrou a probablement échoué : calculer nous-mêmes
+                        break
+                    token = self.acquire_shared_lock(lock_key)
+
+            try:
+                if token is not None:
+                    # Un autre worker a pu écrire le résultat (et libérer le verrou) depuis notre lecture
+                    entry = self.get_shared(key)
+                    if entry is not None and time.time() < entry.fresh_until:
+                        self.set_local(key, entry)
+                        return entry.value
+                value = compute()
+                if cache_if is None or cache_if(value):
+                    self.store(key, value)
+                return value
+            finally:
+                if token is not None:
+                    self.release_shared_lock(lock_key, token)
+
+    def refresh_in_background(self, key, compute, cache_if=None):
+        lock_key = f'{key}:lock'
+        token = self.acquire_shared_lock(lock_key)
+        if token is None:
+            return  # Un rafraîchissement est déjà en cours
+
+        def refresh():
+            try:
+                value = compute()
+                if cache_if is None or cache_if(value):
+                    self.store(key, value)
+            except Exception:
+                logger.exception("Échec du rafraîchissement en arrière-plan de %s", key)
+            finally:
+                self.release_shared_lock(lock_key, token)
+                connections.close_all()
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    @contextmanager
+    def refreshing(self):
+        """Dans ce bloc (thread courant), chaque clé lue est recalculée et réécrite (voir warm_caches)."""
+        self.local.refreshing = True
+        try:
+            yield
+        finally:
+            self.local.refreshing = False
+
+    def clear_local(self):
+        """Vide le LRU du processus et relit la génération de l'index (après une indexation dans ce processus)."""
+        with self.lock:
+            self.entries.clear()
+            self.generation = None
+        segment_loader.invalidate()
+        index_analysis.invalidate()
+
+
+query_cache = QueryCache()
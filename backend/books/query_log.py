@@ -0,0 +1,116 @@
+import json
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
+
+from django.conf import settings
+
+# Journal structuré des requêtes (opt-in, BOOKS_QUERY_LOG['ENABLED']) : une ligne JSON par requête
+# sur les endpoints de recherche et d'affichage. Le worker ne fait que déposer l'enregistrement dans
+# une file en mémoire ; l'écriture sur disque est faite par le thread d'un QueueListener.
+# Relu par `manage.py replay_queries`.
+
+DEFAULTS = {
+    'ENABLED': False,
+    'PATH': 'query_log.jsonl',
+    'QUEUE_SIZE': 10000,       # Au-delà, les enregistrements sont abandonnés plutôt que de bloquer la requête
+    'EXCLUDE': ('metrics',),   # Noms d'URL jamais journalisés
+}
+
+# Clés des réponses qui donnent le nombre de résultats, par ordre de préférence
+COUNT_KEYS = ('total_books', 'count')
+LIST_KEYS = ('books', 'results', 'suggestions', 'completions')
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'BOOKS_QUERY_LOG', {})}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.query, ensure_ascii=False, sort_keys=True, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """N'attend jamais : si le thread d'écriture est en retard, l'enregistrement est perdu."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+    def prepare(self, record):
+        # L'enregistrement est déjà un dictionnaire : inutile de le formater dans le thread de la requête
+        return record
+
+
+class QueryLog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.logger = None
+        self.listener = None
+
+    def enabled(self):
+        return config()['ENABLED']
+
+    def get_logger(self):
+        if self.logger is None:
+            with self.lock:
+                if self.logger is None:
+                    options = config()
+                    file_handler = WatchedFileHandler(options['PATH'], encoding='utf-8')  # Compatible logrotate
+                    file_handler.setFormatter(JsonLinesFormatter())
+                    log_queue = queue.Queue(maxsize=options['QUEUE_SIZE'])
+                    self.listener = QueueListener(log_queue, file_handler)
+                    self.listener.start()
+
+                    logger = logging.getLogger('books.query_log')
+                    logger.propagate = False
+                    logger.setLevel(logging.INFO)
+                    logger.addHandler(DroppingQueueHandler(log_queue))
+                    self.logger = logger
+        return self.logger
+
+    def record(self, endpoint, path, params, status_code, latency_ms, result_count, cache_hit):
+        self.get_logger().info('query', extra={'query': {
+            'ts': time.time(),
+            'endpoint': endpoint,
+            'path': path,
+            'params': params,
+            'status': status_code,
+            'latency_ms': round(latency_ms, 3),
+            'results': result_count,
+            'cache_hit': cache_hit,
+        }})
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+
+
+def normalized_params(request):
+    """Paramètres de requête triés (une liste seulement pour les paramètres répétés)."""
+    params = {}
+    for key in sorted(request.GET):
+        values = request.GET.getlist(key)
+        params[key] = values if len(values) > 1 else values[0]
+    return params
+
+
+def result_count(response):
+    data = getattr(response, 'data', None)
+    if not isinstance(data, dict):
+        return len(data) if isinstance(data, list) else None
+    for key in COUNT_KEYS:
+        if isinstance(data.get(key), int):
+            return data[key]
+    for key in LIST_KEYS:
+        if isinstance(data.get(key), list):
+            return len(data[key])
+    return None
+
+
+query_log = QueryLog()
@@ -0,0 +1,241 @@
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+from django.db.models import Count
+
+try:
+    import re._parser as sre_parse  # Python >= 3.11
+except ImportError:
+    import sre_parse
+
+from .analysis import analyze_query, canonical_term
+from .models import Book, InvertedIndex, TermStatistic
+
+# Planificateur des recherches par expression régulière : avant d'envoyer un motif à PostgreSQL, on
+# estime son coût à partir de sa structure (arbre de sre_parse) et de la taille des postings de ses mots
+# obligatoires, puis on l'exécute en entier, en mode dégradé (sous-ensemble des candidats) ou on le refuse.
+# La confirmation en base est découpée en lots, chacun sous statement_timeout, dans un budget de temps global.
+
+DEFAULTS = {
+    'MAX_PATTERN_LENGTH': 200,
+    'MAX_COST': 20000,            # Au-delà : mode dégradé (candidats les plus téléchargés seulement)
+    'REJECT_COST': 500000,        # Au-delà : motif refusé
+    'STATEMENT_TIMEOUT_MS': 2000,  # Par requête de confirmation
+    'TOTAL_TIMEOUT_MS': 5000,      # Pour l'ensemble de la recherche
+    'CHUNK_SIZE': 100,             # Livres confirmés par requête
+}
+
+REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT} | ({sre_parse.POSSESSIVE_REPEAT} if hasattr(sre_parse, 'POSSESSIVE_REPEAT') else set())
+BACKREFERENCES = {sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS}
+CHARACTER_SETS = {sre_parse.ANY, sre_parse.IN, sre_parse.NOT_LITERAL, sre_parse.CATEGORY}
+
+
+def budget():
+    return {**DEFAULTS, **getattr(settings, 'BOOKS_QUERY_BUDGET', {})}
+
+
+class QueryRejected(Exception):
+    """Motif refusé par le planificateur (message destiné au client)."""
+
+
+@dataclass
+class PatternProfile:
+    complexity: int = 0
+    nested_repeats: bool = False
+    backreferences: int = 0
+
+
+@dataclass
+class QueryPlan:
+    mode: str               # 'index' (mot seul, sans confirmation), 'full', 'downgraded'
+    terms: list             # Clauses de termes indexés
+    candidates: int         # Estimation du nombre de livres à confirmer
+    complexity: int
+    estimated_cost: int
+    limit: int = None       # Nombre maximal de livres confirmés en mode dégradé
+
+    def as_dict(self):
+        return {
+            'mode': self.mode,
+            'candidates': self.candidates,
+            'complexity': self.complexity,
+            'estimated_cost': self.estimated_cost,
+        }
+
+
+def profile(items, profile_=None, repeat_depth=0):
+    """Parcourt l'arbre du motif : complexité, quantificateurs imbriqués, références arrière."""
+    profile_ = profile_ or PatternProfile()
+    for op, av in items:
+        if op in REPEATS:
+            low, high, sub = av
+            unbounded = high == sre_parse.MAXREPEAT
+            if repeat_depth and (unbounded or high > 1):
+                profile_.nested_repeats = True  # (a+)+, (a*b?)* ... : retour arrière exponentiel
+            before = profile_.complexity
+            profile(sub, profile_, repeat_depth + (1 if unbounded else 0))
+            inner = profile_.complexity - before
+            profile_.complexity += 2 + inner * (3 if unbounded else min(high, 10) - 1)
+        elif op == sre_parse.SUBPATTERN:
+            profile(av[-1], profile_, repeat_depth)
+        elif op == sre_parse.BRANCH:
+            profile_.complexity += len(av[1])
+            for branch in av[1]:
+                profile(branch, profile_, repeat_depth)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            profile_.complexity += 2
+            profile(av[1], profile_, repeat_depth)
+        elif op in BACKREFERENCES:
+            profile_.backreferences += 1
+        elif op in CHARACTER_SETS:
+            profile_.complexity += 1
+    return profile_
+
+
+def is_boundary(op, av):
+    """
+    Élément qui ne prolonge pas un mot : \\b, espace, ponctuation. Comme la fin du motif, « .* » est
+    traité comme une limite : un mot du motif est cherché sous sa forme indexée (racine), comme avant.
+    """
+    if op == sre_parse.AT:
+        return True
+    if op in REPEATS:
+        return all(sub_op == sre_parse.ANY or is_boundary(sub_op, sub_av) for sub_op, sub_av in av[2])
+    if op == sre_parse.LITERAL:
+        return not chr(av).isalnum()
+    if op == sre_parse.IN:
+        return all(
+            (kind == sre_parse.CATEGORY and value == sre_parse.CATEGORY_SPACE)
+            or (kind == sre_parse.LITERAL and not chr(value).isalnum())
+            for kind, value in av
+        )
+    return False
+
+
+def required_clauses(items, bounded_left=True, bounded_right=True):
+    """
+    Mots entiers présents dans toute correspondance : suites de littéraux délimitées (\\b, espace,
+    ponctuation, bords du motif) au niveau principal, dans les groupes et les répétitions d'au moins une
+    occurrence, et alternatives dont chaque branche contient un mot. Un groupe n'est délimité que si ce
+    qui l'entoure l'est (`bounded_left`, `bounded_right`) : « [a-z]+ing », « sun(shine) »,
+    « (sun|moon)light » et « x(abc)+y » n'en ont aucun, « (sun|moon) light » donne {sun, moon} et light.
+    """
+    clauses, word = [], []
+
+    def flush(bounded_right):
+        if word and bounded_left and bounded_right:
+            clauses.append(frozenset([''.join(word)]))
+        word.clear()
+
+    for index, (op, av) in enumerate(items):
+        if op == sre_parse.LITERAL and chr(av).isalnum():
+            word.append(chr(av))
+            continue
+        boundary = is_boundary(op, av)
+        # Contexte du groupe : limite avant lui (et aucune lettre accolée) et juste après lui
+        group_left = bounded_left and not word
+        group_right = is_boundary(*items[index + 1]) if index + 1 < len(items) else bounded_right
+        flush(boundary)
+        if op == sre_parse.SUBPATTERN:
+            clauses.extend(required_clauses(av[-1], group_left, group_right))
+        elif op in REPEATS and av[0] >= 1:
+            low, high, sub = av
+            if high > 1:
+                # Occurrences accolées : « (abc)+ » peut former le seul mot « abcabc »
+                group_left = group_left and bool(sub) and is_boundary(*sub[-1])
+                group_right = group_right and bool(sub) and is_boundary(*sub[0])
+            clauses.extend(required_clauses(sub, group_left, group_right))
+        elif op == sre_parse.BRANCH:
+            branches = [required_clauses(branch, group_left, group_right) for branch in av[1]]
+            if all(branches):
+                clauses.append(frozenset().union(*(branch[0] for branch in branches)))
+        bounded_left = boundary
+    flush(bounded_right)
+    return clauses
+
+
+def is_plain_word(items):
+    return bool(items) and all(op == sre_parse.LITERAL and chr(av).isalnum() for op, av in items)
+
+
+def document_frequencies(terms):
+    """{terme: nombre de livres} ; un terme absent n'apparaît dans aucun livre."""
+    # Fréquences matérialisées par index_books ; comptage sur la table de liaison seulement si elles n'ont
+    # jamais été calculées (un terme inconnu ne doit pas déclencher le comptage)
+    if TermStatistic.objects.exists():
+        return dict(TermStatistic.objects.filter(term__in={canonical_term(term) for term in terms}).values_list('term', 'document_frequency'))
+    rows = InvertedIndex.objects.for_terms(terms).annotate(documents=Count('books')).values_list('word', 'documents')
+    return dict(rows)
+
+
+def plan_regex(pattern, language=None):
+    """Construit le plan d'exécution d'un motif (mots analysés dans `language`), ou lève QueryRejected."""
+    config = budget()
+    if len(pattern) > config['MAX_PATTERN_LENGTH']:
+        raise QueryRejected(f"Expression trop longue (maximum {config['MAX_PATTERN_LENGTH']} caractères).")
+
+    items = sre_parse.parse(pattern)
+    pattern_profile = profile(items)
+    if pattern_profile.nested_repeats:
+        raise QueryRejected("Quantificateurs imbriqués (ex. (a+)+) : expression trop coûteuse.")
+    if pattern_profile.backreferences:
+        raise QueryRejected("Les références arrière (\\1) ne sont pas autorisées.")
+
+    # Mots obligatoires, sous la forme des termes de l'index
+    clauses = []
+    for clause in required_clauses(items):
+        terms = {analyze_query(word, language) for word in clause}
+        if None not in terms:  # Un stopword ne filtre rien
+            clauses.append(sorted(terms))
+
+    if clauses:
+        frequencies = document_frequencies({term for clause in clauses for term in clause})
+        candidates = min(sum(frequencies.get(term, 0) for term in clause) for clause in clauses)
+    else:
+        candidates = Book.objects.count()  # Aucun mot obligatoire : parcours de tous les livres
+
+    complexity = pattern_profile.complexity
+    if is_plain_word(items) and clauses:
+        # Un mot seul : l'index suffit, aucune confirmation par expression régulière
+        return QueryPlan('index', clauses, candidates, complexity, candidates)
+
+    estimated_cost = candidates * (1 + complexity)
+    if estimated_cost > config['REJECT_COST']:
+        raise QueryRejected(
+            f"Expression trop coûteuse (coût estimé {estimated_cost}) : ajouter un mot littéral plus rare."
+        )
+    if estimated_cost > config['MAX_COST']:
+        limit = max(config['MAX_COST'] // (1 + complexity), 1)
+        return QueryPlan('downgraded', clauses, candidates, complexity, estimated_cost, limit=limit)
+    return QueryPlan('full', clauses, candidates, complexity, estimated_cost)
+
+
+def confirm_in_chunks(queryset, book_ids, chunk_size=None):
+    """
+    Évalue `queryset` (déjà filtré par l'expression régulière) lot par lot sur `book_ids`.
+    Chaque lot est borné par statement_timeout ; on s'arrête à l'épuisement du budget global.
+    Retourne (lignes, partiel).
+    """
+    config = budget()
+    chunk_size = chunk_size or config['CHUNK_SIZE']
+    # statement_timeout doit être posé sur la base qui exécute la requête (réplica éventuel)
+    using = queryset.db
+    queryset = queryset.using(using)
+    deadline = time.monotonic() + config['TOTAL_TIMEOUT_MS'] / 1000
+    rows = []
+    for start in range(0, len(book_ids), chunk_size):
+        remaining_ms = int((deadline - time.monotonic()) * 1000)
+        if remaining_ms <= 0:
+            return rows, True
+        try:
+            with transaction.atomic(using=using):
+                if connections[using].vendor == 'postgresql':
+                    with connections[using].cursor() as cursor:
+                        cursor.execute("SET LOCAL statement_timeout = %s", [min(remaining_ms, config['STATEMENT_TIMEOUT_MS'])])
+                rows.extend(queryset.filter(id__in=book_ids[start:start + chunk_size]))
+        except OperationalError:
+            # Requête annulée par statement_timeout : on rend ce qui a déjà été confirmé
+            return rows, True
+    return rows, False
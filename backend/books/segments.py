@@ -0,0 +1,280 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from functools import cached_property
+
+from django.conf import settings
+
+from .lazy import lazy_import
+from .proximity import closeness_score, encode_positions
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+# Segment d'index binaire immuable, partagé par tous les workers via mmap (cache de pages de l'OS).
+#
+# Disposition (little-endian, chaque section alignée sur 8 octets) :
+#   en-tête            HEADER (magic, version, nb termes, nb postings, nb positions, taille du texte des termes)
+#   term_offsets       uint32[T + 1]  début de chaque terme dans le bloc de texte
+#   term_postings      uint32[T + 1]  premier posting de chaque terme
+#   term_occurrences   uint32[T]      occurrences totales du terme
+#   term_max_tf        uint32[T]      plus grand nombre d'occurrences du terme dans un livre (borne de score)
+#   term_max_quality   float32[T]     plus grande qualité statique des livres du terme (borne de score)
+#   posting_books      int64[P]       id du livre
+#   posting_fields     uint32[P, 4]   occurrences par champ (FIELDS)
+#   posting_closeness  float32[P]     score de proximité précalculé (texte)
+#   posting_quality    float32[P]     qualité statique du livre (popularité, voir topk.py)
+#   posting_impact     uint32[P]      postings du terme classés par occurrences décroissantes (indices locaux)
+#   posting_positions  uint64[P + 1]  premier élément de chaque posting dans positions
+#   positions          uint32[N]      positions absolues dans le texte
+#   terms              octets UTF-8 des termes triés
+
+MAGIC = b'BQSG'
+VERSION = 2
+HEADER = struct.Struct('<4sIIIQQ')
+FIELDS = ('title', 'author', 'summary', 'text')
+CURRENT_FILE = 'CURRENT'
+KEEP_GENERATIONS = 2
+RELOAD_CHECK_INTERVAL = 5
+
+
+def segments_dir(base_dir=None, shard=None):
+    """Répertoire des segments ; chaque shard (voir shards.py) a le sien, avec ses propres générations."""
+    directory = os.path.join(base_dir or settings.BOOKS_INDEX_DIR, 'segments')
+    return directory if shard is None else os.path.join(directory, f'shard_{shard:02d}')
+
+
+def align(offset):
+    return (offset + 7) & ~7
+
+
+def section_layout(term_count, posting_count, position_count):
+    """Liste (nom, dtype, forme) des sections, dans l'ordre du fichier."""
+    return [
+        ('term_offsets', '<u4', (term_count + 1,)),
+        ('term_postings', '<u4', (term_count + 1,)),
+        ('term_occurrences', '<u4', (term_count,)),
+        ('term_max_tf', '<u4', (term_count,)),
+        ('term_max_quality', '<f4', (term_count,)),
+        ('posting_books', '<i8', (posting_count,)),
+        ('posting_fields', '<u4', (posting_count, len(FIELDS))),
+        ('posting_closeness', '<f4', (posting_count,)),
+        ('posting_quality', '<f4', (posting_count,)),
+        ('posting_impact', '<u4', (posting_count,)),
+        ('posting_positions', '<u8', (posting_count + 1,)),
+        ('positions', '<u4', (position_count,)),
+    ]
+
+
+def write_segment(word_index, base_dir=None, shard=None, quality=None):
+    """
+    Écrit un nouveau segment à partir de l'index construit par index_books
+    ({terme: {book_id: {champ: [positions absolues]}}}) et de la qualité statique des livres
+    ({book_id: score entre 0 et 1}), puis le publie atomiquement. Retourne le chemin du segment.
+    """
+    quality = quality or {}
+    directory = segments_dir(base_dir, shard)
+    os.makedirs(directory, exist_ok=True)
+
+    # Tri par octets UTF-8 : la recherche dichotomique du lecteur compare des octets
+    encoded_terms = sorted((word.encode('utf-8'), word) for word in word_index)
+    term_count = len(encoded_terms)
+    posting_count = sum(len(word_index[word]) for _, word in encoded_terms)
+    position_count = sum(
+        len(fields.get('text', ())) for _, word in encoded_terms for fields in word_index[word].values()
+    )
+
+    arrays = {name: np.zeros(shape, dtype=dtype) for name, dtype, shape in section_layout(term_count, posting_count, position_count)}
+    text_offset = posting = position = 0
+    for term_index, (encoded, word) in enumerate(encoded_terms):
+        arrays['term_offsets'][term_index] = text_offset
+        arrays['term_postings'][term_index] = posting
+        text_offset += len(encoded)
+        occurrences = 0
+        first_posting = posting
+        for book_id in sorted(word_index[word]):
+            fields = word_index[word][book_id]
+            counts = [len(fields.get(field, ())) for field in FIELDS]
+            text_positions = sorted(fields.get('text', ()))
+            arrays['posting_books'][posting] = book_id
+            arrays['posting_fields'][posting] = counts
+            arrays['posting_closeness'][posting] = closeness_score(encode_positions(text_positions))
+            arrays['posting_quality'][posting] = quality.get(book_id, 0.0)
+            arrays['posting_positions'][posting] = position
+            arrays['positions'][position:position + len(text_positions)] = text_positions
+            position += len(text_positions)
+            occurrences += sum(counts)
+            posting += 1
+        arrays['term_occurrences'][term_index] = occurrences
+        term_counts = arrays['posting_fields'][first_posting:posting].sum(axis=1)
+        arrays['term_max_tf'][term_index] = term_counts.max()
+        arrays['term_max_quality'][term_index] = arrays['posting_quality'][first_posting:posting].max()
+        arrays['posting_impact'][first_posting:posting] = np.argsort(-term_counts.astype(np.int64), kind='stable')
+    arrays['term_offsets'][term_count] = text_offset
+    arrays['term_postings'][term_count] = posting
+    arrays['posting_positions'][posting_count] = position
+    terms_blob = b''.join(encoded for encoded, _ in encoded_terms)
+
+    generation = current_generation(directory) + 1
+    path = os.path.join(directory, f'segment_{generation:08d}.bin')
+    with open(f'{path}.tmp', 'wb') as output:
+        output.write(HEADER.pack(MAGIC, VERSION, term_count, posting_count, position_count, len(terms_blob)))
+        for name, _, _ in section_layout(term_count, posting_count, position_count):
+            output.write(b'\0' * (align(output.tell()) - output.tell()))
+            output.write(arrays[name].tobytes())
+        output.write(terms_blob)
+    os.replace(f'{path}.tmp', path)
+
+    # Publication : les workers détectent le nouveau CURRENT et basculent sans redémarrer
+    with open(os.path.join(directory, f'{CURRENT_FILE}.tmp'), 'w') as current:
+        current.write(os.path.basename(path))
+    os.replace(os.path.join(directory, f'{CURRENT_FILE}.tmp'), os.path.join(directory, CURRENT_FILE))
+
+    remove_old_segments(directory, generation)
+    return path
+
+
+def generation_of(name):
+    return int(name[len('segment_'):-len('.bin')])
+
+
+def current_generation(directory):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as current:
+            return generation_of(current.read().strip())
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def remove_old_segments(directory, generation):
+    # Supprimer un fichier encore mappé par un worker est sans danger (POSIX) : il disparaît à la fermeture
+    for name in os.listdir(directory):
+        if name.startswith('segment_') and name.endswith('.bin'):
+            if generation_of(name) <= generation - KEEP_GENERATIONS:
+                os.remove(os.path.join(directory, name))
+
+
+class Postings:
+    """Vue (sans copie) sur les postings d'un terme."""
+
+    def __init__(self, segment, index, start, end):
+        self.segment = segment
+        self.start = start
+        self.end = end
+        self.occurrences = int(segment.term_occurrences[index])
+        self.max_tf = int(segment.term_max_tf[index])
+        self.max_quality = float(segment.term_max_quality[index])
+        self.book_ids = segment.posting_books[start:end]
+        self.field_counts = segment.posting_fields[start:end]
+        self.closeness = segment.posting_closeness[start:end]
+        self.quality = segment.posting_quality[start:end]
+        self.impact_order = segment.posting_impact[start:end]
+
+    def __len__(self):
+        return self.end - self.start
+
+    def occurrences_per_book(self):
+        return self.field_counts.sum(axis=1)
+
+    def text_positions(self, index):
+        """Positions absolues du terme dans le texte du index-ième livre de la liste."""
+        bounds = self.segment.posting_positions
+        return self.segment.positions[bounds[self.start + index]:bounds[self.start + index + 1]]
+
+
+class Segment:
+    """Segment mappé en lecture seule : les tableaux NumPy pointent directement dans le cache de pages."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as source:
+            self.mmap = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, term_count, posting_count, position_count, terms_size = HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Segment invalide : {path}")
+        self.term_count = term_count
+
+        offset = HEADER.size
+        for name, dtype, shape in section_layout(term_count, posting_count, position_count):
+            offset = align(offset)
+            count = int(np.prod(shape))
+            array = np.frombuffer(self.mmap, dtype=dtype, count=count, offset=offset).reshape(shape)
+            setattr(self, name, array)
+            offset += array.nbytes
+        self.terms_offset = offset
+
+    @cached_property
+    def book_count(self):
+        """Nombre de livres distincts du segment (statistique globale des shards)."""
+        return len(np.unique(self.posting_books))
+
+    def term_at(self, index):
+        # Le découpage d'un mmap retourne des bytes : seuls les quelques octets du terme sont copiés
+        return self.mmap[self.terms_offset + self.term_offsets[index]:self.terms_offset + self.term_offsets[index + 1]]
+
+    def find(self, term):
+        """Index du terme dans le dictionnaire (recherche dichotomique sur les octets), ou None."""
+        target = term.encode('utf-8')
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.term_at(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.term_count and self.term_at(low) == target:
+            return low
+        return None
+
+    def postings(self, term):
+        index = self.find(term)
+        if index is None:
+            return None
+        return Postings(self, index, int(self.term_postings[index]), int(self.term_postings[index + 1]))
+
+
+class SegmentLoader:
+    """Segment courant du processus ; bascule sur une nouvelle génération dès qu'elle est publiée."""
+
+    def __init__(self, shard=None):
+        self.shard = shard
+        self.lock = threading.Lock()
+        self.segment = None
+        self.current_name = None
+        self.generation = 0  # Génération publiée (0 : aucun segment), même valeur dans tous les processus
+        self.checked_at = None
+
+    def get(self):
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < RELOAD_CHECK_INTERVAL:
+            return self.segment
+        with self.lock:
+            self.checked_at = now
+            directory = segments_dir(shard=self.shard)
+            try:
+                with open(os.path.join(directory, CURRENT_FILE)) as current:
+                    name = current.read().strip()
+            except FileNotFoundError:
+                return self.segment
+            if name != self.current_name:
+                # L'ancien segment reste valide tant que des requêtes en cours le référencent
+                try:
+                    self.segment = Segment(os.path.join(directory, name))
+                except ValueError:
+                    # Segment d'une version antérieure du format : ignoré jusqu'à la prochaine indexation
+                    logger.warning("Segment %s illisible, relancer index_books", name)
+                    self.segment = None
+                self.current_name = name
+                self.generation = generation_of(name)
+            return self.segment
+
+    def invalidate(self):
+        """Relire CURRENT au prochain accès (segment publié par le processus courant)."""
+        self.checked_at = None
+
+
+segment_loader = SegmentLoader()
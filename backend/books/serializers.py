@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Author, Book, InvertedIndex
+from .models import Author, Book, InvertedIndex, Job
 
 class AuthorSerializer(serializers.ModelSerializer):
     class Meta:
@@ -14,3 +14,18 @@ class BookSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'author', 'languages', 'summary', 'formats',
         ]
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'kind', 'status', 'progress', 'stage', 'error', 'cancel_requested',
+            'created_at', 'started_at', 'finished_at',
+        ]
+
+
+class JobDetailSerializer(JobSerializer):
+    """Options et sortie de la commande : réservées au personnel."""
+
+    class Meta(JobSerializer.Meta):
+        fields = JobSerializer.Meta.fields + ['options', 'output', 'worker', 'heartbeat_at']
@@ -0,0 +1,282 @@
+import hashlib
+import heapq
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import get_context
+from multiprocessing.connection import Client, Listener
+
+from django.conf import settings
+from django.db import connections
+
+from .lazy import lazy_import
+from .segments import RELOAD_CHECK_INTERVAL, SegmentLoader, segments_dir, write_segment
+
+np = lazy_import('numpy')
+
+# Index partitionné par plages d'ids de livres : chaque shard est un segment (voir segments.py) servi par
+# son propre processus (manage.py serve_shards) sur une socket Unix locale. Le coordinateur, dans les
+# workers Django, envoie la requête à tous les shards en parallèle (scatter), agrège les statistiques
+# globales (nombre de livres, fréquences documentaires) puis fusionne les top-k de chaque shard (gather).
+
+MANIFEST_FILE = 'shards.json'
+
+
+class ShardUnavailable(Exception):
+    """Un shard ne répond pas : l'appelant se replie sur l'index non partitionné."""
+
+
+def shard_ranges(book_ids, count):
+    """Découpe les ids de livres en `count` plages contiguës de même taille : [(premier id, dernier id)]."""
+    book_ids = sorted(book_ids)
+    count = max(1, min(count, len(book_ids)))
+    bounds = [len(book_ids) * i // count for i in range(count + 1)]
+    return [(book_ids[bounds[i]], book_ids[bounds[i + 1] - 1]) for i in range(count)]
+
+
+def partition_index(word_index, low, high):
+    """Sous-index des livres dont l'id est dans [low, high]."""
+    partition = {}
+    for word, books in word_index.items():
+        shard_books = {book_id: fields for book_id, fields in books.items() if low <= book_id <= high}
+        if shard_books:
+            partition[word] = shard_books
+    return partition
+
+
+def manifest_path(base_dir=None):
+    return os.path.join(segments_dir(base_dir), MANIFEST_FILE)
+
+
+def read_manifest(base_dir=None):
+    try:
+        with open(manifest_path(base_dir)) as manifest:
+            return json.load(manifest)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(ranges, base_dir=None):
+    path = manifest_path(base_dir)
+    with open(f'{path}.tmp', 'w') as manifest:
+        json.dump({'count': len(ranges), 'ranges': ranges}, manifest)
+    os.replace(f'{path}.tmp', path)
+
+
+def remove_manifest(base_dir=None):
+    try:
+        os.remove(manifest_path(base_dir))
+    except FileNotFoundError:
+        pass
+
+
+# Index global hérité par les processus de construction (fork) : évite de sérialiser l'index complet
+_build_index = None
+
+
+def _build_shard(shard, low, high, base_dir, quality):
+    return write_segment(partition_index(_build_index, low, high), base_dir, shard=shard, quality=quality)
+
+
+def build_shards(word_index, count, base_dir=None, quality=None):
+    """Écrit un segment par shard, en parallèle (un processus par shard), puis publie le manifeste."""
+    global _build_index
+    ranges = shard_ranges({book_id for books in word_index.values() for book_id in books}, count)
+
+    # Les connexions PostgreSQL ne doivent pas être partagées avec les processus forkés
+    connections.close_all()
+    _build_index = word_index
+    try:
+        with ProcessPoolExecutor(max_workers=len(ranges), mp_context=get_context('fork')) as executor:
+            futures = [executor.submit(_build_shard, shard, low, high, base_dir, quality) for shard, (low, high) in enumerate(ranges)]
+            paths = [future.result() for future in futures]
+    finally:
+        _build_index = None
+
+    write_manifest(ranges, base_dir)
+    return paths
+
+
+def socket_path(shard):
+    return os.path.join(settings.BOOKS_SHARDS['SOCKET_DIR'], f'shard_{shard:02d}.sock')
+
+
+def remove_socket(shard):
+    try:
+        os.remove(socket_path(shard))
+    except FileNotFoundError:
+        pass
+
+
+def authkey():
+    return hashlib.sha256(f'shards:{settings.SECRET_KEY}'.encode('utf-8')).digest()
+
+
+class ShardServer:
+    """Processus d'un shard : répond aux requêtes du coordinateur à partir de son segment mappé."""
+
+    # Seules opérations exposées sur la socket (et non n'importe quel attribut du serveur)
+    operations = ('stats', 'top_k', 'occurrences')
+
+    def __init__(self, shard):
+        self.shard = shard
+        self.loader = SegmentLoader(shard)
+
+    def serve_forever(self):
+        path = socket_path(self.shard)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)  # Socket d'une exécution précédente
+        try:
+            with Listener(path, family='AF_UNIX', authkey=authkey()) as listener:
+                while True:
+                    connection = listener.accept()
+                    # Une connexion par thread de worker Django, gardée ouverte entre les requêtes
+                    threading.Thread(target=self.handle_connection, args=(connection,), daemon=True).start()
+        finally:
+            remove_socket(self.shard)  # Sinon le coordinateur croirait le shard toujours disponible
+
+    def handle_connection(self, connection):
+        with connection:
+            while True:
+                try:
+                    operation, arguments = connection.recv()
+                except (EOFError, OSError):
+                    return
+                if operation not in self.operations:
+                    connection.send((False, f"Opération inconnue : {operation!r}"))
+                    continue
+                try:
+                    connection.send((True, getattr(self, operation)(**arguments)))
+                except Exception as error:
+                    # L'erreur est renvoyée au coordinateur au lieu de fermer la connexion
+                    connection.send((False, repr(error)))
+
+    def stats(self, terms):
+        """Nombre de livres du shard et fréquence documentaire locale de chaque terme."""
+        segment = self.loader.get()
+        if segment is None:
+            return {'books': 0, 'document_frequencies': {term: 0 for term in terms}}
+        frequencies = {}
+        for term in terms:
+            postings = segment.postings(term)
+            frequencies[term] = len(postings) if postings is not None else 0
+        return {'books': segment.book_count, 'document_frequencies': frequencies}
+
+    def occurrences(self, term):
+        """[(book_id, occurrences)] des livres du shard contenant le terme, sans calcul de score."""
+        segment = self.loader.get()
+        postings = segment.postings(term) if segment is not None else None
+        if postings is None:
+            return []
+        return list(zip(postings.book_ids.tolist(), postings.occurrences_per_book().tolist()))
+
+    def top_k(self, terms, idf, k=None):
+        """[(book_id, score, occurrences)] des livres contenant tous les termes, score décroissant."""
+        segment = self.loader.get()
+        all_postings = [segment.postings(term) for term in terms] if segment is not None else [None]
+        if any(postings is None for postings in all_postings):
+            return []
+
+        common = all_postings[0].book_ids
+        for postings in all_postings[1:]:
+            common = np.intersect1d(common, postings.book_ids, assume_unique=True)
+        scores = np.zeros(len(common), dtype=np.float64)
+        occurrences = np.zeros(len(common), dtype=np.int64)
+        for term, postings in zip(terms, all_postings):
+            term_occurrences = postings.occurrences_per_book()[np.searchsorted(postings.book_ids, common)].astype(np.int64)
+            occurrences += term_occurrences
+            scores += term_occurrences * idf[term]
+
+        order = np.argsort(-scores, kind='stable')[:k]
+        return list(zip(common[order].tolist(), scores[order].tolist(), occurrences[order].tolist()))
+
+
+class ShardCoordinator:
+    """Côté worker Django : diffuse une requête à tous les shards et fusionne les réponses."""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.manifest = None
+        self.checked_at = 0
+
+    def available(self):
+        """Vrai si un index partitionné est publié et que tous ses shards écoutent."""
+        now = time.monotonic()
+        if now - self.checked_at >= RELOAD_CHECK_INTERVAL:
+            self.checked_at = now
+            manifest = read_manifest()
+            if manifest and all(os.path.exists(socket_path(shard)) for shard in range(manifest['count'])):
+                self.manifest = manifest
+            else:
+                self.manifest = None
+        return self.manifest is not None and self.manifest['count'] > 1
+
+    def connections(self):
+        count = self.manifest['count']
+        if getattr(self.local, 'connections', None) is None or len(self.local.connections) != count:
+            self.close()
+            self.local.connections = [
+                Client(socket_path(shard), family='AF_UNIX', authkey=authkey()) for shard in range(count)
+            ]
+        return self.local.connections
+
+    def close(self):
+        for connection in getattr(self.local, 'connections', None) or []:
+            connection.close()
+        self.local.connections = None
+
+    def scatter(self, operation, **arguments):
+        """Envoie la requête à tous les shards avant d'attendre les réponses : les shards travaillent en parallèle."""
+        timeout = settings.BOOKS_SHARDS['TIMEOUT']
+        try:
+            shard_connections = self.connections()
+            for connection in shard_connections:
+                connection.send((operation, arguments))
+            responses = []
+            for connection in shard_connections:
+                if not connection.poll(timeout):
+                    raise ShardUnavailable(f"Shard sans réponse après {timeout} s")
+                ok, response = connection.recv()
+                if not ok:
+                    raise ShardUnavailable(f"Erreur du shard : {response}")
+                responses.append(response)
+            return responses
+        except (OSError, EOFError) as error:
+            self.close()
+            # Shard arrêté (socket restante ou refusée) : index non partitionné jusqu'à la prochaine vérification
+            self.manifest = None
+            self.checked_at = time.monotonic()
+            raise ShardUnavailable(str(error)) from error
+        except ShardUnavailable:
+            self.close()  # Une réponse en retard ne doit pas être lue par la requête suivante
+            raise
+
+    def search(self, terms, k=None):
+        """
+        Top-k global des livres contenant tous les termes : [(book_id, score, occurrences)].
+        Le score tf-idf utilise les statistiques de l'ensemble des shards, pas celles de chaque shard.
+        """
+        stats = self.scatter('stats', terms=terms)
+        total_books = sum(shard_stats['books'] for shard_stats in stats)
+        document_frequencies = {
+            term: sum(shard_stats['document_frequencies'][term] for shard_stats in stats) for term in terms
+        }
+        if not total_books or not all(document_frequencies.values()):
+            return []
+
+        idf = {term: math.log(1 + total_books / frequency) for term, frequency in document_frequencies.items()}
+        results = self.scatter('top_k', terms=terms, idf=idf, k=k)
+        merged = heapq.merge(*results, key=lambda result: -result[1])
+        return list(islice(merged, k))
+
+    def occurrences(self, term):
+        """{book_id: occurrences} du terme sur l'ensemble des shards, en un seul aller-retour (pas de statistiques globales)."""
+        return {book_id: count for response in self.scatter('occurrences', term=term) for book_id, count in response}
+
+
+shard_coordinator = ShardCoordinator()
@@ -0,0 +1,106 @@
+import re
+from array import array
+
+from django.db.models.functions import Substr
+
+from .analysis import TOKEN_PATTERN, book_languages, get_analyzer, index_options
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+
+# Extraits « mot-clé en contexte » (KWIC) découpés dans le texte brut sans le parcourir en entier.
+#
+# À l'indexation, on garde la position (en caractères) d'un terme indexé sur CHECKPOINT_INTERVAL dans
+# Book.text_offsets. Le terme n° p du texte se trouve alors entre deux points de repère consécutifs :
+# on lit seulement ce morceau du texte en base (SUBSTR), on y retrouve le terme par l'analyseur, puis
+# on coupe CONTEXT_CHARS caractères de chaque côté.
+
+CHECKPOINT_INTERVAL = 32
+CONTEXT_CHARS = 80
+MAX_SNIPPETS = 3
+WINDOW_TERMS = 20  # Rayon (en termes indexés) utilisé pour repérer les passages les plus denses
+WHITESPACE = re.compile(r'\s+')
+
+
+def encode_offsets(text_start, offsets, text_length):
+    """
+    Points de repère d'un texte : position du premier terme du texte dans l'index, puis la position en
+    caractères d'un terme sur CHECKPOINT_INTERVAL, et la longueur du texte comme dernière borne.
+    """
+    checkpoints = array('I', [text_start])
+    checkpoints.extend(offsets[::CHECKPOINT_INTERVAL])
+    checkpoints.append(text_length)
+    return checkpoints.tobytes()
+
+
+def decode_offsets(blob):
+    checkpoints = array('I')
+    checkpoints.frombytes(bytes(blob))
+    return checkpoints[0], checkpoints[1:]
+
+
+def best_positions(positions, count=MAX_SNIPPETS, radius=WINDOW_TERMS):
+    """Occurrences au centre des passages où le terme est le plus dense, sans chevauchement, dans l'ordre du texte."""
+    positions = np.asarray(positions, dtype=np.int64)
+    if len(positions) == 0:
+        return []
+    density = np.searchsorted(positions, positions + radius, side='right') - np.searchsorted(positions, positions - radius)
+    chosen = []
+    for index in np.argsort(-density, kind='stable').tolist():
+        position = int(positions[index])
+        if all(abs(position - other) > 2 * radius for other in chosen):
+            chosen.append(position)
+            if len(chosen) == count:
+                break
+    return sorted(chosen)
+
+
+def build_snippets(book, term, positions):
+    """
+    Extraits du texte de `book` (avec text_offsets et languages chargés) autour des positions absolues
+    données : [{'text': '... <mark>mot</mark> ...', 'position': p}]. Une seule requête pour tous les extraits.
+    """
+    from .models import Book
+
+    if not book.text_offsets or not positions:
+        return []
+    text_start, checkpoints = decode_offsets(book.text_offsets)
+
+    # Morceau de texte à lire pour chaque extrait : du point de repère précédent au suivant, plus le contexte
+    chunks = {}
+    for position in positions:
+        index = position - text_start
+        checkpoint = index // CHECKPOINT_INTERVAL
+        if index < 0 or checkpoint + 1 >= len(checkpoints):
+            continue
+        start = max(checkpoints[checkpoint] - CONTEXT_CHARS, 0)
+        end = checkpoints[checkpoint + 1] + CONTEXT_CHARS
+        chunks[position] = (checkpoint, start, end)
+    if not chunks:
+        return []
+
+    # SUBSTR est indexé à partir de 1 ; seuls ces morceaux quittent la base
+    texts = Book.objects.filter(id=book.id).values(**{
+        f'chunk_{position}': Substr('text', start + 1, end - start) for position, (_, start, end) in chunks.items()
+    }).first() or {}
+
+    # Même analyse qu'à l'indexation (options enregistrées avec l'index)
+    analyzer = get_analyzer(book_languages(book.languages), **index_options())
+    snippets = []
+    for position, (checkpoint, start, _) in chunks.items():
+        chunk = texts.get(f'chunk_{position}') or ''
+        skip = checkpoints[checkpoint] - start
+        # Le morceau commence au terme n° checkpoint * CHECKPOINT_INTERVAL : on avance jusqu'au terme voulu
+        spans = analyzer.analyze_spans(chunk[skip:])
+        rank = (position - text_start) % CHECKPOINT_INTERVAL
+        if rank >= len(spans) or spans[rank][0] != term:
+            continue
+        match_start = skip + spans[rank][2]
+        match_end = TOKEN_PATTERN.match(chunk, match_start).end()
+        left = chunk[max(match_start - CONTEXT_CHARS, 0):match_start]
+        right = chunk[match_end:match_end + CONTEXT_CHARS]
+        snippets.append({
+            'text': f"…{WHITESPACE.sub(' ', left)}<mark>{chunk[match_start:match_end]}</mark>{WHITESPACE.sub(' ', right)}…",
+            'position': position,
+        })
+    return snippets
@@ -0,0 +1,77 @@
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .corpus_stats import CATALOG_DIMENSIONS, latest_snapshot
+from .models import CatalogStatistic, CorpusSnapshot, TermStatistic
+
+MAX_LIMIT = 500
+
+
+def parse_limit(request, default=50):
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        return None
+    return limit if 1 <= limit <= MAX_LIMIT else None
+
+
+# ✅ Statistiques du corpus (tables matérialisées par index_books, voir corpus_stats.py)
+class CorpusStatsView(APIView):
+    history_length = 100
+
+    def get(self, request):
+        snapshot = latest_snapshot()
+        if snapshot is None:
+            return Response({'error': "Statistiques indisponibles, lancer index_books."}, status=status.HTTP_404_NOT_FOUND)
+        history = CorpusSnapshot.objects.values(
+            'created_at', 'book_count', 'vocabulary_size', 'posting_count', 'total_occurrences',
+        )[:self.history_length]
+        return Response({
+            'created_at': snapshot.created_at,
+            'book_count': snapshot.book_count,
+            'vocabulary_size': snapshot.vocabulary_size,
+            'posting_count': snapshot.posting_count,
+            'total_occurrences': snapshot.total_occurrences,
+            'hapax_count': snapshot.hapax_count,
+            'history': list(reversed(history)),  # Évolution du vocabulaire, de la plus ancienne indexation à la plus récente
+        })
+
+
+class DocumentFrequencyDistributionView(APIView):
+    def get(self, request):
+        snapshot = latest_snapshot()
+        if snapshot is None:
+            return Response({'error': "Statistiques indisponibles, lancer index_books."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'vocabulary_size': snapshot.vocabulary_size,
+            'hapax_count': snapshot.hapax_count,
+            'buckets': snapshot.df_distribution,
+        })
+
+
+class TopTermsView(APIView):
+    orders = ('document_frequency', 'occurrences')
+
+    def get(self, request):
+        order = request.GET.get('order', 'document_frequency')
+        limit = parse_limit(request)
+        if order not in self.orders or limit is None:
+            return Response({'error': 'Paramètres invalides.'}, status=status.HTTP_400_BAD_REQUEST)
+        terms = TermStatistic.objects.order_by(f'-{order}', 'term').values(
+            'term', 'surface', 'document_frequency', 'occurrences',
+        )[:limit]
+        return Response({'terms': list(terms)})
+
+
+class CatalogStatsView(APIView):
+    orders = ('book_count', 'download_count')
+
+    def get(self, request, dimension):
+        order = request.GET.get('order', 'book_count')
+        limit = parse_limit(request)
+        if dimension not in CATALOG_DIMENSIONS or order not in self.orders or limit is None:
+            return Response({'error': 'Paramètres invalides.'}, status=status.HTTP_400_BAD_REQUEST)
+        rows = CatalogStatistic.objects.filter(dimension=dimension)
+        values = rows.order_by(f'-{order}', 'value').values('value', 'book_count', 'download_count')[:limit]
+        return Response({'dimension': dimension, 'total_values': rows.count(), 'values': list(values)})
@@ -0,0 +1,111 @@
+import itertools
+import json
+import random
+from bisect import bisect_left
+
+# Mots-outils placés en tête du classement de fréquence (comme dans un vrai texte anglais)
+FUNCTION_WORDS = [
+    'the', 'of', 'and', 'to', 'a', 'in', 'that', 'he', 'was', 'it', 'his', 'i', 'with', 'as',
+    'had', 'for', 'you', 'her', 'not', 'is', 'at', 'be', 'on', 'by', 'but', 'him', 'she', 'my',
+]
+SYLLABLES = [
+    'ka', 'lo', 'mi', 'ren', 'tor', 'sa', 'vel', 'di', 'an', 'quo', 'ber', 'ti', 'nor', 'ul',
+    'es', 'gra', 'pho', 'zen', 'mar', 'il', 'cu', 'dre', 'wyn', 'ost', 'fa', 'lin', 'gu', 'ep',
+]
+SUBJECTS = [
+    'Science fiction', 'Adventure stories', 'Detective and mystery stories', 'Love stories',
+    'Poetry', 'History', 'Philosophy', 'Fairy tales', 'Travel', 'Biography',
+]
+BOOKSHELVES = ['Best Books Ever Listings', 'Harvard Classics', 'Children\'s Literature', 'Gothic Fiction', 'Humor']
+LANGUAGES = ['en', 'en', 'en', 'en', 'fr', 'de']
+
+
+def build_vocabulary(size):
+    """Construit un vocabulaire déterministe : mots-outils puis mots synthétiques uniques."""
+    vocabulary = list(FUNCTION_WORDS)
+    for length in itertools.count(1):
+        for combination in itertools.product(SYLLABLES, repeat=length):
+            if len(vocabulary) >= size:
+                return vocabulary
+            vocabulary.append(''.join(combination))
+
+
+class ZipfSampler:
+    """Tire des mots selon une loi de Zipf (fréquence du rang r proportionnelle à 1 / r^s)."""
+
+    def __init__(self, vocabulary, exponent=1.07, seed=0):
+        self.vocabulary = vocabulary
+        self.random = random.Random(seed)
+        self.cum_weights = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, len(vocabulary) + 1)))
+
+    def sample(self, count):
+        return self.random.choices(self.vocabulary, cum_weights=self.cum_weights, k=count)
+
+    def rank_of(self, quantile):
+        """Rang du mot correspondant à un quantile de la masse de probabilité (utile pour les jeux de requêtes)."""
+        return bisect_left(self.cum_weights, quantile * self.cum_weights[-1])
+
+
+def generate_book(sampler, gutenberg_id, words_per_book):
+    rng = sampler.random
+    word_count = rng.randint(*words_per_book)
+    words = sampler.sample(word_count)
+
+    # Découper en phrases et paragraphes pour imiter la mise en forme Gutenberg
+    lines = []
+    index = 0
+    while index < word_count:
+        sentence_length = rng.randint(6, 24)
+        sentence = words[index:index + sentence_length]
+        index += sentence_length
+        lines.append(' '.join(sentence).capitalize() + '.')
+        if rng.random() < 0.15:
+            lines.append('')
+
+    author_name = ' '.join(w.capitalize() for w in sampler.sample(2))
+    return {
+        'id': gutenberg_id,
+        'title': ' '.join(sampler.sample(rng.randint(2, 6))).title(),
+        'authors': [{'name': author_name, 'birth_year': rng.randint(1700, 1900), 'death_year': None}],
+        'summaries': [' '.join(sampler.sample(40)).capitalize() + '.'],
+        'subjects': rng.sample(SUBJECTS, rng.randint(1, 3)),
+        'bookshelves': rng.sample(BOOKSHELVES, rng.randint(0, 2)),
+        'languages': [rng.choice(LANGUAGES)],
+        'translators': [],
+        'copyright': rng.random() < 0.05,
+        'media_type': 'Text',
+        'formats': {'text/plain; charset=us-ascii': f'synthetic://{gutenberg_id}.txt'},
+        'download_count': int(100000 / rng.randint(1, 1000)),
+        'text': '\n'.join(lines),
+    }
+
+
+def generate_corpus(num_books, vocabulary_size=50000, words_per_book=(10000, 30000), exponent=1.07, seed=0):
+    """Génère un corpus synthétique de type Gutenberg, livre par livre (générateur)."""
+    sampler = ZipfSampler(build_vocabulary(vocabulary_size), exponent=exponent, seed=seed)
+    for offset in range(num_books):
+        yield generate_book(sampler, 900000 + offset, words_per_book)
+
+
+def write_catalog(path, books):
+    """Écrit un catalogue au format JSON Lines (un livre Gutendex par ligne, texte inclus)."""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as catalog:
+        for book in books:
+            catalog.write(json.dumps(book) + '\n')
+            count += 1
+    return count
+
+
+def read_catalog(path, page_size=32):
+    """Relit un catalogue JSON Lines par pages, comme l'API Gutendex."""
+    with open(path, encoding='utf-8') as catalog:
+        page = []
+        for line in catalog:
+            if line.strip():
+                page.append(json.loads(line))
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
@@ -0,0 +1,120 @@
+import heapq
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from django.conf import settings
+
+MAGIC = b'BQTD'
+VERSION = 1
+HEADER = struct.Struct('<4sIII')  # magic, version, nombre de termes, taille du bloc de texte
+FILE_NAME = 'term_dictionary.bin'
+
+SHORT_PREFIX_LENGTH = 3  # Les complétions des préfixes courts (plages très larges) sont mémorisées
+SHORT_PREFIX_CACHE_SIZE = 4096  # ... dans un LRU borné : les préfixes viennent des utilisateurs
+RELOAD_CHECK_INTERVAL = 5  # Secondes entre deux vérifications de la date du fichier
+
+
+def dictionary_path():
+    return os.path.join(settings.BOOKS_INDEX_DIR, FILE_NAME)
+
+
+def write_term_dictionary(document_frequencies, path=None):
+    """
+    Écrit le dictionnaire des termes : mots triés + fréquence documentaire de chacun.
+    Format : en-tête, tableau uint32 des fréquences, puis les mots en UTF-8 séparés par '\\n'.
+    """
+    path = path or dictionary_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    words = sorted(document_frequencies)
+    frequencies = array('I', (document_frequencies[word] for word in words))
+    blob = '\n'.join(words).encode('utf-8')
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, VERSION, len(words), len(blob)))
+        output.write(frequencies.tobytes())
+        output.write(blob)
+    os.replace(tmp_path, path)  # Remplacement atomique : les workers ne lisent jamais un fichier partiel
+    return len(words)
+
+
+class TermDictionary:
+    """Dictionnaire trié en mémoire : recherche des complétions d'un préfixe par dichotomie."""
+
+    def __init__(self, words, frequencies):
+        self.words = words
+        self.frequencies = frequencies
+        self.short_prefixes = OrderedDict()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as source:
+            magic, version, count, blob_size = HEADER.unpack(source.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"Dictionnaire de termes invalide : {path}")
+            frequencies = array('I')
+            frequencies.frombytes(source.read(count * frequencies.itemsize))
+            words = source.read(blob_size).decode('utf-8').split('\n') if count else []
+        return cls(words, frequencies)
+
+    def prefix_range(self, prefix):
+        start = bisect_left(self.words, prefix)
+        # '\U0010ffff' est supérieur à tout caractère : fin de la plage des mots commençant par le préfixe
+        end = bisect_left(self.words, prefix + '\U0010ffff', start)
+        return start, end
+
+    def complete(self, prefix, limit=10):
+        """Complétions classées par fréquence documentaire décroissante."""
+        if len(prefix) <= SHORT_PREFIX_LENGTH:
+            with self.lock:
+                completions = self.short_prefixes.get(prefix)
+                if completions is not None:
+                    self.short_prefixes.move_to_end(prefix)
+            if completions is None:
+                completions = self.top_in_range(prefix, 50)
+                with self.lock:
+                    self.short_prefixes[prefix] = completions
+                    if len(self.short_prefixes) > SHORT_PREFIX_CACHE_SIZE:
+                        self.short_prefixes.popitem(last=False)
+            return completions[:limit]
+        return self.top_in_range(prefix, limit)
+
+    def top_in_range(self, prefix, limit):
+        start, end = self.prefix_range(prefix)
+        best = heapq.nsmallest(limit, range(start, end), key=lambda i: (-self.frequencies[i], self.words[i]))
+        return [(self.words[i], self.frequencies[i]) for i in best]
+
+
+class TermDictionaryLoader:
+    """Charge le dictionnaire à la demande et le recharge quand index_books en écrit un nouveau."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dictionary = None
+        self.mtime = None
+        self.checked_at = 0
+
+    def get(self):
+        now = time.monotonic()
+        if self.dictionary is not None and now - self.checked_at < RELOAD_CHECK_INTERVAL:
+            return self.dictionary
+        with self.lock:
+            self.checked_at = now
+            path = dictionary_path()
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                return self.dictionary
+            if mtime != self.mtime:
+                self.dictionary = TermDictionary.load(path)
+                self.mtime = mtime
+            return self.dictionary
+
+
+term_dictionary = TermDictionaryLoader()
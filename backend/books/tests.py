@@ -1,3 +1,663 @@
-from django.test import TestCase
+import hashlib
+import io
+import random
+import tempfile
+import threading
+import zlib
+from collections import Counter
+from multiprocessing import Pipe
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from . import analysis as analysis_module, book_display, corpus_stats, fingerprint, jobs
+from .analysis import analyze_query, index_analysis, query_analyzer, write_index_analysis
+from .models import Book, CatalogStatistic, InvertedIndex, Job, TermStatistic
+from .proximity import decode_positions
+from .query_cache import QueryCache
+from .query_planner import QueryRejected, document_frequencies, plan_regex, required_clauses, sre_parse
+from . import topk
+from .segments import Segment, segment_loader, write_segment
+from .shards import ShardCoordinator, ShardServer, ShardUnavailable, partition_index
+from . import term_dictionary as term_dictionary_module
+from .term_dictionary import TermDictionary
+
+
+@skipUnless(connection.vendor == 'postgresql', "Plans d'exécution spécifiques à PostgreSQL")
+class InvertedIndexLookupPlanTests(TestCase):
+    """Les recherches de termes doivent toujours passer par un index, jamais par un parcours séquentiel."""
+
+    @classmethod
+    def setUpTestData(cls):
+        InvertedIndex.objects.bulk_create(
+            InvertedIndex(word=f'word{i}', surface=f'word{i}', occurrences=1) for i in range(200)
+        )
+
+    def setUp(self):
+        # Sur une petite table le planificateur préfère un parcours séquentiel : on l'interdit
+        # pour vérifier qu'un index est effectivement utilisable pour chaque forme de requête.
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+            cursor.execute("ANALYZE books_invertedindex")
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        self.assertNotIn('Seq Scan', plan, plan)
+        self.assertIn('Index', plan, plan)
+
+    def test_term_lookup_uses_unique_index(self):
+        self.assertUsesIndex(InvertedIndex.objects.for_term('Word42'))
+
+    def test_terms_lookup_uses_unique_index(self):
+        self.assertUsesIndex(InvertedIndex.objects.for_terms(['word1', 'WORD2']))
+
+    def test_for_term_normalizes_case(self):
+        self.assertEqual(InvertedIndex.objects.for_term('WORD42').get().word, 'word42')
+
+    def test_iexact_lookup_uses_expression_index(self):
+        self.assertUsesIndex(InvertedIndex.objects.filter(word__iexact='WORD42'))
+
+    def test_prefix_lookup_uses_pattern_index(self):
+        self.assertUsesIndex(InvertedIndex.objects.filter(word__startswith='word4'))
+
+    def test_fuzzy_lookup_uses_trigram_index(self):
+        self.assertUsesIndex(InvertedIndex.objects.filter(surface__trigram_similar='wrod42'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class QueryCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.query_cache = QueryCache(TIMEOUT=60, STALE_TIMEOUT=60)
+        patcher = mock.patch.object(segment_loader, 'get')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.set_generation(1)
+
+    def set_generation(self, generation):
+        patcher = mock.patch.object(segment_loader, 'generation', generation)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hit_within_generation(self):
+        calls = []
+        for _ in range(2):
+            value = self.query_cache.get_or_compute('search', lambda: calls.append(1) or 'résultat', word='a')
+        self.assertEqual((value, len(calls)), ('résultat', 1))
+
+    def test_new_generation_recomputes_and_clears_local_entries(self):
+        self.query_cache.get_or_compute('search', lambda: 'ancien index', word='a')
+        self.set_generation(2)
+        self.assertEqual(self.query_cache.get_or_compute('search', lambda: 'nouvel index', word='a'), 'nouvel index')
+        self.assertEqual(len(self.query_cache.entries), 1)
+
+    def test_clear_local_keeps_shared_entries(self):
+        self.query_cache.get_or_compute('search', lambda: 'partagé', word='a')
+        self.query_cache.clear_local()
+        self.assertEqual(len(self.query_cache.entries), 0)
+        self.assertEqual(self.query_cache.get_or_compute('search', lambda: 'recalculé', word='a'), 'partagé')
+
+    def test_cache_if_refuses_partial_results(self):
+        self.query_cache.get_or_compute('search', lambda: 'partiel', cache_if=lambda value: False, word='a')
+        self.assertEqual(self.query_cache.get_or_compute('search', lambda: 'complet', word='a'), 'complet')
+
+    def test_single_flight_computes_once(self):
+        started, release, calls = threading.Event(), threading.Event(), []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'valeur'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.query_cache.get_or_compute('search', compute, word='a')))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual((results, len(calls)), (['valeur'] * 4, 1))
+        self.assertEqual(self.query_cache.key_locks, {})
+
+    def test_shared_lock_is_only_released_by_its_owner(self):
+        token = self.query_cache.acquire_shared_lock('clé:lock')
+        self.assertIsNone(self.query_cache.acquire_shared_lock('clé:lock'))
+        self.query_cache.release_shared_lock('clé:lock', 'jeton d’un autre worker')
+        self.assertEqual(cache.get('clé:lock'), token)
+        self.query_cache.release_shared_lock('clé:lock', token)
+        self.assertIsNone(cache.get('clé:lock'))
+
+    def test_result_stored_before_the_lock_is_acquired_is_reused(self):
+        key = self.query_cache.make_key('search', 1, word='a')
+
+        def acquire(lock_key):
+            # L'autre worker a écrit le résultat et libéré le verrou entre notre lecture et l'acquisition
+            cache.set(key, {'value': 'autre worker', 'fresh_until': float('inf')})
+            return 'jeton'
+
+        with mock.patch.object(self.query_cache, 'acquire_shared_lock', side_effect=acquire):
+            value = self.query_cache.get_or_compute('search', lambda: 'recalculé', word='a')
+        self.assertEqual(value, 'autre worker')
+
+    def test_database_cache_skips_the_shared_lock(self):
+        database_cache = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'books_cache'}}
+        with override_settings(CACHES=database_cache):
+            self.assertFalse(self.query_cache.uses_shared_lock())
+            self.assertTrue(QueryCache(SHARED_LOCK=True).uses_shared_lock())
+        self.assertTrue(self.query_cache.uses_shared_lock())
+
+    def test_clear_local_rereads_published_index(self):
+        index_analysis.checked_at = 0
+        self.query_cache.clear_local()
+        self.assertIsNone(index_analysis.checked_at)
+
+    def test_warming_is_skipped_with_a_process_local_cache(self):
+        output = io.StringIO()
+        call_command('warm_caches', stdout=output)
+        self.assertIn('préchauffage ignoré', output.getvalue())
+
+
+class UpdatePositionsTests(SimpleTestCase):
+    def test_merges_absolute_positions_per_field(self):
+        entry = InvertedIndex(word='baleine', positions=[])
+        book = Book(id=7)
+        entry.update_positions(book, {'text': [40, 12], 'title': [0]})
+        entry.update_positions(book, {'text': [12, 41]})
+        posting = entry.positions[0]
+        self.assertEqual(decode_positions(posting['positions']['text']).tolist(), [12, 40, 41])
+        self.assertEqual(posting['positions']['title'], [0])
+        self.assertEqual((posting['occurrences'], entry.occurrences), (4, 4))
+        self.assertGreater(posting['closeness'], 0)
+
+
+class QueryAnalysisTests(SimpleTestCase):
+    """Les mots-clés sont analysés avec les options et la langue de l'index publié."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.index_dir = directory.name
+        settings_override = override_settings(BOOKS_INDEX_DIR=self.index_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        index_analysis.checked_at = index_analysis.mtime = None
+        self.addCleanup(setattr, index_analysis, 'checked_at', None)
+
+    def publish(self, overrides, languages):
+        write_index_analysis(overrides, Counter(languages), self.index_dir)
+        index_analysis.checked_at = None
+
+    def test_without_recorded_analysis_uses_settings(self):
+        self.assertEqual(analyze_query('running'), 'run')
+
+    def test_index_built_without_stemming(self):
+        self.publish({'STEMMING': False}, ['en'])
+        self.assertEqual(analyze_query('running'), 'running')
+
+    def test_default_language_is_the_main_corpus_language(self):
+        self.publish({}, ['fr', 'fr', 'en'])
+        with mock.patch.object(analysis_module, 'indexed_frequencies', return_value={}):
+            self.assertEqual(analyze_query('mangeaient'), 'mang')
+        self.assertEqual(analyze_query('mangeaient', 'en'), 'mangeaient')
+        self.assertEqual(query_analyzer('de').analyze_term('Häuser'), 'haus')
+
+    def test_without_language_the_most_indexed_stem_wins(self):
+        self.publish({}, ['en', 'en', 'fr'])
+        with mock.patch.object(analysis_module, 'indexed_frequencies', return_value={'mang': 2}) as frequencies:
+            self.assertEqual(analyze_query('mangeaient'), 'mang')
+            frequencies.assert_called_once_with(['mangeaient', 'mang'])
+            # Langue demandée : une seule analyse, sans consulter l'index
+            self.assertEqual(analyze_query('mangeaient', 'en'), 'mangeaient')
+            # Stopword de la langue principale : ignoré quelle que soit l'analyse des autres langues
+            self.assertIsNone(analyze_query('the'))
+        with mock.patch.object(analysis_module, 'indexed_frequencies', return_value={}):
+            self.assertEqual(analyze_query('mangeaient'), 'mangeaient')
+
+    def test_analyzer_memos_are_bounded(self):
+        with mock.patch.object(analysis_module, 'ANALYZER_CACHE_SIZE', 2):
+            analyzer = analysis_module.Analyzer(('en',), 'NFKC', False, True, True, 2)
+        self.assertEqual(analyzer.analyze('running dogs jumped high'), ['run', 'dog', 'jump', 'high'])
+        self.assertEqual(analyzer.index_terms.cache_info().currsize, 2)
+        self.assertEqual(analyzer.stem.cache_info().currsize, 2)
+
+    def test_unknown_language_is_rejected(self):
+        response = self.client.get('/api/ranked_book_search/', {'word': 'whale', 'lang': 'xx-' + 'a' * 50})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+
+class AutocompleteTests(SimpleTestCase):
+    def setUp(self):
+        self.dictionary = TermDictionary(['baleine', 'balle', 'ballon', 'bateau'], [3, 5, 5, 1])
+
+    def test_completions_by_document_frequency(self):
+        self.assertEqual(self.dictionary.complete('bal', 2), [('balle', 5), ('ballon', 5)])
+        self.assertEqual(self.dictionary.complete('ball', 10), [('balle', 5), ('ballon', 5)])
+
+    def test_short_prefix_memo_is_bounded(self):
+        with mock.patch.object(term_dictionary_module, 'SHORT_PREFIX_CACHE_SIZE', 2):
+            for prefix in ('a', 'b', 'ba', 'c'):
+                self.dictionary.complete(prefix)
+        self.assertEqual(list(self.dictionary.short_prefixes), ['ba', 'c'])
+
+    def test_limit_must_be_positive(self):
+        for limit in ('0', '-1'):
+            response = self.client.get('/api/search/autocomplete/bal/', {'limit': limit})
+            self.assertEqual(response.status_code, 400)
+
+
+class FingerprintTests(SimpleTestCase):
+    def flip(self, value, *bits):
+        for bit in bits:
+            value ^= 1 << bit
+        return value
+
+    def test_near_duplicates_share_a_band(self):
+        # Principe des tiroirs : HAMMING_THRESHOLD bits modifiés laissent au moins une bande intacte
+        base = 0x0123456789ABCDEF
+        for bits in [(0, 16, 32), (15, 31, 47), (63, 62, 61), (1, 2, 3)]:
+            variant = self.flip(base, *bits)
+            self.assertTrue(set(fingerprint.bands(base)) & set(fingerprint.bands(variant)), bits)
+
+    def test_detector_returns_closest_edition_under_threshold(self):
+        base = 0xFEDCBA9876543210
+        detector = fingerprint.DuplicateDetector()
+        detector.add('far', self.flip(base, 0, 1, 2))
+        detector.add('near', self.flip(base, 40))
+        detector.add('other', ~base & (2 ** 64 - 1))
+        self.assertEqual(detector.find(base), 'near')
+        # Une bande modifiée par bit : aucune bande commune, donc aucune comparaison
+        self.assertIsNone(detector.find(self.flip(base, 0, 16, 32, 48)))
+        self.assertIsNone(fingerprint.DuplicateDetector().find(base))
+
+    def test_signed_storage_round_trip(self):
+        for value in (0, 1, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 1):
+            signed = fingerprint.to_signed(value)
+            self.assertTrue(-2 ** 63 <= signed < 2 ** 63)
+            self.assertEqual(fingerprint.to_unsigned(signed), value)
+
+    def test_simhash_of_near_identical_editions(self):
+        text = ' '.join(f'mot{i % 97} texte{i % 13}' for i in range(2000))
+        edition = text.replace('mot5 texte5', 'MOT5 Texte5') + ' Produced by Distributed Proofreaders.'
+        self.assertEqual(fingerprint.simhash(''), 0)
+        self.assertEqual(fingerprint.simhash(text), fingerprint.simhash(text.upper()))
+        self.assertLessEqual(fingerprint.hamming(fingerprint.simhash(text), fingerprint.simhash(edition)), fingerprint.HAMMING_THRESHOLD)
+
+
+class ShardTests(SimpleTestCase):
+    def test_server_only_exposes_query_operations(self):
+        server, client = Pipe()
+        handler = threading.Thread(target=ShardServer(0).handle_connection, args=(server,))
+        handler.start()
+        with mock.patch.object(ShardServer, 'stats', return_value={'books': 0}):
+            for operation in ('serve_forever', '__init__', 'loader'):
+                client.send((operation, {}))
+                ok, error = client.recv()
+                self.assertFalse(ok)
+                self.assertIn(operation, error)
+            client.send(('stats', {'terms': ['baleine']}))
+            self.assertEqual(client.recv(), (True, {'books': 0}))
+        client.close()
+        handler.join(timeout=5)
+        self.assertFalse(handler.is_alive())
+
+    def test_coordinator_backs_off_when_shards_are_down(self):
+        coordinator = ShardCoordinator()
+        with tempfile.TemporaryDirectory() as socket_dir, \
+                override_settings(BOOKS_SHARDS={'COUNT': 2, 'SOCKET_DIR': socket_dir, 'TIMEOUT': 1}), \
+                mock.patch('books.shards.read_manifest', return_value={'count': 2, 'ranges': [[1, 5], [6, 9]]}) as read_manifest:
+            # Sockets restantes d'un serve_shards arrêté brutalement : personne n'écoute
+            for shard in range(2):
+                open(f'{socket_dir}/shard_{shard:02d}.sock', 'w').close()
+            self.assertTrue(coordinator.available())
+            with self.assertRaises(ShardUnavailable):
+                coordinator.search(['baleine'])
+            self.assertFalse(coordinator.available())
+            self.assertEqual(read_manifest.call_count, 1)
+
+    def test_occurrences_are_gathered_without_scoring(self):
+        word_index = {'baleine': {1: {'text': [0, 4]}, 2: {'text': [1]}, 7: {'title': [0], 'text': [3, 8, 9]}}}
+        servers = []
+        with tempfile.TemporaryDirectory() as base_dir:
+            for shard, (low, high) in enumerate([(1, 2), (7, 7)]):
+                server = ShardServer(shard)
+                server.loader.get = mock.Mock(return_value=Segment(write_segment(partition_index(word_index, low, high), base_dir, shard=shard)))
+                servers.append(server)
+            coordinator = ShardCoordinator()
+            with mock.patch.object(coordinator, 'scatter', side_effect=lambda operation, **arguments: [
+                getattr(server, operation)(**arguments) for server in servers
+            ]) as scatter, mock.patch.object(ShardServer, 'top_k') as top_k:
+                self.assertEqual(coordinator.occurrences('baleine'), {1: 2, 2: 1, 7: 4})
+                self.assertEqual(coordinator.occurrences('absent'), {})
+            self.assertEqual(scatter.call_count, 2)
+            top_k.assert_not_called()
+
+
+class RequiredClausesTests(SimpleTestCase):
+    def clauses(self, pattern):
+        return [sorted(clause) for clause in required_clauses(sre_parse.parse(pattern))]
+
+    def test_delimited_words(self):
+        self.assertEqual(self.clauses('whale'), [['whale']])
+        self.assertEqual(self.clauses(r'\bmoby dick\b'), [['moby'], ['dick']])
+        self.assertEqual(self.clauses('whale.*'), [['whale']])
+        self.assertEqual(self.clauses('[a-z]+ing'), [])
+
+    def test_groups_are_words_only_when_bounded_on_both_sides(self):
+        self.assertEqual(self.clauses('sun(shine)'), [])
+        self.assertEqual(self.clauses('(sun|moon)light'), [])
+        self.assertEqual(self.clauses('x(abc)+y'), [])
+        self.assertEqual(self.clauses('(sun|moon) light'), [['moon', 'sun'], ['light']])
+        self.assertEqual(self.clauses('the (white|grey) whale'), [['the'], ['grey', 'white'], ['whale']])
+
+    def test_repetitions(self):
+        # « abcabc » est un seul mot : aucune occurrence isolée de abc n'est garantie
+        self.assertEqual(self.clauses('(abc)+'), [])
+        self.assertEqual(self.clauses(r'(\babc\b)+'), [['abc']])
+        self.assertEqual(self.clauses('(abc)?'), [])
+        self.assertEqual(self.clauses('(whale|[a-z]+)'), [])
+
+
+@skipUnless(connection.vendor == 'postgresql', "Recherche par expression régulière spécifique à PostgreSQL")
+class QueryPlannerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Book.objects.bulk_create(Book(gutenberg_id=i, title=f'Livre {i}', text='') for i in range(3))
+
+    def test_plain_word_uses_the_index(self):
+        plan = plan_regex('whales')
+        self.assertEqual((plan.mode, plan.terms, plan.candidates), ('index', [['whale']], 0))
+
+    def test_pattern_without_required_word_scans_every_book(self):
+        plan = plan_regex('sun(shine)')
+        self.assertEqual((plan.mode, plan.terms, plan.candidates), ('full', [], 3))
+
+    def test_rejected_patterns(self):
+        for pattern in ('(a+)+', r'(a)\1', 'a' * 201):
+            with self.assertRaises(QueryRejected):
+                plan_regex(pattern)
+
+
+class TopKTests(SimpleTestCase):
+    """Top-k avec terminaison anticipée comparé au calcul exhaustif, sur un petit segment synthétique."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = random.Random(7)
+        word_index = {}
+        # Peu de valeurs de tf et de qualité distinctes : beaucoup d'égalités de score
+        for term, book_ids in {'a': range(1, 60), 'b': range(1, 60, 3), 'c': range(30, 40), 'd': range(100, 120)}.items():
+            word_index[term] = {
+                book_id: {'text': list(range(rng.randint(1, 3))), 'title': [0] * rng.randint(0, 1)}
+                for book_id in book_ids if term != 'a' or rng.random() < 0.8
+            }
+        quality = {book_id: rng.choice([0.0, 0.5, 1.0]) for book_id in range(1, 120)}
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.segment = Segment(write_segment(word_index, cls.directory.name, quality=quality))
+
+    @classmethod
+    def tearDownClass(cls):
+        del cls.segment  # Le fichier mappé peut être supprimé (POSIX)
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def brute_force(self, terms, k):
+        scores = {}
+        for term in terms:
+            postings = self.segment.postings(term)
+            if postings is None:
+                continue
+            weight = topk.idf(len(postings), self.segment.book_count)
+            for book_id, tf, quality in zip(postings.book_ids.tolist(), postings.occurrences_per_book().tolist(), postings.quality.tolist()):
+                scores[book_id] = scores.get(book_id, topk.QUALITY_WEIGHT * quality) + weight * topk.saturate(tf)
+        return sorted(scores.items(), key=lambda hit: (-hit[1], hit[0]))[:k]
+
+    def test_matches_brute_force(self):
+        for terms in (['a'], ['d'], ['a', 'b'], ['a', 'b', 'c'], ['c', 'd'], ['a', 'absent']):
+            for k in (1, 5, 20, 500):
+                with self.subTest(terms=terms, k=k):
+                    result = topk.top_k(self.segment, terms, k)
+                    expected = self.brute_force(terms, k)
+                    self.assertEqual([book_id for book_id, _ in result.hits], [book_id for book_id, _ in expected])
+                    for (_, score), (_, expected_score) in zip(result.hits, expected):
+                        self.assertAlmostEqual(score, expected_score, places=6)
+                    self.assertLessEqual(result.touched, result.total)
+
+    def test_early_termination_skips_postings(self):
+        result = topk.top_k(self.segment, ['a', 'b'], 1)
+        self.assertLess(result.touched, result.total)
+
+    def test_no_postings(self):
+        self.assertEqual(topk.top_k(self.segment, ['absent'], 10).hits, [])
+        self.assertEqual(topk.top_k(self.segment, ['a'], 0).hits, [])
+
+
+class DownloadHeaderTests(SimpleTestCase):
+    def test_parse_range(self):
+        parse_range = book_display.parse_range
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=90-500', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-500', 100), (0, 99))
+        self.assertEqual(parse_range('bytes=100-', 100), 'unsatisfiable')
+        self.assertEqual(parse_range('bytes=-0', 100), 'unsatisfiable')
+        # Ignorés : le texte entier est envoyé
+        for header in (None, '', 'bytes=-', 'bytes=9-0', 'bytes=0-1,5-9', 'items=0-9'):
+            self.assertIsNone(parse_range(header, 100), header)
+
+    def test_accepts_gzip(self):
+        accepts_gzip = book_display.accepts_gzip
+        self.assertTrue(accepts_gzip('gzip, deflate, br'))
+        self.assertTrue(accepts_gzip('br;q=1.0, gzip;q=0.8'))
+        self.assertTrue(accepts_gzip('*'))
+        self.assertFalse(accepts_gzip('gzip;q=0'))
+        self.assertFalse(accepts_gzip('*, gzip;q=0'))
+        self.assertFalse(accepts_gzip('identity'))
+        self.assertFalse(accepts_gzip(None))
+
+
+@skipUnless(connection.vendor == 'postgresql', "Lecture du texte par curseur serveur PostgreSQL")
+class BookTextDownloadTests(TestCase):
+    text = 'Élise écrit : « Ça va ? » ' * 50
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(gutenberg_id=1, title='Lettres', text=cls.text)
+        cls.url = f'/api/book/{cls.book.id}/text/download/'
+        cls.encoded = cls.text.encode('utf-8')
+
+    def setUp(self):
+        # Morceaux plus petits qu'un caractère multi-octets ou que le texte : plusieurs lignes du curseur
+        patcher = mock.patch.object(book_display, 'DOWNLOAD_CHUNK_SIZE', 7)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_full_text_and_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.encoded)
+        self.assertEqual(response['ETag'], f'"{self.book.text_md5}"')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_text_digest_follows_text_updates(self):
+        book = Book.objects.get(id=self.book.id)
+        with mock.patch('books.models.hashlib.md5') as md5:
+            book.title = 'Lettres choisies'
+            book.save()
+            book.save(update_fields=['title'])
+        md5.assert_not_called()
+
+        book.text = 'Nouveau texte'
+        book.save(update_fields=['text'])
+        self.assertEqual(Book.objects.get(id=book.id).text_md5, hashlib.md5(b'Nouveau texte').hexdigest())
+
+    def test_byte_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=3-40')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.encoded[3:41])
+        self.assertEqual(response['Content-Range'], f'bytes 3-40/{len(self.encoded)}')
+        # If-Range sur une autre version du texte : réponse entière
+        response = self.client.get(self.url, HTTP_RANGE='bytes=3-40', HTTP_IF_RANGE='"périmé"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_gzip_refused_with_zero_quality(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(zlib.decompress(b''.join(response.streaming_content), 16 + zlib.MAX_WBITS), self.encoded)
+
+
+# Hors transaction de test : JobContext ne publie rien (ni ne vérifie l'annulation) dans un bloc atomique
+@override_settings(BOOKS_JOBS={'PEAK_DUTY_CYCLE': 1.0, 'OFF_PEAK_DUTY_CYCLE': 1.0, 'PROGRESS_INTERVAL': 0, 'VACUUM_COST_DELAY_MS': 0})
+class JobTests(TransactionTestCase):
+    def run_with(self, job, command):
+        with mock.patch.object(jobs, 'call_command', side_effect=lambda *args, **kwargs: command()):
+            return jobs.run_job(job)
+
+    def test_claim_oldest_queued_job(self):
+        first, second = Job.objects.create(kind='index'), Job.objects.create(kind='warm')
+        Job.objects.create(kind='import', status=Job.CANCELLED)
+        self.assertEqual(jobs.claim_next('worker-1'), first)
+        claimed = jobs.claim_next('worker-2')
+        self.assertEqual((claimed, claimed.status, claimed.worker), (second, Job.RUNNING, 'worker-2'))
+        self.assertIsNone(jobs.claim_next('worker-1'))
+
+    def test_cancel_queued_and_running_jobs(self):
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        queued, running = Job.objects.create(kind='index'), Job.objects.create(kind='index', status=Job.RUNNING)
+        self.assertEqual(self.client.delete(f'/api/jobs/{queued.id}/').status_code, 204)
+        self.assertEqual(self.client.delete(f'/api/jobs/{running.id}/').status_code, 202)
+        self.assertEqual(self.client.delete(f'/api/jobs/{queued.id}/').status_code, 409)
+        self.assertEqual(Job.objects.get(id=queued.id).status, Job.CANCELLED)
+        self.assertTrue(Job.objects.get(id=running.id).cancel_requested)
+        self.assertIsNone(jobs.claim_next('worker-1'))
+
+    def test_running_job_stops_at_next_checkpoint(self):
+        job = Job.objects.create(kind='index', status=Job.RUNNING, cancel_requested=True)
+        steps = []
+
+        def command():
+            for step in range(3):
+                jobs.checkpoint(step, 3, 'Étape')
+                steps.append(step)
+
+        self.assertEqual(self.run_with(job, command).status, Job.CANCELLED)
+        self.assertEqual(steps, [])
+
+    def test_uninterruptible_section_is_neither_cancelled_nor_throttled(self):
+        job = Job.objects.create(kind='index', status=Job.RUNNING)
+        steps = []
+
+        def command():
+            with jobs.uninterruptible():
+                Job.objects.filter(pk=job.pk).update(cancel_requested=True)
+                with mock.patch.object(jobs.JobContext, 'throttle') as throttle:
+                    for step in range(3):
+                        jobs.checkpoint(step, 3, 'Écriture de l\'index')
+                        steps.append(step)
+                throttle.assert_not_called()
+            jobs.checkpoint(3, 3, 'Fin')
+            steps.append('fin')
+
+        self.assertEqual(self.run_with(job, command).status, Job.CANCELLED)
+        self.assertEqual(steps, [0, 1, 2])
+
+    def test_checkpoint_outside_jobs_does_nothing(self):
+        with jobs.uninterruptible():
+            jobs.checkpoint(1, 2, 'Étape')
+
+
+@skipUnless(connection.vendor == 'postgresql', "Fusion INSERT ... ON CONFLICT spécifique à PostgreSQL")
+class CorpusStatsTests(TestCase):
+    def word_index(self, books_by_term):
+        InvertedIndex.objects.all().delete()
+        InvertedIndex.objects.bulk_create(InvertedIndex(word=term, surface=term, occurrences=1) for term in books_by_term)
+        return {term: {book_id: {'text': [0] * count} for book_id, count in books.items()} for term, books in books_by_term.items()}
+
+    def statistics(self):
+        return {row.term: (row.document_frequency, row.occurrences) for row in TermStatistic.objects.all()}
+
+    def catalog(self):
+        return {(row.dimension, row.value): (row.book_count, row.download_count) for row in CatalogStatistic.objects.all()}
+
+    def test_term_statistics_only_rewrite_changed_rows(self):
+        word_index = self.word_index({'whale': {1: 3, 2: 1}, 'sea': {1: 1}})
+        self.assertEqual(corpus_stats.refresh_term_statistics(word_index, {}), (2, 0))
+        self.assertEqual(self.statistics(), {'whale': (2, 4), 'sea': (1, 1)})
+        self.assertEqual(corpus_stats.refresh_term_statistics(word_index, {}), (0, 0))
+
+        word_index = self.word_index({'whale': {1: 3, 2: 2}, 'ship': {2: 1}})
+        self.assertEqual(corpus_stats.refresh_term_statistics(word_index, {'ship': 'Ship'}), (2, 1))
+        self.assertEqual(self.statistics(), {'whale': (2, 5), 'ship': (1, 1)})
+        self.assertEqual(TermStatistic.objects.get(term='ship').surface, 'Ship')
+
+    def test_catalog_statistics(self):
+        books = [
+            {'languages': 'en,fr', 'author__name': 'Melville', 'subjects': ['Whales'], 'bookshelves': [], 'copyright': False, 'download_count': 10},
+            {'languages': 'EN', 'author__name': None, 'subjects': ['Whales', 'Whales'], 'bookshelves': ['Sea'], 'copyright': False, 'download_count': None},
+        ]
+        self.assertEqual(corpus_stats.refresh_catalog_statistics(books), (5, 0))
+        self.assertEqual(self.catalog(), {
+            ('language', 'en'): (2, 10), ('language', 'fr'): (1, 10), ('author', 'Melville'): (1, 10),
+            ('subject', 'Whales'): (2, 10), ('bookshelf', 'Sea'): (1, 0),
+        })
+        self.assertEqual(corpus_stats.refresh_catalog_statistics(books), (0, 0))
+        # en et Whales modifiés, Sea inchangé, fr et Melville supprimés
+        self.assertEqual(corpus_stats.refresh_catalog_statistics(books[1:]), (2, 2))
+        self.assertEqual(self.catalog(), {('language', 'en'): (1, 0), ('subject', 'Whales'): (1, 0), ('bookshelf', 'Sea'): (1, 0)})
+
+    def test_snapshot_distribution(self):
+        snapshot = corpus_stats.record_snapshot({'a': {1: {'text': [0]}}, 'b': {1: {'text': [0, 1]}, 2: {'title': [0]}}}, 2)
+        self.assertEqual((snapshot.vocabulary_size, snapshot.posting_count, snapshot.total_occurrences, snapshot.hapax_count), (2, 3, 4, 1))
+        self.assertEqual(snapshot.df_distribution, [{'min': 1, 'max': 1, 'terms': 1}, {'min': 2, 'max': 3, 'terms': 1}])
+
+    def test_document_frequencies_from_materialized_statistics(self):
+        # Sans statistiques : comptage sur la table de liaison
+        self.assertEqual(document_frequencies({'whale'}), {})
+        TermStatistic.objects.create(term='whale', document_frequency=7, occurrences=20)
+        # Un terme inconnu n'entraîne pas de comptage : une requête d'existence et une lecture
+        with self.assertNumQueries(2):
+            self.assertEqual(document_frequencies({'whale', 'kraken'}), {'whale': 7})
+
+
+@skipUnless(connection.vendor == 'postgresql', "index_books écrit avec execute_values (PostgreSQL)")
+class IndexRewriteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        InvertedIndex.objects.create(word='ancien', surface='ancien', occurrences=1)
+
+    def test_failed_rewrite_keeps_the_previous_index(self):
+        Book.objects.create(gutenberg_id=1, title='Moby Dick', languages='en', text='Call me Ishmael.')
+        with mock.patch('books.management.commands.index_books.Command.insert_batch', side_effect=RuntimeError('coupure')):
+            with self.assertRaises(RuntimeError):
+                call_command('index_books', no_warm=True, stdout=io.StringIO())
+        self.assertEqual(list(InvertedIndex.objects.values_list('word', flat=True)), ['ancien'])
+
+    def test_term_statistics_are_rewritten_with_the_index(self):
+        TermStatistic.objects.create(term='ancien', document_frequency=1, occurrences=1)
+        Book.objects.create(gutenberg_id=1, title='Moby Dick', languages='en', text='Call me Ishmael.')
+        with mock.patch('books.management.commands.index_books.refresh_term_statistics', side_effect=RuntimeError('coupure')) as refresh:
+            with self.assertRaises(RuntimeError):
+                call_command('index_books', no_warm=True, stdout=io.StringIO())
+        # Appelée sur le nouvel index, dans la transaction de réécriture : son échec annule aussi l'index
+        self.assertIn('ishmael', refresh.call_args.args[0])
+        self.assertEqual(list(InvertedIndex.objects.values_list('word', flat=True)), ['ancien'])
+        self.assertEqual(list(TermStatistic.objects.values_list('term', flat=True)), ['ancien'])
+
+    def test_nothing_to_index_leaves_the_index_untouched(self):
+        output = io.StringIO()
+        call_command('index_books', no_warm=True, stdout=output)
+        self.assertIn('index existant inchangé', output.getvalue())
+        self.assertTrue(InvertedIndex.objects.filter(word='ancien').exists())
@@ -0,0 +1,143 @@
+import heapq
+import math
+
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+
+# Top-k avec terminaison anticipée sur les segments (voir segments.py).
+#
+# score(livre) = somme sur les termes de idf(t) * saturation(tf) + QUALITY_WEIGHT * qualité(livre)
+#
+# Chaque terme a une borne supérieure de sa contribution (calculée avec son tf maximal) : un livre qui ne
+# peut plus dépasser le k-ième score courant n'est pas évalué (MaxScore). Pour un seul terme, les postings
+# sont parcourus par impact décroissant et le parcours s'arrête dès que la borne passe sous le seuil.
+
+K1 = 1.2              # Saturation du nombre d'occurrences (BM25 sans normalisation par la longueur)
+QUALITY_WEIGHT = 0.5  # Poids de la popularité (download_count) dans le score
+
+
+def static_quality(download_counts):
+    """{book_id: qualité entre 0 et 1} : popularité en échelle logarithmique."""
+    top = max(download_counts.values(), default=0)
+    if top <= 0:
+        return {book_id: 0.0 for book_id in download_counts}
+    return {book_id: math.log1p(max(count, 0)) / math.log1p(top) for book_id, count in download_counts.items()}
+
+
+def saturate(tf):
+    return tf * (K1 + 1) / (tf + K1)
+
+
+def idf(document_frequency, total_books):
+    return math.log(1 + total_books / max(document_frequency, 1))
+
+
+class TopKResult:
+    def __init__(self, hits, touched, total):
+        self.hits = hits          # [(book_id, score)] par score décroissant
+        self.touched = touched    # Postings effectivement lus
+        self.total = total        # Postings des termes de la requête
+
+
+class TermCursor:
+    """Curseur sur les postings d'un terme (triés par id de livre)."""
+
+    def __init__(self, postings, weight):
+        self.book_ids = postings.book_ids
+        self.quality = postings.quality
+        self.contributions = weight * saturate(postings.occurrences_per_book().astype(np.float64))
+        self.upper_bound = weight * saturate(postings.max_tf)
+        self.position = 0
+
+    def current(self):
+        return int(self.book_ids[self.position]) if self.position < len(self.book_ids) else None
+
+    def seek(self, book_id):
+        """Avance jusqu'au premier livre >= book_id (recherche dichotomique : les postings sautés ne sont pas lus)."""
+        self.position += int(np.searchsorted(self.book_ids[self.position:], book_id))
+
+
+def single_term_top_k(postings, weight, k):
+    """Parcours par impact décroissant : arrêt dès que le meilleur score restant ne peut plus entrer dans le top-k."""
+    counts = postings.occurrences_per_book()
+    quality_bound = QUALITY_WEIGHT * postings.max_quality
+    heap, touched = [], 0
+    for index in postings.impact_order.tolist():
+        term_score = weight * saturate(int(counts[index]))
+        if len(heap) == k and term_score + quality_bound <= heap[0][0]:
+            break
+        touched += 1
+        score = term_score + QUALITY_WEIGHT * float(postings.quality[index])
+        entry = (score, -int(postings.book_ids[index]))
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+    return heap, touched
+
+
+def max_score_top_k(all_postings, weights, k):
+    """MaxScore (document par document) sur l'union des termes."""
+    cursors = sorted((TermCursor(postings, weight) for postings, weight in zip(all_postings, weights)), key=lambda c: c.upper_bound)
+    quality_bound = QUALITY_WEIGHT * max(postings.max_quality for postings in all_postings)
+    # prefix[i] : somme des bornes des curseurs 0..i (les moins contributifs)
+    prefix = list(np.cumsum([cursor.upper_bound for cursor in cursors]))
+
+    heap, touched = [], 0
+    essential = 0  # Les curseurs [0, essential) ne suffisent pas à eux seuls pour entrer dans le top-k
+    while True:
+        threshold = heap[0][0] if len(heap) == k else 0.0
+        while essential < len(cursors) and prefix[essential] + quality_bound <= threshold:
+            essential += 1
+        if essential == len(cursors):
+            break
+
+        current = [cursor.current() for cursor in cursors[essential:]]
+        candidates = [book_id for book_id in current if book_id is not None]
+        if not candidates:
+            break
+        book_id = min(candidates)
+
+        # Le livre vient d'un curseur essentiel : sa qualité est lue sur ce posting
+        score, quality = 0.0, 0.0
+        for cursor in cursors[essential:]:
+            if cursor.current() == book_id:
+                score += float(cursor.contributions[cursor.position])
+                quality = float(cursor.quality[cursor.position])
+                cursor.position += 1
+                touched += 1
+        # Termes non essentiels, du plus contributif au moins contributif, tant que le livre peut encore entrer
+        for index in range(essential - 1, -1, -1):
+            if score + prefix[index] + quality_bound <= threshold:
+                break
+            cursor = cursors[index]
+            cursor.seek(book_id)
+            if cursor.current() == book_id:
+                score += float(cursor.contributions[cursor.position])
+                touched += 1
+
+        score += QUALITY_WEIGHT * quality
+        entry = (score, -book_id)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            heapq.heapreplace(heap, entry)
+    return heap, touched
+
+
+def top_k(segment, terms, k):
+    """Top-k (OU entre les termes) avec terminaison anticipée. Retourne un TopKResult."""
+    all_postings = [postings for postings in (segment.postings(term) for term in terms) if postings is not None]
+    if not all_postings or k <= 0:
+        return TopKResult([], 0, 0)
+
+    total_books = segment.book_count
+    weights = [idf(len(postings), total_books) for postings in all_postings]
+    if len(all_postings) == 1:
+        heap, touched = single_term_top_k(all_postings[0], weights[0], k)
+    else:
+        heap, touched = max_score_top_k(all_postings, weights, k)
+
+    hits = [(-negative_id, score) for score, negative_id in sorted(heap, reverse=True)]
+    return TopKResult(hits, touched, sum(len(postings) for postings in all_postings))
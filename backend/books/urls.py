@@ -6,14 +6,23 @@ from .book_display import (
     AvailableLanguagesView,
     BookTextView,
     BookTextHighlightView,
+    BookTextDownloadView,
 )
 
+from .instrumentation import metrics_view
+from .job_views import JobDetailView, JobListView
+from .stats_views import CatalogStatsView, CorpusStatsView, DocumentFrequencyDistributionView, TopTermsView
+
 from .book_search import (
     AdvancedBookSearchView,
     InvertedIndexSuggectionsView,
     InvertedIndexSearchView,
     RankedBookSearchView,
     ClosenessBookSearchView,
+    AutocompleteView,
+    FacetedSearchView,
+    TopKSearchView,
+    TermStatsView,
 )
 
 urlpatterns = [
@@ -22,10 +31,22 @@ urlpatterns = [
     path('books/by-language/<str:language>/', BooksByLanguageView.as_view(), name='books-by-language'),
     path('books/available-languages/', AvailableLanguagesView.as_view(), name='available-languages'),
     path('book/<int:book_id>/text/', BookTextView.as_view(), name='fetch_book_text'),
+    path('book/<int:book_id>/text/download/', BookTextDownloadView.as_view(), name='download-book-text'),
     path('search/advanced/', AdvancedBookSearchView.as_view(), name='advanced-search'),
+    path('search/top/', TopKSearchView.as_view(), name='topk-search'),
+    path('search/faceted/', FacetedSearchView.as_view(), name='faceted-search'),
+    path('search/term-stats/', TermStatsView.as_view(), name='term-stats'),
+    path('search/autocomplete/<str:prefix>/', AutocompleteView.as_view(), name='autocomplete'),
     path('search/suggestions/<str:word>/', InvertedIndexSuggectionsView.as_view(), name='inverted-search'),
     path('search/<str:word>/<str:search_method>/', InvertedIndexSearchView.as_view(), name='inverted_index_search'),
     path('ranked_book_search/', RankedBookSearchView.as_view(), name='ranked_book_search'),
     path('search/closeness/', ClosenessBookSearchView.as_view(), name='closeness-search'),
     path('book/<int:book_id>/text/highlight/', BookTextHighlightView.as_view(), name='highlight-book-text'),
+    path('jobs/', JobListView.as_view(), name='jobs'),
+    path('jobs/<int:job_id>/', JobDetailView.as_view(), name='job-detail'),
+    path('stats/corpus/', CorpusStatsView.as_view(), name='corpus-stats'),
+    path('stats/terms/', TopTermsView.as_view(), name='top-terms'),
+    path('stats/df-distribution/', DocumentFrequencyDistributionView.as_view(), name='df-distribution'),
+    path('stats/catalog/<str:dimension>/', CatalogStatsView.as_view(), name='catalog-stats'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -38,12 +39,15 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'books',
     'corsheaders'
 ]
 
 MIDDLEWARE = [
+    'books.instrumentation.PerformanceMiddleware',
+    'books.db_router.ReplicaReadsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -60,10 +64,106 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_METHODS = ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
 
-CORS_ALLOW_HEADERS = ["content-type", "authorization"]
+CORS_ALLOW_HEADERS = ["content-type", "authorization", "range", "if-range"]
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+CORS_EXPOSE_HEADERS = ["server-timing", "x-query-count", "accept-ranges", "content-range", "etag"]
+
+# Profilage à la demande (?profile=1) : toujours actif en DEBUG, sinon opt-in
+BOOKS_PROFILING_ENABLED = False
+
+# Chaîne d'analyse du texte, identique à l'indexation et à la recherche (voir books/analysis.py).
+# Réindexer (index_books) après toute modification.
+BOOKS_ANALYZER = {
+    'UNICODE_FORM': 'NFKC',
+    'STRIP_ACCENTS': False,
+    'STOPWORDS': True,
+    'STEMMING': True,
+}
+
+# Fichiers d'index générés par index_books (dictionnaire d'autocomplétion, ...)
+BOOKS_INDEX_DIR = BASE_DIR / 'index_data'
+
+# Cache Django partagé par tous les workers (résultats de recherche, verrous single-flight, pages des livres) :
+# Redis dès que BOOKS_REDIS_URL est défini (paquet redis), recommandé en production. À défaut, repli sur une
+# table PostgreSQL créée par `manage.py migrate` : chaque accès coûte alors une requête SQL, et le verrou
+# single-flight entre workers est désactivé (BOOKS_QUERY_CACHE['SHARED_LOCK']).
+if os.environ.get('BOOKS_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['BOOKS_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'books_cache',
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+
+# Cache des résultats de recherche (LRU local + cache Django partagé, voir books/query_cache.py)
+BOOKS_QUERY_CACHE = {
+    'TIMEOUT': 1800,
+    'STALE_TIMEOUT': 300,
+    'MAX_ENTRIES': 1024,
+    'HOT_HITS': 5,
+}
+
+# Index partitionné par plages d'ids de livres (index_books --shards N, servi par manage.py serve_shards)
+BOOKS_SHARDS = {
+    'COUNT': 1,
+    'SOCKET_DIR': BOOKS_INDEX_DIR / 'shards',
+    'TIMEOUT': 5,
+}
+
+# Budget des recherches par expression régulière (voir books/query_planner.py)
+BOOKS_QUERY_BUDGET = {
+    'MAX_PATTERN_LENGTH': 200,
+    'MAX_COST': 20000,
+    'REJECT_COST': 500000,
+    'STATEMENT_TIMEOUT_MS': 2000,
+    'TOTAL_TIMEOUT_MS': 5000,
+    'CHUNK_SIZE': 100,
+}
+
+# Journal structuré des requêtes de recherche et d'affichage (opt-in, voir books/query_log.py).
+# Rejoué par `manage.py replay_queries --log ...`.
+BOOKS_QUERY_LOG = {
+    'ENABLED': False,
+    'PATH': BASE_DIR / 'query_log.jsonl',
+    'QUEUE_SIZE': 10000,
+    'EXCLUDE': ('metrics',),
+}
+
+# Préchauffage des caches après index_books (ou `manage.py warm_caches`) : requêtes les plus fréquentes
+# du journal (sinon mots de plus forte fréquence documentaire) et pages des livres les plus téléchargés.
+# Les résultats sont écrits dans le cache partagé (CACHES ci-dessus) sous les clés de la nouvelle génération
+# de l'index : les workers les trouvent dès qu'ils basculent sur le nouveau segment. Sans effet (ignoré)
+# avec un cache propre au processus (LocMemCache, DummyCache).
+BOOKS_CACHE_WARMING = {
+    'AFTER_INDEXING': True,
+    'QUERIES': 100,
+    'BOOKS': 50,
+    'CONCURRENCY': 4,
+}
+
+# Tâches de fond (import, indexation, préchauffage, similarité) : `manage.py run_jobs`, API /api/jobs/.
+# Pendant les heures d'affluence, une tâche ne travaille que PEAK_DUTY_CYCLE du temps (voir books/jobs.py).
+BOOKS_JOBS = {
+    'WORKERS': 1,
+    'NICE': 10,
+    'IO_IDLE': True,
+    'VACUUM_COST_DELAY_MS': 10,
+    'PEAK_HOURS': (8, 23),
+    'PEAK_DUTY_CYCLE': 0.5,
+    'OFF_PEAK_DUTY_CYCLE': 1.0,
+    'MAX_THREADS': 4,
+}
+
 ROOT_URLCONF = 'mygutenberg.urls'
 
 TEMPLATES = [
@@ -96,9 +196,31 @@ DATABASES = {
         'PASSWORD': 'oliver',  # Mot de passe de l'utilisateur
         'HOST': 'localhost',  # L'adresse de la base de données
         'PORT': '5432',  # Le port par défaut pour PostgreSQL
+        'CONN_MAX_AGE': 600,  # Connexions persistantes (par thread), réutilisées d'une requête à l'autre
+        'CONN_HEALTH_CHECKS': True,  # Connexion persistante vérifiée avant réutilisation (redémarrage de PostgreSQL)
     }
 }
 
+# Réplica en lecture (optionnel) : BOOKS_REPLICA_HOST et/ou BOOKS_REPLICA_NAME. En local, une seconde
+# base suffit pour tester le routage (voir books/db_router.py).
+if os.environ.get('BOOKS_REPLICA_HOST') or os.environ.get('BOOKS_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ.get('BOOKS_REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.environ.get('BOOKS_REPLICA_PORT', DATABASES['default']['PORT']),
+        'NAME': os.environ.get('BOOKS_REPLICA_NAME', DATABASES['default']['NAME']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['books.db_router.ReadReplicaRouter']
+
+# Lectures de recherche et d'affichage sur le réplica, tant que son retard reste sous MAX_LAG_SECONDS
+BOOKS_READ_REPLICA = {
+    'ALIAS': 'replica',
+    'MAX_LAG_SECONDS': 10,
+    'CHECK_INTERVAL': 5,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -139,4 +261,19 @@ STATIC_URL = 'static/'
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Logging
+# https://docs.djangoproject.com/en/5.1/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'books': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
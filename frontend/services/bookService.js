@@ -93,4 +93,46 @@ export async function CombinedSearch(word,where,setProgress,id) {
       total_occurrences: 0
     };
   }
-}
\ No newline at end of file
+}
+
+export async function Autocomplete(prefix, limit = 8) {
+  try {
+    const response = await axios.get(`${API_BASE_URL}/search/autocomplete/${encodeURIComponent(prefix)}/?limit=${limit}`);
+    return response.data.completions; // Liste de { word, documents }
+  } catch (error) {
+    console.warn("Autocomplétion indisponible :", error);
+    return [];
+  }
+}
+
+// filters : { subject: [...], bookshelf: [...], language: [...], copyright: [...] }
+export async function FacetedSearch(query, filters = {}, page = 1, pageSize = 10) {
+  const params = new URLSearchParams({ page, page_size: pageSize });
+  if (query) params.append("q", query);
+  Object.entries(filters).forEach(([facet, values]) => {
+    values.forEach((value) => params.append(facet, value));
+  });
+
+  try {
+    const response = await axios.get(`${API_BASE_URL}/search/faceted/?${params.toString()}`);
+    return response.data; // { books, total_books, facets, page }
+  } catch (error) {
+    console.error("Erreur lors de la recherche à facettes :", error);
+    return { books: [], total_books: 0, facets: {}, page };
+  }
+}
+
+// Statistiques de plusieurs mots en une requête : { mot: { document_frequency, total_occurrences, books: { id: { occurrences, pages_with_word } } } }
+export async function TermStats(words, bookIds = [], pageSize = 300) {
+  try {
+    const response = await axios.post(`${API_BASE_URL}/search/term-stats/`, {
+      terms: words,
+      books: bookIds,
+      page_size: pageSize,
+    });
+    return response.data.terms;
+  } catch (error) {
+    console.error("Erreur lors de la récupération des statistiques des termes :", error);
+    return {};
+  }
+}